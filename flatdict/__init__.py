@@ -3,10 +3,30 @@ key/value pair mapping of nested dictionaries.
 
 """
 
+import array
+import bisect
+import codecs
 import collections.abc
+import concurrent.futures
+import contextlib
+import copy
+import fnmatch
+import functools
+import itertools
+import json
+import mmap
+import os
+import pickle
+import re
+import struct
+import threading
 import typing
+import weakref
 
+MISSING = object()
 NO_DEFAULT = object()
+KEY_TABLE_SIZE = 65536
+PATTERN_CACHE_SIZE = 1024
 
 
 class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
@@ -15,8 +35,28 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
     The default delimiter value is ``:`` but can be changed in the constructor
     or by calling :meth:`FlatDict.set_delimiter`.
 
+    Keys can also be given as a tuple of the key segments of the path, such
+    as ``('foo', 'bar')`` for ``'foo:bar'``, which are used as they are
+    without splitting or joining strings. See :meth:`FlatDict.iter_paths`.
+
+    Subclasses can set ``KEY_TABLE`` to a :class:`~flatdict.KeyTable` to
+    share the key strings of all of their instances through it.
+
     """
 
+    __slots__ = (
+        '__weakref__',
+        '_delimiter',
+        '_order',
+        '_parent',
+        '_shared',
+        '_size',
+        '_values',
+        '_view',
+    )
+
+    KEY_TABLE: typing.ClassVar['KeyTable | None'] = None
+    _ARRAYS: tuple[type, ...] = ()
     _COERCE: type | tuple[type, ...] = dict
 
     def __init__(
@@ -28,6 +68,11 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         super().__init__()
         self._values = dict_class()
         self._delimiter = delimiter
+        self._order: tuple[list[str], list[typing.Any]] | None = None
+        self._parent: FlatDict | None = None
+        self._shared = False
+        self._size = 0
+        self._view = False
         self.update(value)
 
     def __contains__(self, key: object) -> bool:
@@ -37,10 +82,14 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         :param mixed key: The key to check for
 
         """
-        if self._has_delimiter(key):
-            pk, ck = key.split(self._delimiter, 1)
-            return pk in self._values and ck in self._values[pk]
-        return key in self._values
+        if type(key) is not tuple and not self._has_delimiter(key):
+            return key in self._values
+        children = self._values
+        for part in self._parts(key):
+            if children is None or part not in children:
+                return False
+            children = self._branch(children[part])
+        return True
 
     def __delitem__(self, key: str) -> None:
         """Delete the item for the specified key, automatically dealing with
@@ -52,16 +101,25 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         """
         if key not in self:
             raise KeyError
-        if self._has_delimiter(key):
-            pk, ck = key.split(self._delimiter, 1)
-            del self._values[pk][ck]
-            if not self._values[pk]:
-                del self._values[pk]
+        if self._view:
+            self._delete_through(key)
         else:
-            del self._values[key]
+            self._own()
+            pk, ck = self._head(key)
+            if ck is None:
+                self._discard(pk)
+            else:
+                del self._values[pk][ck]
+                if not self._values[pk]:
+                    self._discard(pk)
+        if _JOURNALS:
+            self._record('delete', key)
 
     def __eq__(self, other: object) -> bool:
-        """Check for equality against the other value
+        """Check for equality against the other value. The nested values are
+        compared with those of other in place, returning as soon as a
+        difference is found, with the same result as comparing the
+        :meth:`as_dict` of each.
 
         :param other: The value to compare
         :type other: FlatDict
@@ -70,10 +128,13 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
 
         """
         if isinstance(other, dict):
-            return self.as_dict() == other
+            if self._view:
+                return self.as_dict() == other
         elif not isinstance(other, self.__class__):
             raise TypeError
-        return self.as_dict() == other.as_dict()
+        elif self._view or other._view:
+            return self.as_dict() == other.as_dict()
+        return self._equals(other)
 
     def __ne__(self, other: object) -> bool:
         """Check for inequality against the other value
@@ -94,38 +155,60 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         :raises: KeyError
 
         """
-        values = self._values
-        key = [key] if isinstance(key, int) else key.split(self._delimiter)
-        for part in key:
-            values = values[part]
-        return values
+        if self._view:
+            return self._get_through(key)
+        parts = self._parts(key)
+        shared, value = self._parent is not None, self
+        for part in parts:
+            if not isinstance(value, FlatDict):
+                raise KeyError(key)
+            shared = shared or value._shared
+            value = value._values[part]
+        if shared and isinstance(value, FlatDict):
+            # Nested flat dictionaries that may be shared with a copy are
+            # only handed out once every node on the path belongs to this
+            # instance
+            value = self._claim(parts)
+        return value
 
     def __iter__(self) -> collections.abc.Iterator[str]:
-        """Iterate over the flat dictionary key and values
+        """Iterate over the flat dictionary keys without building the full
+        key list first.
 
         :rtype: Iterator
         :raises: RuntimeError
 
         """
-        return iter(self.keys())
+        for key, _value in self._iter_items():
+            yield key
 
     def __len__(self) -> int:
-        """Return the number of items.
+        """Return the number of items. The leaf count is maintained as the
+        flat dictionary is modified, so this does not walk the children.
+        Views created with :meth:`FlatDict.view` count by walking, as the
+        wrapped value can be changed without the view knowing.
 
         :rtype: int
 
         """
-        return len(self.keys())
+        if self._view:
+            return sum(1 for _item in self._iter_items())
+        return self._size
 
-    def __reduce__(
-        self,
-    ) -> tuple[type, tuple[dict[str, typing.Any], str]]:
-        """Return state information for pickling
+    def __reduce__(self) -> tuple[typing.Callable, tuple[typing.Any, ...]]:
+        """Return state information for pickling. The nested values are
+        stored as a flat list of entries, one per value and nested flat
+        dictionary, so they can be restored without being coerced again and
+        with the type of every node and its dict class kept. Views, and
+        subclasses that override ``__init__``, are rebuilt through the
+        constructor instead.
 
         :rtype: tuple
 
         """
-        return type(self), (self.as_dict(), self._delimiter)
+        if self._view or _overrides_init(type(self)):
+            return type(self), (self.as_dict(), self._delimiter)
+        return _unpickle, (self._delimiter, *self._entries())
 
     def __repr__(self) -> str:
         """Return the string representation of the instance.
@@ -144,18 +227,12 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         :raises: TypeError
 
         """
-        if isinstance(value, self._COERCE) and not isinstance(value, FlatDict):
-            value = self.__class__(value, self._delimiter)
-        if self._has_delimiter(key):
-            pk, ck = key.split(self._delimiter, 1)
-            if pk not in self._values:
-                self._values[pk] = self.__class__({ck: value}, self._delimiter)
-                return
-            elif not isinstance(self._values[pk], FlatDict):
-                raise TypeError(f'Assignment to invalid type for key {pk}')
-            self._values[pk][ck] = value
+        if self._view:
+            self._set_through(key, value)
         else:
-            self._values[key] = value
+            self._assign(key, value)
+        if _JOURNALS:
+            self._record('set', key, value)
 
     def __str__(self) -> str:
         """Return the string value of the instance.
@@ -167,39 +244,250 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
             ', '.join([f'{k!r}: {self[k]!r}' for k in self.keys()])
         )
 
+    def apply_patch(self, patch: dict[str, dict[str, typing.Any]]) -> None:
+        """Apply the changes returned by :meth:`diff`, assigning the
+        ``changed`` and ``added`` items and then removing the ``removed``
+        items, so that branches still holding values are not pruned by the
+        removals. Any of the three may be left out.
+
+        :param dict patch: The changes to apply
+        :raises: KeyError
+        :raises: TypeError
+
+        """
+        self.update(
+            {key: new for key, (_old, new) in patch.get('changed', {}).items()}
+        )
+        self.update(patch.get('added'))
+        for key in patch.get('removed', ()):
+            self.__delitem__(key)
+
     def as_dict(self) -> dict[str, typing.Any]:
-        """Return the :class:`~flatdict.FlatDict` as a :class:`dict`
+        """Return the :class:`~flatdict.FlatDict` as a :class:`dict`. Nested
+        values are converted with an explicit stack, visiting each node once,
+        so arbitrarily deep nesting does not reach the recursion limit.
+        Children of a :class:`~flatdict.FlatterDict` that were created from a
+        :class:`list`, :class:`tuple` or :class:`set` are restored to their
+        original type.
 
         :rtype: dict
 
         """
         out: dict[str, typing.Any] = {}
-        for key in self.keys():
-            if self._has_delimiter(key):
-                pk, ck = key.split(self._delimiter, 1)
-                if self._has_delimiter(ck):
-                    ck = ck.split(self._delimiter, 1)[0]
-                if isinstance(self._values[pk], FlatDict) and pk not in out:
-                    out[pk] = {}
-                if isinstance(self._values[pk][ck], FlatDict):
-                    out[pk][ck] = self._values[pk][ck].as_dict()
+        stack: list[tuple[collections.abc.Iterable, typing.Any]] = [
+            (self._values.items(), out)
+        ]
+        sequences: list[tuple[typing.Any, typing.Any, type]] = []
+        while stack:
+            children, target = stack.pop()
+            for key, value in children:
+                branch = self._branch(value)
+                if branch is None:
+                    target[key] = value
+                    continue
+                original_type = getattr(value, 'original_type', type(value))
+                if original_type not in self._ARRAYS:
+                    target[key] = child = {}
+                    stack.append((branch.items(), child))
+                    continue
+                # The items of sequence nodes held in a list are placed by
+                # index, others are collected in a dict of the offsets
+                if type(branch) is _Sequence:
+                    target[key] = child = [None] * len(branch)
+                    stack.append((enumerate(branch._items), child))
                 else:
-                    out[pk][ck] = self._values[pk][ck]
-            else:
-                out[key] = self._values[key]
+                    target[key] = child = {}
+                    stack.append((branch.items(), child))
+                if type(child) is not original_type:
+                    sequences.append((target, key, original_type))
+        # Children are always recorded after their parents, so walking the
+        # sequences in reverse converts the innermost ones first
+        for target, key, original_type in reversed(sequences):
+            child = target[key]
+            target[key] = original_type(
+                child.values() if isinstance(child, dict) else child
+            )
         return out
 
     def clear(self) -> None:
         """Remove all items from the flat dictionary."""
-        self._values.clear()
+        if self._view:
+            self._values.clear()
+        else:
+            for value in self._values.values():
+                if isinstance(value, FlatDict) and value._parent is self:
+                    value._parent = None
+            self._own_parents()
+            if self._shared:
+                self._values = type(self._values)()
+                self._shared = False
+            else:
+                self._values.clear()
+            self._order = None
+            self._resize(-self._size)
+        if _JOURNALS:
+            self._record('clear', None)
+
+    def count_prefix(self, prefix: str) -> int:
+        """Return the number of items whose flat keys are prefix or start
+        with prefix and the delimiter. The leaf counts of the nested flat
+        dictionaries are kept current, so only the path to prefix is walked.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: int
+
+        """
+        if not prefix:
+            return len(self)
+        key, value = self._find(prefix)
+        if value is NO_DEFAULT:
+            return 0
+        elif isinstance(value, FlatDict) and not self._view:
+            return _leaves(value)
+        nested = self._branch(value)
+        if nested:
+            return sum(1 for _item in self._iter_items(nested, key))
+        return 1
 
     def copy(self) -> 'FlatDict':
-        """Return a shallow copy of the flat dictionary.
+        """Return a copy of the flat dictionary.
+
+        The copy is made in constant time by sharing the nested values with
+        the original. Each side copies a level of the nested values only when
+        it first writes to that level, or hands out a nested flat dictionary
+        from it, so changes never show through to the other side. This holds
+        for nested flat dictionaries looked up before the copy too, as
+        writing to one first copies the levels above it. Views, and
+        subclasses that override ``__init__``, are copied through the
+        constructor instead so that it still runs for the copy.
 
         :rtype: flatdict.FlatDict
 
         """
-        return self.__class__(self.as_dict(), delimiter=self._delimiter)
+        if self._view or _overrides_init(type(self)):
+            return self.__class__(self.as_dict(), delimiter=self._delimiter)
+        return self._fork(None)
+
+    def diff(self, other: 'FlatDict') -> dict[str, dict[str, typing.Any]]:
+        """Return the changes that turn this flat dictionary into other, as
+        a dict of the ``added`` and ``removed`` items and the ``changed``
+        items, each keyed by flat key. Changed items hold a tuple of the
+        value here and the value in other. The result can be passed to
+        :meth:`apply_patch`.
+
+        Each change is reported at the shortest flat key it covers, so a
+        branch that only exists on one side, or that replaces a value or a
+        branch of another type, is reported once with the nested flat
+        dictionary as its value rather than as each item within it.
+
+        Both are walked together, and nested flat dictionaries that are the
+        same object or share their values, as they do after :meth:`copy`
+        until either side changes them, are skipped without being visited.
+        Diffing a copy with a few changes costs about the size of the
+        changes rather than of the whole flat dictionary.
+
+        :param other: The flat dictionary to compare with
+        :type other: flatdict.FlatDict
+        :rtype: dict
+        :raises: TypeError
+
+        """
+        if not isinstance(other, FlatDict):
+            raise TypeError
+        patch: dict[str, dict[str, typing.Any]] = {
+            'added': {},
+            'removed': {},
+            'changed': {},
+        }
+        stack = [(None, self._values, other._values)]
+        while stack:
+            prefix, mine, theirs = stack.pop()
+            if mine is not theirs:
+                self._diff_level(other, prefix, mine, theirs, patch, stack)
+        return patch
+
+    def disable_journal(self) -> None:
+        """Stop recording changes to the flat dictionary in the journal
+        returned by :meth:`enable_journal`. Changes already recorded are
+        kept in the journal.
+
+        """
+        journal = _JOURNALS.pop(id(self), None)
+        if journal is not None:
+            journal._finalizer.detach()
+
+    def dump_index(self, path: str | os.PathLike[str]) -> None:
+        """Write the items of the flat dictionary to path as a read-only
+        index that :class:`~flatdict.MappedFlatDict` memory maps, with the
+        flat keys sorted and an offset table to search them by. Values are
+        pickled, so only indexes from trusted sources should be opened.
+
+        The index is written to a temporary file that then replaces path,
+        so processes that have the previous index mapped are unaffected.
+
+        :param path: The path of the index file
+        :type path: str or os.PathLike
+        :raises: TypeError
+
+        """
+        items = []
+        for key, value in self._iter_items():
+            if not isinstance(key, str):
+                raise TypeError(f'Only str keys can be indexed, not {key!r}')
+            items.append(
+                (
+                    key.encode('utf-8'),
+                    pickle.dumps(_leaf(value), pickle.HIGHEST_PROTOCOL),
+                )
+            )
+        items.sort(key=lambda item: item[0])
+        delimiter = self._delimiter.encode('utf-8')
+        header = _INDEX_HEADER.pack(
+            _INDEX_MAGIC,
+            len(items),
+            isinstance(self, FlatterDict),
+            len(delimiter),
+        )
+        start = len(header) + len(delimiter)
+        offset = start + _INDEX_ENTRY.size * (len(items) + 1)
+        keys = offset + sum(len(key) for key, _value in items)
+        table = bytearray()
+        for key, value in items:
+            table += _INDEX_ENTRY.pack(offset, keys)
+            offset, keys = offset + len(key), keys + len(value)
+        table += _INDEX_ENTRY.pack(offset, keys)
+        temporary = f'{os.fspath(path)}.{os.getpid()}.tmp'
+        try:
+            with open(temporary, 'wb') as handle:
+                handle.write(header + delimiter + table)
+                handle.writelines(key for key, _value in items)
+                handle.writelines(value for _key, value in items)
+            os.replace(temporary, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temporary)
+            raise
+
+    def enable_journal(self, coalesce: bool = False) -> 'ChangeJournal':
+        """Start recording the flat key changes made to the flat dictionary,
+        returning the :class:`~flatdict.ChangeJournal` they are recorded
+        in. If the journal is already enabled, it is returned unchanged.
+
+        Only changes made through this instance are recorded, so changes
+        made directly to a nested flat dictionary returned by a lookup are
+        not. Copies of the flat dictionary are not journaled.
+
+        :param bool coalesce: Keep only the latest change to each key
+        :rtype: flatdict.ChangeJournal
+
+        """
+        journal = _JOURNALS.get(id(self))
+        if journal is None:
+            journal = _JOURNALS[id(self)] = ChangeJournal(coalesce)
+            journal._finalizer = weakref.finalize(
+                self, _JOURNALS.pop, id(self), None
+            )
+        return journal
 
     def get(self, key: str, d: typing.Any = None) -> typing.Any:
         """Return the value for key if key is in the flat dictionary, else
@@ -216,19 +504,193 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         except KeyError:
             return d
 
-    def items(self) -> list[tuple[str, typing.Any]]:
-        """Return a copy of the flat dictionary's list of ``(key, value)``
-        pairs.
+    def items(self) -> collections.abc.ItemsView[str, typing.Any]:
+        """Return a live view of the flat dictionary's ``(key, value)``
+        pairs. The view walks the nested values lazily as it is iterated and
+        reflects later changes to the flat dictionary.
 
         .. note:: CPython implementation detail: Keys and values are listed in
             an arbitrary order which is non-random, varies across Python
             implementations, and depends on the flat dictionary's history of
             insertions and deletions.
 
-        :rtype: list
+        :rtype: collections.abc.ItemsView
 
         """
-        return [(k, self.__getitem__(k)) for k in self.keys()]
+        return _ItemsView(self)
+
+    def iter_paths(
+        self,
+    ) -> collections.abc.Iterator[tuple[tuple[typing.Any, ...], typing.Any]]:
+        """Iterate over the items with the path of each as a tuple of its
+        key segments, in the order of :meth:`items`, instead of its flat
+        key. No strings are joined and the key segments keep their types,
+        so the paths can be used as keys directly.
+
+        :rtype: Iterator
+
+        """
+        branch, claim = self._branch, not self._view
+        stack: list[tuple[tuple[typing.Any, ...], collections.abc.Iterator]]
+        stack = [((), iter(self._values.items()))]
+        while stack:
+            path, children = stack[-1]
+            for key, value in children:
+                nested = branch(value)
+                if nested:
+                    stack.append(((*path, key), iter(nested.items())))
+                    break
+                elif claim and nested is not None:
+                    value = self._claim((*path, key))
+                yield (*path, key), value
+            else:
+                stack.pop()
+
+    def iter_prefix(
+        self, prefix: str
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Iterate over the items whose flat keys are prefix or start with
+        prefix and the delimiter. The subtree is found by walking the path
+        to prefix, so the rest of the flat dictionary is never visited. A
+        trailing delimiter on prefix is ignored.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: Iterator
+
+        """
+        if not prefix:
+            yield from self._iter_items()
+            return
+        key, value = self._find(prefix)
+        if value is NO_DEFAULT:
+            return
+        path = None
+        if isinstance(value, FlatDict) and not self._view:
+            path = tuple(key.split(self._delimiter))
+        nested = self._branch(value)
+        if nested:
+            yield from self._iter_items(nested, key, path=path)
+        elif path is not None:
+            yield key, self._claim(path)
+        else:
+            yield key, value
+
+    def iter_match(
+        self, pattern: str
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Iterate over the items whose flat keys match pattern, in the same
+        order as :meth:`items`. The pattern is split on the delimiter into
+        segments, where ``*`` matches any one segment, ``**`` matches any
+        number of segments, and other segments match a single segment with
+        :mod:`fnmatch` rules, such as ``port*`` or ``[0-9]`` for the offsets
+        of a :class:`~flatdict.FlatterDict`.
+
+        The nested values are walked once, following every way the pattern
+        can still match, and branches that cannot match are never entered.
+        Where only literal segments can match next, they are looked up
+        directly. Compiled patterns are kept in a cache of the
+        :data:`PATTERN_CACHE_SIZE` most recently used.
+
+        :param str pattern: The pattern to match the flat keys against
+        :rtype: Iterator
+
+        """
+        compiled = _compile_pattern(pattern, self._delimiter)
+        branch, delimiter = self._branch, self._delimiter
+        stack: list[
+            tuple[
+                str | None,
+                collections.abc.Iterator,
+                frozenset[int],
+                tuple[typing.Any, ...],
+            ]
+        ] = [
+            (
+                None,
+                compiled.children(self._values, compiled.start),
+                compiled.start,
+                (),
+            )
+        ]
+        while stack:
+            prefix, children, states, path = stack[-1]
+            for name, value in children:
+                following = compiled.step(states, name)
+                if not following:
+                    continue
+                key = name
+                if prefix is not None:
+                    key = delimiter.join([prefix, str(name)])
+                nested = branch(value)
+                if not nested:
+                    if compiled.size in following:
+                        if nested is not None and not self._view:
+                            value = self._claim((*path, name))
+                        yield key, value
+                elif compiled.live(following):
+                    stack.append(
+                        (
+                            str(key),
+                            compiled.children(nested, following),
+                            following,
+                            (*path, name),
+                        )
+                    )
+                    break
+            else:
+                stack.pop()
+
+    def iter_range(
+        self, start: str | None = None, stop: str | None = None
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Iterate over the items whose flat keys are from start up to, but
+        not including, stop, in lexicographic order of the flat keys.
+        Either bound may be left out.
+
+        The sorted keys of each nested flat dictionary are kept as an index
+        once it has been scanned, and are only sorted again after keys are
+        added to or removed from it. Subtrees that fall outside the range
+        are skipped, so the cost is proportional to the depth of the bounds
+        and the number of items returned.
+
+        :param start: The first flat key to include
+        :type start: str or None
+        :param stop: The flat key to stop before
+        :type stop: str or None
+        :rtype: Iterator
+
+        """
+        stack: list[tuple[typing.Any, ...]] = [
+            (self._range(self, self._values, '', start), start, stop, ())
+        ]
+        while stack:
+            children, start, stop, path = stack[-1]
+            for full, name, value in children:
+                if stop is not None and full >= stop:
+                    return
+                nested = self._branch(value)
+                if not nested:
+                    if nested is not None and not self._view:
+                        value = self._claim((*path, name))
+                    yield full, value
+                    continue
+                # Bounds that do not fall within the subtree hold for all of
+                # it, so they are only carried down when they do
+                if start is not None and not start.startswith(full):
+                    start = None
+                if stop is not None and not stop.startswith(full):
+                    stop = None
+                stack.append(
+                    (
+                        self._range(value, nested, full, start),
+                        start,
+                        stop,
+                        (*path, name),
+                    )
+                )
+                break
+            else:
+                stack.pop()
 
     def iteritems(
         self,
@@ -274,26 +736,14 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         """
         yield from self.values()
 
-    def keys(self) -> list[str]:
-        """Return a copy of the flat dictionary's list of keys.
+    def keys(self) -> collections.abc.KeysView[str]:
+        """Return a live, set-like view of the flat dictionary's keys.
         See the note for :meth:`flatdict.FlatDict.items`.
 
-        :rtype: list
+        :rtype: collections.abc.KeysView
 
         """
-        keys = []
-
-        for key, value in self._values.items():
-            if isinstance(value, (FlatDict, dict)):
-                nested = [
-                    self._delimiter.join([str(key), str(k)])
-                    for k in value.keys()
-                ]
-                keys += nested or [key]
-            else:
-                keys.append(key)
-
-        return keys
+        return collections.abc.KeysView(self)
 
     def pop(self, key: str, default: typing.Any = NO_DEFAULT) -> typing.Any:
         """If key is in the flat dictionary, remove it and return its value,
@@ -311,6 +761,22 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         self.__delitem__(key)
         return value
 
+    def pop_prefix(self, prefix: str) -> dict[str, typing.Any]:
+        """Remove every item whose flat key is prefix or starts with prefix
+        and the delimiter, returning the removed items keyed by flat key.
+        The subtree is detached from its parent in a single step.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: dict
+
+        """
+        items = dict(self.iter_prefix(prefix))
+        if not prefix:
+            self.clear()
+        elif items:
+            self.__delitem__(self._find(prefix)[0])
+        return items
+
     def setdefault(self, key: str, default: typing.Any) -> typing.Any:
         """If key is in the flat dictionary, return its value. If not,
         insert key with a value of default and return default.
@@ -328,21 +794,29 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
     def set_delimiter(self, delimiter: str) -> None:
         """Override the default or passed in delimiter with a new value. If
         the requested delimiter already exists in a key, a :exc:`ValueError`
-        will be raised.
+        will be raised. The key segments are checked along the paths from
+        :meth:`iter_paths`, so no flat keys are joined to check them.
 
         :param str delimiter: The delimiter to use
         :raises: ValueError
 
         """
-        for key in self.keys():
-            if delimiter in key:
+        for path, _value in self.iter_paths():
+            if any(
+                isinstance(part, str) and delimiter in part for part in path
+            ):
+                key = self._delimiter.join(str(part) for part in path)
                 raise ValueError(
                     f'Key {key!r} collides with delimiter {delimiter!r}'
                 )
+        self._own()
         self._delimiter = delimiter
+        self._order = None
         for key in self._values.keys():
             if isinstance(self._values[key], FlatDict):
                 self._values[key].set_delimiter(delimiter)
+        if _JOURNALS:
+            self._record('delimiter', None, delimiter)
 
     def update(self, other: typing.Any = None, **kwargs: typing.Any) -> None:
         """Update the flat dictionary with the key/value pairs from other,
@@ -353,153 +827,3501 @@ class FlatDict(collections.abc.MutableMapping[str, typing.Any]):
         two). If keyword arguments are specified, the flat dictionary is then
         updated with those key/value pairs: ``d.update(red=1, blue=2)``.
 
+        Keys are assigned in a single pass. The nested flat dictionaries
+        along the path of each key are kept, so a following key that shares
+        the same prefix only resolves the part of its path that differs.
+
         :param iterable other: Iterable of key, value pairs
         :rtype: None
 
         """
-        [self.__setitem__(k, v) for k, v in dict(other or kwargs).items()]
+        for pairs in (other or (), kwargs):
+            if isinstance(pairs, collections.abc.Mapping):
+                pairs = pairs.items()
+            elif hasattr(pairs, 'keys'):
+                pairs = ((k, pairs[k]) for k in pairs.keys())
+            if self._view:
+                for key, value in pairs:
+                    self.__setitem__(key, value)
+            else:
+                self._assign_all(pairs)
 
-    def values(self) -> list[typing.Any]:
-        """Return a copy of the flat dictionary's list of values. See the note
-        for :meth:`flatdict.FlatDict.items`.
+    @classmethod
+    def view(
+        cls, value: dict[str, typing.Any], delimiter: str = ':'
+    ) -> 'FlatDict':
+        """Return a flat dictionary that reads and writes through to value
+        instead of copying it. Nested dicts are left in place and are only
+        wrapped, as views themselves, when they are returned by a lookup.
+        Assigned values are stored as-is, with flat dictionaries stored as
+        plain nested dicts.
 
-        :rtype: list
+        :param dict value: The nested dict to wrap
+        :param str delimiter: The delimiter to use
+        :rtype: flatdict.FlatDict
 
         """
-        return [self.__getitem__(k) for k in self.keys()]
+        instance = cls.__new__(cls)
+        instance._values = value
+        instance._delimiter = delimiter
+        instance._order = None
+        instance._parent = None
+        instance._shared = False
+        instance._size = 0
+        instance._view = True
+        return instance
 
-    def _has_delimiter(self, key: object) -> bool:
-        """Checks to see if the key contains the delimiter.
+    def values(self) -> collections.abc.ValuesView[typing.Any]:
+        """Return a live view of the flat dictionary's values. See the note
+        for :meth:`flatdict.FlatDict.items`.
 
-        :rtype: bool
+        :rtype: collections.abc.ValuesView
 
         """
-        return isinstance(key, str) and self._delimiter in key
-
-
-class FlatterDict(FlatDict):
-    """Like :class:`~flatdict.FlatDict` but also coerces lists and sets
-    to child-dict instances with the offset as the key. Alternative to
-    the implementation added in v1.2 of FlatDict.
-
-    """
-
-    _COERCE: type | tuple[type, ...] = (list, tuple, set, dict, FlatDict)
-    _ARRAYS: tuple[type, ...] = (list, set, tuple)
-
-    def __init__(
-        self,
-        value: (
-            dict[str, typing.Any]
-            | list[typing.Any]
-            | tuple[typing.Any, ...]
-            | set[typing.Any]
-            | None
-        ) = None,
-        delimiter: str = ':',
-        dict_class: type[dict[str, typing.Any]] = dict,
-    ) -> None:
-        self.original_type: type = type(value)
-        if self.original_type in self._ARRAYS:
-            value = {str(i): v for i, v in enumerate(value)}
-        super().__init__(value, delimiter, dict_class)
+        return _ValuesView(self)
 
-    def __setitem__(self, key: str, value: typing.Any) -> None:
-        """Assign the value to the key, dynamically building nested
-        FlatDict items where appropriate.
+    def _assign(self, key: str, value: typing.Any) -> None:
+        """Assign the value to the key of a flat dictionary that is not a
+        view, dynamically building nested FlatDict items where appropriate.
 
         :param mixed key: The key for the item
         :param mixed value: The value for the item
+        :raises: KeyError
         :raises: TypeError
+        :raises: ValueError
 
         """
-        if isinstance(value, self._COERCE) and not isinstance(
-            value, FlatterDict
-        ):
-            value = self.__class__(value, self._delimiter)
+        if type(key) is tuple:
+            self._assign_path(key, value)
+            return
+        self._own()
+        value = self._coerce(value)
         if self._has_delimiter(key):
             pk, ck = key.split(self._delimiter, 1)
             if pk not in self._values:
-                self._values[pk] = self.__class__({ck: value}, self._delimiter)
-                return
-            if (
-                getattr(self._values[pk], 'original_type', None)
-                in self._ARRAYS
-            ):
-                try:
-                    k, cck = ck.split(self._delimiter, 1)
-                    int(k)
-                except ValueError as error:
-                    raise TypeError(
-                        f'Assignment to invalid type for key '
-                        f'{pk}{self._delimiter}{ck}'
-                    ) from error
-                self._values[pk][k][cck] = value
+                self._store(pk, self._child({ck: value}))
                 return
-            elif not isinstance(self._values[pk], FlatterDict):
+            elif not isinstance(self._values[pk], FlatDict):
                 raise TypeError(f'Assignment to invalid type for key {pk}')
             self._values[pk][ck] = value
         else:
-            self._values[key] = value
+            self._store(key, value)
 
-    def as_dict(self) -> dict[str, typing.Any]:
-        """Return the :class:`~flatdict.FlatterDict` as a nested
-        :class:`dict`.
+    def _assign_all(
+        self, pairs: collections.abc.Iterable[tuple[typing.Any, typing.Any]]
+    ) -> None:
+        """Assign each of the key/value pairs, splitting each key once and
+        reusing the nested flat dictionaries resolved for the previous key
+        wherever the two keys share a prefix.
 
-        :rtype: dict
+        :param iterable pairs: The key/value pairs to assign
+        :raises: KeyError
+        :raises: TypeError
+        :raises: ValueError
 
         """
-        out: dict[str, typing.Any] = {}
-        for key in self.keys():
-            if self._has_delimiter(key):
-                pk, ck = key.split(self._delimiter, 1)
-                if self._has_delimiter(ck):
-                    ck = ck.split(self._delimiter, 1)[0]
-                if isinstance(self._values[pk], FlatterDict) and pk not in out:
-                    if self._values[pk].original_type is tuple:
-                        out[pk] = tuple(self._child_as_list(pk))
-                    elif self._values[pk].original_type is list:
-                        out[pk] = self._child_as_list(pk)
-                    elif self._values[pk].original_type is set:
-                        out[pk] = set(self._child_as_list(pk))
-                    elif self._values[pk].original_type is dict:
-                        out[pk] = self._values[pk].as_dict()
+        self._own()
+        delimiter = self._delimiter
+        path: list[typing.Any] = []
+        nodes: list[FlatDict] = [self]
+        for key, value in pairs:
+            if type(key) is tuple:
+                parts = self._check_path(key)
+            elif not self._has_delimiter(key):
+                self.__setitem__(key, value)
+                del path[:], nodes[1:]
+                continue
             else:
-                if isinstance(self._values[key], FlatterDict):
-                    out[key] = self._values[key].original_type()
+                parts = key.split(delimiter)
+            depth, limit = 0, min(len(path), len(parts) - 1)
+            while depth < limit and path[depth] == parts[depth]:
+                depth += 1
+            del path[depth:], nodes[depth + 1 :]
+            node = nodes[-1]
+            for part in parts[depth:-1]:
+                node = node._descend(part, key)
+                path.append(part)
+                nodes.append(node)
+            node._check_offset(parts[-1], key)
+            node._store(parts[-1], node._coerce(value))
+            if _JOURNALS:
+                self._record('set', key, value)
+
+    def _assign_path(
+        self, key: tuple[typing.Any, ...], value: typing.Any
+    ) -> None:
+        """Assign the value to the tuple path key, walking its key segments
+        without splitting or joining strings.
+
+        :param tuple key: The key segments of the path
+        :param mixed value: The value for the item
+        :raises: KeyError
+        :raises: TypeError
+        :raises: ValueError
+
+        """
+        parts, node = self._check_path(key), self
+        for part in parts[:-1]:
+            node = node._descend(part, key)
+        node._check_offset(parts[-1], key)
+        node._store(parts[-1], node._coerce(value))
+
+    def _branch(self, value: typing.Any) -> typing.Any:
+        """Return the mapping of children for value if it is a nested
+        branch, otherwise ``None``. Views also treat plain dicts as branches.
+
+        :param mixed value: The value to check
+        :rtype: collections.abc.Mapping or None
+
+        """
+        if isinstance(value, FlatDict):
+            return value._values
+        if self._view and isinstance(value, dict):
+            return value
+        return None
+
+    def _check_path(
+        self, key: tuple[typing.Any, ...]
+    ) -> tuple[typing.Any, ...]:
+        """Return the tuple path key to assign to, raising :exc:`KeyError`
+        if it is empty and :exc:`ValueError` if one of its key segments
+        contains the delimiter, as its flat key would not split back into
+        the same segments.
+
+        :param tuple key: The key segments of the path
+        :rtype: tuple
+        :raises: KeyError
+        :raises: ValueError
+
+        """
+        if not key:
+            raise KeyError(key)
+        delimiter = self._delimiter
+        for part in key:
+            if isinstance(part, str) and delimiter in part:
+                raise ValueError(
+                    f'Key segment {part!r} collides with delimiter '
+                    f'{delimiter!r}'
+                )
+        return key
+
+    def _check_offset(self, part: str, key: str) -> None:
+        """Raise :exc:`TypeError` if this node was created from a sequence
+        and part is not an offset into it.
+
+        :param str part: The key segment within this node
+        :param str key: The full key being assigned
+        :raises: TypeError
+
+        """
+        if getattr(self, 'original_type', None) in self._ARRAYS:
+            try:
+                int(part)
+            except ValueError as error:
+                raise TypeError(
+                    f'Assignment to invalid type for key {key}'
+                ) from error
+
+    def _child(self, value: dict[str, typing.Any] | None) -> 'FlatDict':
+        """Return a new nested flat dictionary holding value.
+
+        :param value: The nested values
+        :type value: dict or None
+        :rtype: flatdict.FlatDict
+
+        """
+        return self.__class__(value, self._delimiter)
+
+    def _coerce(self, value: typing.Any) -> typing.Any:
+        """Return value wrapped in a nested flat dictionary if it is of a
+        type that is flattened, otherwise return it unchanged. Views and
+        frozen flat dictionaries are copied so that their values are
+        counted, flattened and can be changed.
+
+        :param mixed value: The value being assigned
+        :rtype: mixed
+
+        """
+        if isinstance(value, FlatDict) and (
+            value._view or isinstance(value, _Frozen)
+        ):
+            value = _materialize(value, value._ARRAYS)
+        if isinstance(value, self._COERCE) and not isinstance(value, FlatDict):
+            return self._child(value)
+        return value
+
+    def _delete_through(self, key: str) -> None:
+        """Delete the key from the wrapped value of a view, removing any
+        nested values left empty by the deletion.
+
+        :param str key: The key to delete
+        :raises: KeyError
+
+        """
+        parts = self._parts(key)
+        path, children = [], self._values
+        for part in parts[:-1]:
+            path.append((children, part))
+            children = self._branch(children[part])
+        del children[parts[-1]]
+        while path and not children:
+            children, part = path.pop()
+            del children[part]
+
+    def _descend(self, part: str, key: str) -> 'FlatDict':
+        """Return the nested flat dictionary stored at part while assigning
+        key, creating it when it does not exist.
+
+        :param str part: The key segment within this node
+        :param str key: The full key being assigned
+        :rtype: flatdict.FlatDict
+        :raises: KeyError
+        :raises: TypeError
+
+        """
+        self._check_offset(part, key)
+        self._own()
+        child = self._values.get(part, NO_DEFAULT)
+        if child is NO_DEFAULT:
+            if getattr(self, 'original_type', None) in self._ARRAYS:
+                raise KeyError(key)
+            child = self._child(None)
+            self._store(part, child)
+        elif not isinstance(child, FlatDict):
+            raise TypeError(f'Assignment to invalid type for key {part}')
+        return child
+
+    def _diff_level(
+        self,
+        other: 'FlatDict',
+        prefix: str | None,
+        mine: collections.abc.Mapping[typing.Any, typing.Any],
+        theirs: collections.abc.Mapping[typing.Any, typing.Any],
+        patch: dict[str, dict[str, typing.Any]],
+        stack: list[tuple[typing.Any, ...]],
+    ) -> None:
+        """Compare one level of nested values for :meth:`diff`, adding the
+        differences to patch and the branches of the same type on both
+        sides to the stack.
+
+        :param flatdict.FlatDict other: The flat dictionary compared with
+        :param prefix: The flat key of the level
+        :type prefix: str or None
+        :param mine: The values of this level here
+        :type mine: collections.abc.Mapping
+        :param theirs: The values of this level in other
+        :type theirs: collections.abc.Mapping
+        :param dict patch: The differences found so far
+        :param list stack: The pairs of branches left to compare
+
+        """
+        delimiter = self._delimiter
+        for key, value in mine.items():
+            flat = (
+                key if prefix is None else delimiter.join([prefix, str(key)])
+            )
+            match = theirs.get(key, NO_DEFAULT)
+            if match is value:
+                continue
+            elif match is NO_DEFAULT:
+                patch['removed'][flat] = value
+                continue
+            nested, matched = self._branch(value), other._branch(match)
+            if (
+                nested
+                and matched
+                and _shape(value, self._ARRAYS) is _shape(match, other._ARRAYS)
+            ):
+                stack.append((flat, nested, matched))
+            elif nested or matched or _leaf(value) != _leaf(match):
+                patch['changed'][flat] = (value, match)
+        for key, match in theirs.items():
+            if key not in mine:
+                flat = (
+                    key
+                    if prefix is None
+                    else delimiter.join([prefix, str(key)])
+                )
+                patch['added'][flat] = match
+
+    def _discard(self, key: typing.Any) -> None:
+        """Remove key from this level of the flat dictionary, keeping the
+        leaf counts of this instance and its parents current.
+
+        :param mixed key: The key to remove
+
+        """
+        self._own()
+        value = self._values.pop(key)
+        if isinstance(value, FlatDict):
+            value._parent = None
+        self._order = None
+        self._resize(-_leaves(value))
+
+    def _node_type(self) -> tuple[typing.Any, ...]:
+        """Return the class, dict class and original type of this instance,
+        as passed to :meth:`_restored` when unpickling.
+
+        :rtype: tuple
+
+        """
+        return type(self), type(self._values), None
+
+    def _own(self) -> None:
+        """Give this instance its own copy of shared nested values before
+        they are changed or handed out. Nested flat dictionaries belonging to
+        this instance stay with it and are replaced by forks in the values
+        left to the other sharers, while those belonging to another instance
+        are forked for this one, so every child has a single parent.
+
+        """
+        self._own_parents()
+        if not self._shared:
+            return
+        shared, values = self._values, copy.copy(self._values)
+        for key, value in values.items():
+            if isinstance(value, FlatDict):
+                if value._parent is self:
+                    shared[key] = value._fork(None)
                 else:
-                    out[key] = self._values[key]
-        return out
+                    values[key] = value._fork(self)
+        self._values = values
+        self._shared = False
 
-    def _child_as_list(
-        self, pk: str, ck: str | None = None
-    ) -> list[typing.Any]:
-        """Returns a list of values from the child FlatterDict instance
-        with string based integer keys.
+    def _own_parents(self) -> None:
+        """Give the parents of this instance their own copies of shared
+        nested values, from the root down, when any of them shares its
+        values with a copy. This instance is then only reachable from the
+        root it belongs to, and is itself marked as shared if the values it
+        holds are still reachable from the copy.
 
-        :param str pk: The parent key
-        :param str ck: The child key, optional
-        :rtype: list
+        """
+        parent = self._parent
+        while parent is not None:
+            if parent._shared:
+                typing.cast(FlatDict, self._parent)._own()
+                return
+            parent = parent._parent
+
+    def _range(
+        self,
+        node: typing.Any,
+        values: collections.abc.Mapping[typing.Any, typing.Any],
+        prefix: str,
+        start: str | None,
+    ) -> collections.abc.Iterator[tuple[str, typing.Any, typing.Any]]:
+        """Return the nested values of node for :meth:`iter_range` in
+        order, each with its flat key, or for branches the flat key and the
+        delimiter that all of their keys start with, and its key in node.
+        Values ordered before start are skipped by bisecting the sorted
+        keys.
+
+        :param mixed node: The nested flat dictionary or view value
+        :param values: The nested values of node
+        :type values: collections.abc.Mapping
+        :param str prefix: The flat key and delimiter of node
+        :param start: The first flat key to include
+        :type start: str or None
+        :rtype: Iterator
 
         """
-        if ck is None:
-            subset = self._values[pk]
-        else:
-            subset = self._values[pk][ck]
-        # Check if keys has delimiter, which implies deeply nested dict
-        keys = subset.keys()
-        if any(self._has_delimiter(k) for k in keys):
-            out = []
-            split_keys = {k.split(self._delimiter)[0] for k in keys}
-            for k in sorted(split_keys, key=lambda x: int(x)):
-                if subset[k].original_type is tuple:
-                    out.append(tuple(self._child_as_list(pk, k)))
-                elif subset[k].original_type is list:
-                    out.append(self._child_as_list(pk, k))
-                elif subset[k].original_type is set:
-                    out.append(set(self._child_as_list(pk, k)))
-                elif subset[k].original_type is dict:
-                    out.append(subset[k].as_dict())
-            return out
-
-        return [subset[k] for k in keys]
+        ordered, keys = self._sorted_keys(node, values)
+        offset = 0
+        if start is not None:
+            relative = start[len(prefix) :]
+            offset = bisect.bisect_left(ordered, relative)
+            # A branch ordered before start still holds it when its flat
+            # key and delimiter are the start of it
+            if (
+                offset
+                and ordered[offset - 1] != str(keys[offset - 1])
+                and relative.startswith(ordered[offset - 1])
+            ):
+                offset -= 1
+        return (
+            (prefix + ordered[index], keys[index], values[keys[index]])
+            for index in range(offset, len(keys))
+        )
+
+    def _record(
+        self, op: str, key: str | None, value: typing.Any = None
+    ) -> None:
+        """Record the change in the journal of the flat dictionary, if it
+        has one.
+
+        :param str op: The kind of change
+        :param key: The flat key that was changed
+        :param mixed value: The value that was assigned
+
+        """
+        journal = _JOURNALS.get(id(self))
+        if journal is not None:
+            path = None
+            if journal._coalesce and key is not None:
+                path = tuple(self._parts(key))
+            journal._append(op, key, _detached(value), path)
+
+    def _resize(self, delta: int) -> None:
+        """Adjust the leaf count by delta, propagating the change in weight
+        up through the parents.
+
+        :param int delta: The change in the number of leaves
+
+        """
+        node: FlatDict | None = self
+        while delta and node is not None:
+            before = node._size
+            node._size += delta
+            # An empty node still occupies a single key in its parent, where
+            # it is ordered as a value rather than a branch
+            if before < 1 or node._size < 1:
+                delta = max(node._size, 1) - max(before, 1)
+                if node._parent is not None:
+                    node._parent._order = None
+            node = node._parent
+
+    @classmethod
+    def _restored(
+        cls,
+        delimiter: str,
+        dict_class: type[dict[str, typing.Any]],
+        original_type: type | None,
+    ) -> 'FlatDict':
+        """Return an empty instance to be filled in directly when unpickling.
+
+        :param str delimiter: The delimiter to use
+        :param type dict_class: The class to hold the values in
+        :param original_type: Unused, see :meth:`FlatterDict._restored`
+        :rtype: flatdict.FlatDict
+
+        """
+        instance = cls.__new__(cls)
+        instance._values = dict_class()
+        instance._delimiter = delimiter
+        instance._order = None
+        instance._parent = None
+        instance._shared = False
+        instance._size = 0
+        instance._view = False
+        return instance
+
+    def _sorted_keys(
+        self,
+        node: typing.Any,
+        values: collections.abc.Mapping[typing.Any, typing.Any],
+    ) -> tuple[list[str], list[typing.Any]]:
+        """Return the keys of node sorted in the order of their flat keys,
+        along with the string each is ordered by. Branches are ordered by
+        their key and the delimiter, as every flat key within them starts
+        with it. The result is kept on nested flat dictionaries until their
+        keys change.
+
+        :param mixed node: The nested flat dictionary or view value
+        :param values: The nested values of node
+        :type values: collections.abc.Mapping
+        :rtype: tuple
+
+        """
+        cache = isinstance(node, FlatDict) and not node._view
+        if cache and node._order is not None:
+            return node._order
+        branch, delimiter = self._branch, self._delimiter
+        ordered = sorted(
+            (f'{key}{delimiter}' if branch(value) else str(key), key)
+            for key, value in values.items()
+        )
+        order = [item[0] for item in ordered], [item[1] for item in ordered]
+        if cache:
+            node._order = order
+        return order
+
+    def _store(self, key: typing.Any, value: typing.Any) -> None:
+        """Assign value to key at this level of the flat dictionary, keeping
+        the leaf counts of this instance and its parents current. A nested
+        flat dictionary that already belongs to another parent is copied so
+        that each child has a single parent to report changes to.
+
+        :param mixed key: The key for the item
+        :param mixed value: The value for the item
+
+        """
+        self._own()
+        previous = self._values.get(key, NO_DEFAULT)
+        if previous is value:
+            return
+        elif previous is NO_DEFAULT and self.KEY_TABLE is not None:
+            key = self.KEY_TABLE.intern(key)
+        if isinstance(value, FlatDict):
+            if value._parent is not None:
+                value = value.copy()
+            value._parent = self
+            self._order = None
+        elif previous is NO_DEFAULT or isinstance(previous, FlatDict):
+            self._order = None
+        self._values[key] = value
+        delta = _leaves(value)
+        if previous is not NO_DEFAULT:
+            if isinstance(previous, FlatDict):
+                previous._parent = None
+            delta -= _leaves(previous)
+        self._resize(delta)
+
+    def _iter_items(
+        self,
+        values: collections.abc.Mapping[typing.Any, typing.Any] | None = None,
+        prefix: str | None = None,
+        branch: typing.Callable[[typing.Any], typing.Any] | None = None,
+        path: tuple[typing.Any, ...] | None = None,
+    ) -> collections.abc.Iterator[tuple[typing.Any, typing.Any]]:
+        """Walk the nested values depth-first, yielding each flat key with
+        its value. The delimited prefix of each level is built once and
+        carried down the walk, so keys are never split or looked up again.
+        Empty branches of the values of this instance are claimed with
+        :meth:`_claim` before they are handed out.
+
+        :param values: The nested values to walk, defaulting to all of them
+        :type values: collections.abc.Mapping or None
+        :param prefix: The flat key of the nested values
+        :type prefix: str or None
+        :param branch: The function that finds branches, defaulting to
+            :meth:`_branch`, for walking the values of another instance
+        :type branch: callable or None
+        :param path: The key segments of the path to values when they are
+            nested values of this instance, defaulting to ``()`` when values
+            is not given
+        :type path: tuple or None
+        :rtype: Iterator
+
+        """
+        branch, delimiter = branch or self._branch, self._delimiter
+        if values is None:
+            values, path = self._values, None if self._view else ()
+        table = self.KEY_TABLE
+        prefixes = None if table is None else table._prefixes(delimiter)
+        stack: list[tuple[typing.Any, ...]] = [
+            (
+                prefix,
+                iter(values.items()),
+                None
+                if prefixes is None or prefix is None
+                else prefixes[prefix],
+                path,
+            )
+        ]
+        while stack:
+            prefix, children, joins, parts = stack[-1]
+            for name, value in children:
+                if joins is not None:
+                    key = joins[name]
+                elif prefix is not None:
+                    key = delimiter.join([prefix, str(name)])
+                else:
+                    key = name
+                nested = branch(value)
+                if nested:
+                    key = str(key)
+                    stack.append(
+                        (
+                            key,
+                            iter(nested.items()),
+                            None if prefixes is None else prefixes[key],
+                            None if parts is None else (*parts, name),
+                        )
+                    )
+                    break
+                elif parts is not None and nested is not None:
+                    value = self._claim((*parts, name))
+                yield key, value
+            else:
+                stack.pop()
+
+    def _get_through(self, key: str | int) -> typing.Any:
+        """Get an item from the wrapped value of a view, wrapping nested
+        branches in a view of their own.
+
+        :param mixed key: The key to use
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        parts = self._parts(key)
+        value, children = None, self._values
+        for part in parts:
+            if children is None:
+                raise KeyError(key)
+            value = children[part]
+            children = self._branch(value)
+        if children is not None and not isinstance(value, FlatDict):
+            return self.view(value, self._delimiter)
+        return value
+
+    def _set_through(self, key: str, value: typing.Any) -> None:
+        """Assign the value to the key in the wrapped value of a view,
+        creating nested dicts where appropriate.
+
+        :param str key: The key for the item
+        :param mixed value: The value for the item
+        :raises: TypeError
+
+        """
+        if isinstance(value, FlatDict):
+            value = value.as_dict()
+        if type(key) is tuple:
+            self._check_path(key)
+        parts = self._parts(key)
+        children = self._values
+        for part in parts[:-1]:
+            if part not in children:
+                children[part] = {}
+            branch = self._branch(children[part])
+            if branch is None:
+                raise TypeError(f'Assignment to invalid type for key {part}')
+            children = branch
+        children[parts[-1]] = value
+
+    def _entries(self) -> tuple[list[tuple[typing.Any, ...]], list]:
+        """Return the node types and the nested values in depth-first order
+        for pickling. The node types are the distinct results of
+        :meth:`_node_type`, starting with this instance. The values are a
+        flat list holding ``depth, key, value`` for each value and
+        ``-depth, key, offset`` for each nested flat dictionary, where offset
+        is the position of its node type, followed by its own values.
+
+        :rtype: tuple
+
+        """
+        offsets = {self._node_type(): 0}
+        entries: list[typing.Any] = []
+        extend = entries.extend
+        stack = [(1, iter(self._values.items()))]
+        while stack:
+            depth, children = stack[-1]
+            for key, value in children:
+                if isinstance(value, FlatDict):
+                    offset = offsets.setdefault(
+                        value._node_type(), len(offsets)
+                    )
+                    extend((-depth, key, offset))
+                    stack.append((depth + 1, iter(value._values.items())))
+                    break
+                extend((depth, key, value))
+            else:
+                stack.pop()
+        return list(offsets), entries
+
+    def _equals(self, other: 'dict[str, typing.Any] | FlatDict') -> bool:
+        """Walk the nested values of this instance and other in parallel,
+        stopping at the first difference in length, key or value. Nested
+        flat dictionaries are compared node to node, or directly against the
+        nested dicts and sequences of a plain dict. Sets, and nodes that do
+        not match the type of the value they are compared with, are
+        converted and compared as :meth:`as_dict` would return them.
+
+        :param other: The value to compare
+        :type other: dict or FlatDict
+        :rtype: bool
+
+        """
+        arrays = self._ARRAYS
+        other_arrays = other._ARRAYS if isinstance(other, FlatDict) else ()
+        stack: list[tuple[FlatDict, type, typing.Any, type | None]] = [
+            (self, dict, other, _kind(other, ()))
+        ]
+        while stack:
+            node, kind, value, value_kind = stack.pop()
+            theirs = _walkable(kind, value, value_kind)
+            if theirs is None:
+                if value_kind is not None:
+                    value = _materialize(value, other_arrays)
+                if _materialize(node, arrays) != value:
+                    return False
+            elif theirs is not node._values and not self._equal_level(
+                node._values, kind, theirs, other_arrays, stack
+            ):
+                return False
+        return True
+
+    def _equal_level(
+        self,
+        mine: dict[str, typing.Any],
+        kind: type,
+        theirs: typing.Any,
+        other_arrays: tuple[type, ...],
+        stack: list[tuple['FlatDict', type, typing.Any, type | None]],
+    ) -> bool:
+        """Compare one level of nested values for :meth:`_equals`, adding
+        pairs of nested flat dictionaries and values to the stack to be
+        compared in turn.
+
+        :param dict mine: The values of the node being compared
+        :param type kind: The type the node is compared as
+        :param mixed theirs: The values being compared against
+        :param tuple other_arrays: The sequence types restored by other
+        :param list stack: The pairs left to compare
+        :rtype: bool
+
+        """
+        if len(mine) != len(theirs):
+            return False
+        for child, match in _pairs(mine, kind, theirs):
+            if match is NO_DEFAULT:
+                return False
+            elif child is match:
+                continue
+            elif isinstance(child, FlatDict):
+                stack.append(
+                    (
+                        child,
+                        _kind(child, self._ARRAYS),
+                        match,
+                        _kind(match, other_arrays),
+                    )
+                )
+            elif isinstance(match, FlatDict):
+                if child != _materialize(match, other_arrays):
+                    return False
+            elif child != match:
+                return False
+        return True
+
+    def _find(self, prefix: str) -> tuple[str, typing.Any]:
+        """Return prefix without a trailing delimiter, and the value at it
+        or :data:`NO_DEFAULT` if there is none.
+
+        :param str prefix: The flat key to find
+        :rtype: tuple
+
+        """
+        prefix = prefix.removesuffix(self._delimiter)
+        value: typing.Any = NO_DEFAULT
+        children = self._values
+        for part in prefix.split(self._delimiter):
+            if children is None or part not in children:
+                return prefix, NO_DEFAULT
+            value = children[part]
+            children = self._branch(value)
+        return prefix, value
+
+    def _claim(
+        self, parts: collections.abc.Iterable[typing.Any]
+    ) -> typing.Any:
+        """Return the value at the key segments of parts after giving every
+        nested flat dictionary on the path its own copy of shared values, so
+        that a nested flat dictionary handed out belongs to this instance
+        and changing it never shows through to a copy.
+
+        :param iterable parts: The key segments of the path to the value
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        value = self
+        for part in parts:
+            value._own()
+            value = value._values[part]
+        return value
+
+    def _fork(self, parent: 'FlatDict | None') -> 'FlatDict':
+        """Return a new instance that shares the nested values of this one,
+        marking both as shared so that each copies the values before
+        changing them.
+
+        :param parent: The parent of the new instance
+        :type parent: flatdict.FlatDict or None
+        :rtype: flatdict.FlatDict
+
+        """
+        fork = self.__class__.__new__(self.__class__)
+        fork._delimiter = self._delimiter
+        fork._order = self._order
+        fork._parent = parent
+        fork._shared = self._shared = True
+        fork._size = self._size
+        fork._values = self._values
+        fork._view = False
+        return fork
+
+    def _has_delimiter(self, key: object) -> bool:
+        """Checks to see if the key contains the delimiter.
+
+        :rtype: bool
+
+        """
+        return isinstance(key, str) and self._delimiter in key
+
+    def _head(self, key: typing.Any) -> tuple[typing.Any, typing.Any]:
+        """Return the first key segment of key and the key of the rest of
+        its path, or ``None`` for the rest if it has a single segment.
+
+        :param mixed key: The key to split
+        :rtype: tuple
+
+        """
+        if type(key) is tuple:
+            return key[0], key[1:] if len(key) > 1 else None
+        elif self._has_delimiter(key):
+            pk, ck = key.split(self._delimiter, 1)
+            return pk, ck
+        return key, None
+
+    def _lookup(self, key: str | int) -> typing.Any:
+        """Return the value for key by walking the nested values, without
+        changing or copying anything along the way.
+
+        :param mixed key: The key to use
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        if type(key) is not tuple and not self._has_delimiter(key):
+            return self._values[key]
+        parts = self._parts(key)
+        value = self._values[parts[0]]
+        for part in parts[1:]:
+            if not isinstance(value, FlatDict):
+                raise KeyError(key)
+            value = value._values[part]
+        return value
+
+    def _parts(self, key: typing.Any) -> collections.abc.Sequence[typing.Any]:
+        """Return the key segments of the path of key: the items of a tuple
+        path, the parts of a key that contains the delimiter, or the key
+        itself. An empty tuple path is its own only segment, so it is never
+        found.
+
+        :param mixed key: The key to split
+        :rtype: collections.abc.Sequence
+
+        """
+        if type(key) is tuple:
+            return key or (key,)
+        elif self._has_delimiter(key):
+            return key.split(self._delimiter)
+        return (key,)
+
+
+class _ItemsView(collections.abc.ItemsView):
+    """Items view that produces pairs from a single walk of the nested
+    values rather than looking up each flat key.
+
+    """
+
+    __slots__ = ()
+
+    _mapping: FlatDict
+
+    def __iter__(self) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        return self._mapping._iter_items()
+
+
+class _ValuesView(collections.abc.ValuesView):
+    """Values view that produces values from a single walk of the nested
+    values rather than looking up each flat key.
+
+    """
+
+    __slots__ = ()
+
+    _mapping: FlatDict
+
+    def __iter__(self) -> collections.abc.Iterator[typing.Any]:
+        for _key, value in self._mapping._iter_items():
+            yield value
+
+
+class _Sequence(collections.abc.MutableMapping[str, typing.Any]):
+    """Holds the values of a :class:`~flatdict.FlatterDict` node created from
+    a list, tuple or set in a list, presenting them as a mapping keyed by the
+    string offset of each item, as a dict of the offsets would. Offsets are
+    looked up by index and items are appended in place, without keeping a
+    key for each item.
+
+    Only the keys of the items and the offset after the last one can be
+    assigned, and only the last item can be deleted. The node replaces its
+    values with a dict of the offsets before any other change, so that the
+    keys stay the same.
+
+    """
+
+    __slots__ = ('_items',)
+
+    def __init__(
+        self, items: collections.abc.Iterable[typing.Any] = ()
+    ) -> None:
+        self._items = list(items)
+
+    def __contains__(self, key: object) -> bool:
+        return self._offset(key) is not None
+
+    def __copy__(self) -> '_Sequence':
+        return _Sequence(self._items)
+
+    def __delitem__(self, key: str) -> None:
+        if self._offset(key) != len(self._items) - 1:
+            raise KeyError(key)
+        self._items.pop()
+
+    def __getitem__(self, key: str) -> typing.Any:
+        offset = self._offset(key)
+        if offset is None:
+            raise KeyError(key)
+        return self._items[offset]
+
+    def __iter__(self) -> collections.abc.Iterator[str]:
+        return map(str, range(len(self._items)))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __setitem__(self, key: str, value: typing.Any) -> None:
+        offset = self._offset(key, 1)
+        if offset is None:
+            raise KeyError(key)
+        elif offset == len(self._items):
+            self._items.append(value)
+        else:
+            self._items[offset] = value
+
+    def accepts(self, key: typing.Any, deleting: bool = False) -> bool:
+        """Return ``True`` if key can be assigned, or deleted when deleting
+        is set, without changing the offsets of the other items.
+
+        :param mixed key: The key to check
+        :param bool deleting: Check for deleting key instead
+        :rtype: bool
+
+        """
+        if deleting:
+            return self._offset(key) == len(self._items) - 1
+        return self._offset(key, 1) is not None
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        offset = self._offset(key)
+        return default if offset is None else self._items[offset]
+
+    def items(self) -> collections.abc.ItemsView[str, typing.Any]:
+        return _SequenceItemsView(self)
+
+    def values(self) -> collections.abc.ValuesView[typing.Any]:
+        return _SequenceValuesView(self)
+
+    def _offset(self, key: object, extra: int = 0) -> int | None:
+        """Return the offset of the item with key, or ``None`` if key is not
+        the string of an offset below the number of items plus extra.
+        Offsets with leading zeros are keys of their own.
+
+        :param mixed key: The key to look up
+        :param int extra: The number of offsets past the last item allowed
+        :rtype: int or None
+
+        """
+        if (
+            type(key) is not str
+            or not key.isdigit()
+            or not key.isascii()
+            or (key[0] == '0' and len(key) > 1)
+        ):
+            return None
+        offset = int(key)
+        return offset if offset < len(self._items) + extra else None
+
+
+class _SequenceItemsView(collections.abc.ItemsView):
+    """Items view of a :class:`_Sequence` that pairs the offsets with the
+    items of the list directly.
+
+    """
+
+    __slots__ = ()
+
+    _mapping: _Sequence
+
+    def __iter__(self) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        items = self._mapping._items
+        return zip(map(str, range(len(items))), items, strict=True)
+
+
+class _SequenceValuesView(collections.abc.ValuesView):
+    """Values view of a :class:`_Sequence` that iterates over the list."""
+
+    __slots__ = ()
+
+    _mapping: _Sequence
+
+    def __iter__(self) -> collections.abc.Iterator[typing.Any]:
+        return iter(self._mapping._items)
+
+
+class _SequenceView(collections.abc.MutableMapping[str, typing.Any]):
+    """Presents a list, tuple or set wrapped by a
+    :class:`~flatdict.FlatterDict` view as a mapping keyed by the string
+    offset of each item.
+
+    """
+
+    __slots__ = ('_items',)
+
+    def __init__(
+        self,
+        items: list[typing.Any] | tuple[typing.Any, ...] | set[typing.Any],
+    ) -> None:
+        self._items = items
+
+    def __delitem__(self, key: str) -> None:
+        offset = self._offset(key)
+        self._mutable()
+        del self._items[offset]
+
+    def __getitem__(self, key: str) -> typing.Any:
+        items = self._items
+        if isinstance(items, set):
+            items = list(items)
+        return items[self._offset(key)]
+
+    def __iter__(self) -> collections.abc.Iterator[str]:
+        return map(str, range(len(self._items)))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __setitem__(self, key: str, value: typing.Any) -> None:
+        self._mutable()
+        if key == str(len(self._items)):
+            self._items.append(value)
+        else:
+            self._items[self._offset(key)] = value
+
+    def clear(self) -> None:
+        self._mutable()
+        self._items.clear()
+
+    def _mutable(self) -> None:
+        if not isinstance(self._items, list):
+            raise TypeError(
+                f'Assignment to immutable {type(self._items).__name__}'
+            )
+
+    def _offset(self, key: str) -> int:
+        try:
+            offset = int(key)
+        except (TypeError, ValueError):
+            raise KeyError(key) from None
+        if not 0 <= offset < len(self._items):
+            raise KeyError(key)
+        return offset
+
+
+def _unpickle(
+    delimiter: str,
+    node_types: list[tuple[typing.Any, ...]],
+    entries: list[typing.Any],
+) -> FlatDict:
+    """Rebuild a pickled flat dictionary from the state returned by
+    :meth:`FlatDict._entries`, creating each node directly and counting the
+    leaves as the nodes are closed.
+
+    :param str delimiter: The delimiter to use
+    :param list node_types: The class, dict class and original type of each
+        kind of node, starting with the flat dictionary itself
+    :param list entries: The pickled values
+    :rtype: flatdict.FlatDict
+
+    """
+    root = node_types[0][0]._restored(delimiter, *node_types[0][1:])
+    table = root.KEY_TABLE
+    stack = [root]
+    values = iter(entries)
+    for depth, key, value in zip(values, values, values, strict=True):
+        while len(stack) > abs(depth):
+            child = stack.pop()
+            stack[-1]._size += child._size or 1
+        node = stack[-1]
+        if table is not None:
+            key = table.intern(key)
+        if depth > 0:
+            node._values[key] = value
+            node._size += 1
+            continue
+        node_type = node_types[value]
+        child = node_type[0]._restored(delimiter, *node_type[1:])
+        child._parent = node
+        node._values[key] = child
+        stack.append(child)
+    while len(stack) > 1:
+        child = stack.pop()
+        stack[-1]._size += child._size or 1
+    return root
+
+
+def _kind(value: typing.Any, arrays: tuple[type, ...]) -> type | None:
+    """Return the type that :meth:`FlatDict.as_dict` converts a nested flat
+    dictionary to, given the sequence types restored by the flat dictionary
+    it belongs to, or ``None`` if value is not a flat dictionary.
+
+    :param mixed value: The value to check
+    :param tuple arrays: The sequence types that are restored
+    :rtype: type or None
+
+    """
+    return _shape(value, arrays) if isinstance(value, FlatDict) else None
+
+
+def _pairs(
+    mine: dict[str, typing.Any], kind: type, theirs: typing.Any
+) -> collections.abc.Iterator[tuple[typing.Any, typing.Any]]:
+    """Return the values of a nested flat dictionary compared as kind,
+    paired with the matching values of theirs, which has the same length.
+    Dicts are paired by key, with :data:`NO_DEFAULT` for missing keys, and
+    sequences by position.
+
+    :param dict mine: The values of the nested flat dictionary
+    :param type kind: The type it is compared as
+    :param mixed theirs: The values it is compared with
+    :rtype: Iterator
+
+    """
+    if kind is dict:
+        return (
+            (child, theirs.get(key, NO_DEFAULT)) for key, child in mine.items()
+        )
+    elif isinstance(theirs, (dict, _Sequence)):
+        theirs = theirs.values()
+    return zip(mine.values(), theirs, strict=True)
+
+
+def _walkable(
+    kind: type, value: typing.Any, value_kind: type | None
+) -> typing.Any:
+    """Return the values of value to compare in place with those of a
+    nested flat dictionary compared as kind, or ``None`` when both have to
+    be converted to be compared.
+
+    :param type kind: The type the nested flat dictionary is compared as
+    :param mixed value: The value it is compared with
+    :param value_kind: The type value is compared as, if a flat dictionary
+    :type value_kind: type or None
+    :rtype: mixed
+
+    """
+    if kind is set:
+        return None
+    elif value_kind is not None:
+        return value._values if value_kind is kind else None
+    return value if isinstance(value, kind) else None
+
+
+def _materialize(value: 'FlatDict', arrays: tuple[type, ...]) -> typing.Any:
+    """Return a nested flat dictionary converted to the value that
+    :meth:`FlatDict.as_dict` would return for it.
+
+    :param flatdict.FlatDict value: The nested flat dictionary
+    :param tuple arrays: The sequence types that are restored
+    :rtype: mixed
+
+    """
+    kind = _kind(value, arrays)
+    converted = value.as_dict()
+    return converted if kind is dict else kind(converted.values())
+
+
+def _overrides_init(cls: type) -> bool:
+    """Return ``True`` if cls is a subclass that overrides ``__init__``, so
+    instances have to be built through it rather than filled in directly.
+
+    :param type cls: The flat dictionary class
+    :rtype: bool
+
+    """
+    return cls.__init__ not in (
+        ConcurrentFlatDict.__init__,
+        FlatDict.__init__,
+        FlatterDict.__init__,
+    )
+
+
+class _Pattern:
+    """A key pattern compiled by :func:`_compile_pattern` into its segments,
+    matched against the nested values as a set of states, each the offset
+    of the next segment to match. Reaching :attr:`size` is a match.
+
+    """
+
+    __slots__ = ('_closures', 'segments', 'size', 'start')
+
+    def __init__(self, segments: tuple[typing.Any, ...]) -> None:
+        self.segments = segments
+        self.size = len(segments)
+        # Any number of segments includes none, so reaching one also
+        # reaches whatever follows it
+        closures = [frozenset([self.size])]
+        for offset in reversed(range(self.size)):
+            closure = frozenset([offset])
+            if segments[offset] is _ANY_SEGMENTS:
+                closure |= closures[-1]
+            closures.append(closure)
+        self._closures = closures[::-1]
+        self.start = self._closures[0]
+
+    def children(
+        self,
+        values: collections.abc.Mapping[typing.Any, typing.Any],
+        states: frozenset[int],
+    ) -> collections.abc.Iterator[tuple[typing.Any, typing.Any]]:
+        """Return the nested values that states could match. When only
+        literal segments can match, they are looked up rather than every
+        value being visited.
+
+        :param values: The nested values
+        :type values: collections.abc.Mapping
+        :param frozenset states: The states to match from
+        :rtype: Iterator
+
+        """
+        literals = [
+            self.segments[offset] for offset in states if offset < self.size
+        ]
+        if not all(isinstance(segment, str) for segment in literals):
+            return iter(values.items())
+        return (
+            (key, values[key])
+            for key in dict.fromkeys(literals)
+            if key in values
+        )
+
+    def live(self, states: frozenset[int]) -> bool:
+        """Return ``True`` if states can still match more segments
+
+        :param frozenset states: The states to check
+        :rtype: bool
+
+        """
+        return len(states) > 1 or self.size not in states
+
+    def step(self, states: frozenset[int], key: typing.Any) -> frozenset[int]:
+        """Return the states that follow from matching key against states
+
+        :param frozenset states: The states to match from
+        :param mixed key: The key of the nested value
+        :rtype: frozenset
+
+        """
+        following: frozenset[int] = frozenset()
+        for offset in states:
+            if offset == self.size:
+                continue
+            segment = self.segments[offset]
+            if segment is _ANY_SEGMENTS:
+                following |= self._closures[offset]
+            elif (
+                segment is _ANY_SEGMENT
+                or segment == key
+                or (callable(segment) and segment(str(key)))
+            ):
+                following |= self._closures[offset + 1]
+        return following
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _compile_pattern(pattern: str, delimiter: str) -> _Pattern:
+    """Compile pattern into the segments matched by
+    :meth:`FlatDict.iter_match`, caching the most recently used patterns.
+
+    :param str pattern: The pattern to compile
+    :param str delimiter: The delimiter to split the pattern on
+    :rtype: _Pattern
+
+    """
+    segments: list[typing.Any] = []
+    for segment in pattern.split(delimiter):
+        if segment == '**':
+            if segments and segments[-1] is _ANY_SEGMENTS:
+                continue
+            segments.append(_ANY_SEGMENTS)
+        elif segment == '*':
+            segments.append(_ANY_SEGMENT)
+        elif _GLOB.search(segment):
+            segments.append(re.compile(fnmatch.translate(segment)).match)
+        else:
+            segments.append(segment)
+    return _Pattern(tuple(segments))
+
+
+def _shape(value: typing.Any, arrays: tuple[type, ...]) -> type:
+    """Return the type a branch is converted to by :meth:`FlatDict.as_dict`,
+    given the sequence types restored by the flat dictionary it belongs to.
+
+    :param mixed value: The branch
+    :param tuple arrays: The sequence types that are restored
+    :rtype: type
+
+    """
+    original_type = getattr(value, 'original_type', type(value))
+    return original_type if original_type in arrays else dict
+
+
+def _leaf(value: typing.Any) -> typing.Any:
+    """Return value to compare as an item, converting empty nested flat
+    dictionaries to the empty value :meth:`FlatDict.as_dict` returns.
+
+    :param mixed value: The value of an item
+    :rtype: mixed
+
+    """
+    if isinstance(value, FlatDict):
+        return _materialize(value, value._ARRAYS)
+    return value
+
+
+def _detached(value: typing.Any) -> typing.Any:
+    """Return value as it is now for recording in a
+    :class:`~flatdict.ChangeJournal`, as the nested :class:`dict` of a flat
+    dictionary or a deep copy of a container, so that later changes to it
+    do not show through.
+
+    :param mixed value: The value to record
+    :rtype: mixed
+
+    """
+    if isinstance(value, FlatDict):
+        return value.as_dict()
+    elif isinstance(value, (dict, list, set, tuple)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _leaves(value: typing.Any) -> int:
+    """Return the number of flat keys a value occupies in its parent. An
+    empty nested flat dictionary is reported as a single key.
+
+    :param mixed value: The value to count
+    :rtype: int
+
+    """
+    if isinstance(value, FlatDict):
+        return max(value._size, 1)
+    return 1
+
+
+class FlatterDict(FlatDict):
+    """Like :class:`~flatdict.FlatDict` but also coerces lists and sets
+    to child-dict instances with the offset as the key. Alternative to
+    the implementation added in v1.2 of FlatDict.
+
+    """
+
+    __slots__ = ('original_type',)
+
+    _ARRAYS: tuple[type, ...] = (list, set, tuple)
+    _COERCE: type | tuple[type, ...] = (list, tuple, set, dict, FlatDict)
+
+    def __init__(
+        self,
+        value: (
+            dict[str, typing.Any]
+            | list[typing.Any]
+            | tuple[typing.Any, ...]
+            | set[typing.Any]
+            | None
+        ) = None,
+        delimiter: str = ':',
+        dict_class: type[dict[str, typing.Any]] = dict,
+    ) -> None:
+        self.original_type: type = type(value)
+        if self.original_type in self._ARRAYS:
+            super().__init__(None, delimiter, _Sequence)
+            self._extend(value)
+            return
+        super().__init__(value, delimiter, dict_class)
+
+    @classmethod
+    def view(
+        cls,
+        value: (
+            dict[str, typing.Any]
+            | list[typing.Any]
+            | tuple[typing.Any, ...]
+            | set[typing.Any]
+        ),
+        delimiter: str = ':',
+    ) -> 'FlatterDict':
+        """Return a flat dictionary that reads and writes through to value
+        instead of copying it. Like :meth:`FlatDict.view`, but lists, tuples
+        and sets are also treated as branches keyed by offset. Only lists can
+        be changed through the view.
+
+        :param mixed value: The nested value to wrap
+        :param str delimiter: The delimiter to use
+        :rtype: flatdict.FlatterDict
+
+        """
+        original_type = type(value)
+        if original_type in cls._ARRAYS:
+            value = _SequenceView(value)
+        instance = super().view(value, delimiter)
+        instance.original_type = original_type
+        return instance
+
+    def _assign(self, key: str, value: typing.Any) -> None:
+        """Assign the value to the key of a flat dictionary that is not a
+        view, dynamically building nested FlatDict items where appropriate.
+
+        :param mixed key: The key for the item
+        :param mixed value: The value for the item
+        :raises: KeyError
+        :raises: TypeError
+        :raises: ValueError
+
+        """
+        if type(key) is tuple:
+            self._assign_path(key, value)
+            return
+        self._own()
+        value = self._coerce(value)
+        if self._has_delimiter(key):
+            pk, ck = key.split(self._delimiter, 1)
+            if pk not in self._values:
+                self._store(pk, self._child({ck: value}))
+                return
+            if (
+                getattr(self._values[pk], 'original_type', None)
+                in self._ARRAYS
+            ):
+                k, _delimiter, cck = ck.partition(self._delimiter)
+                try:
+                    int(k)
+                except ValueError as error:
+                    raise TypeError(
+                        f'Assignment to invalid type for key '
+                        f'{pk}{self._delimiter}{ck}'
+                    ) from error
+                if cck:
+                    self._values[pk][k][cck] = value
+                else:
+                    self._values[pk][k] = value
+                return
+            elif not isinstance(self._values[pk], FlatterDict):
+                raise TypeError(f'Assignment to invalid type for key {pk}')
+            self._values[pk][ck] = value
+        else:
+            self._store(key, value)
+
+    @classmethod
+    def _restored(
+        cls,
+        delimiter: str,
+        dict_class: type[dict[str, typing.Any]],
+        original_type: type | None,
+    ) -> 'FlatterDict':
+        """Return an empty instance to be filled in directly when unpickling.
+
+        :param str delimiter: The delimiter to use
+        :param type dict_class: The class to hold the values in
+        :param type original_type: The type the values were flattened from
+        :rtype: flatdict.FlatterDict
+
+        """
+        instance = typing.cast(
+            FlatterDict, super()._restored(delimiter, dict_class, None)
+        )
+        instance.original_type = original_type
+        return instance
+
+    def _node_type(self) -> tuple[typing.Any, ...]:
+        """Return the class, dict class and original type of this instance,
+        as passed to :meth:`_restored` when unpickling.
+
+        :rtype: tuple
+
+        """
+        return type(self), type(self._values), self.original_type
+
+    def _coerce(self, value: typing.Any) -> typing.Any:
+        """Return value wrapped in a nested flat dictionary if it is of a
+        type that is flattened, otherwise return it unchanged. Views and
+        frozen flat dictionaries are copied so that their values are
+        counted, flattened and can be changed.
+
+        :param mixed value: The value being assigned
+        :rtype: mixed
+
+        """
+        if isinstance(value, FlatDict) and (
+            value._view or isinstance(value, _Frozen)
+        ):
+            value = _materialize(value, value._ARRAYS)
+        if isinstance(value, self._COERCE) and not isinstance(
+            value, FlatterDict
+        ):
+            return self._child(value)
+        return value
+
+    def _fork(self, parent: FlatDict | None) -> 'FlatterDict':
+        """Return a new instance that shares the nested values of this one.
+        See :meth:`FlatDict._fork`.
+
+        :param parent: The parent of the new instance
+        :type parent: flatdict.FlatDict or None
+        :rtype: flatdict.FlatterDict
+
+        """
+        fork = typing.cast(FlatterDict, super()._fork(parent))
+        fork.original_type = self.original_type
+        return fork
+
+    def _branch(self, value: typing.Any) -> typing.Any:
+        """Return the mapping of children for value if it is a nested
+        branch, otherwise ``None``. Views also treat plain dicts, lists,
+        tuples and sets as branches.
+
+        :param mixed value: The value to check
+        :rtype: collections.abc.Mapping or None
+
+        """
+        if self._view and isinstance(value, self._ARRAYS):
+            return _SequenceView(value)
+        return super()._branch(value)
+
+    def _discard(self, key: typing.Any) -> None:
+        """Remove key from this level of the flat dictionary. The values of
+        a sequence node are keyed by offset in a dict first, unless key is
+        the offset of the last item. See :meth:`FlatDict._discard`.
+
+        :param mixed key: The key to remove
+
+        """
+        if type(self._values) is _Sequence and not self._values.accepts(
+            key, deleting=True
+        ):
+            self._key_by_offset()
+        super()._discard(key)
+
+    def _extend(self, items: collections.abc.Iterable[typing.Any]) -> None:
+        """Append the items to the list the values of this sequence node are
+        held in, adjusting the leaf counts once for all of them.
+
+        :param iterable items: The items to append
+
+        """
+        self._own()
+        values = self._values._items
+        delta = 0
+        for item in items:
+            value = self._coerce(item)
+            if isinstance(value, FlatDict):
+                if value._parent is not None:
+                    value = value.copy()
+                value._parent = self
+            values.append(value)
+            delta += _leaves(value)
+        self._order = None
+        self._resize(delta)
+
+    def _key_by_offset(self) -> None:
+        """Replace the list the values of this sequence node are held in
+        with a dict keyed by their offsets, so that keys can be added or
+        removed without moving the other items.
+
+        """
+        self._own()
+        self._values = dict(self._values.items())
+
+    def _store(self, key: typing.Any, value: typing.Any) -> None:
+        """Assign value to key at this level of the flat dictionary. The
+        values of a sequence node are keyed by offset in a dict first,
+        unless key replaces an item or appends one. See
+        :meth:`FlatDict._store`.
+
+        :param mixed key: The key for the item
+        :param mixed value: The value for the item
+
+        """
+        if type(self._values) is _Sequence and not self._values.accepts(key):
+            self._key_by_offset()
+        super()._store(key, value)
+
+
+class ConcurrentFlatDict(FlatDict):
+    """A :class:`~flatdict.FlatDict` that can be shared between threads,
+    including on free-threaded builds of Python.
+
+    Changes are made while holding a lock, so each assignment, deletion and
+    update is applied whole. Looking up, checking for and counting keys
+    walk the nested values without taking the lock, as each nested level
+    is only ever changed with single dict operations. Iteration, and the
+    other methods that walk all of the values, work on a snapshot taken in
+    constant time with :meth:`copy`, so they are consistent and unaffected
+    by changes made while they run.
+
+    Nested values are held in plain :class:`~flatdict.FlatDict` instances
+    and are only changed through flat keys. Looking up a nested flat
+    dictionary returns a copy of it, and flat dictionaries assigned as
+    values are copied, so no other reference can change them without the
+    lock.
+
+    """
+
+    __slots__ = ('_lock',)
+
+    def __init__(
+        self,
+        value: dict[str, typing.Any] | None = None,
+        delimiter: str = ':',
+        dict_class: type[dict[str, typing.Any]] = dict,
+    ) -> None:
+        self._lock = threading.RLock()
+        super().__init__(value, delimiter, dict_class)
+
+    def __delitem__(self, key: str) -> None:
+        """Delete the item for the specified key while holding the lock.
+
+        :param mixed key: The key to use
+        :raises: KeyError
+
+        """
+        with self._lock:
+            super().__delitem__(key)
+
+    def __eq__(self, other: object) -> bool:
+        """Check for equality against the other value, comparing snapshots of
+        both when other is also a :class:`~flatdict.ConcurrentFlatDict`.
+
+        :param other: The value to compare
+        :type other: dict or FlatDict
+        :rtype: bool
+        :raises: TypeError
+
+        """
+        if isinstance(other, ConcurrentFlatDict):
+            other = other._snapshot()
+        elif isinstance(other, FlatDict):
+            return FlatDict.__eq__(other, self._snapshot())
+        return FlatDict.__eq__(self._snapshot(), other)
+
+    def __getitem__(self, key: str | int) -> typing.Any:
+        """Get an item for the specified key without taking the lock. Nested
+        flat dictionaries are returned as a copy.
+
+        :param mixed key: The key to use
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        if self._view:
+            with self._lock:
+                return super().__getitem__(key)
+        value = self._lookup(key)
+        # Checking for the attribute first keeps the slower abstract base
+        # class check off the path of every leaf value
+        if getattr(value, '_values', None) is not None and isinstance(
+            value, FlatDict
+        ):
+            with self._lock:
+                return self._lookup(key).copy()
+        return value
+
+    def __reduce__(self) -> tuple[typing.Callable, tuple[typing.Any, ...]]:
+        """Return state information for pickling a snapshot of the flat
+        dictionary. See :meth:`FlatDict.__reduce__`.
+
+        :rtype: tuple
+
+        """
+        return FlatDict.__reduce__(self._snapshot())
+
+    def __setitem__(self, key: str, value: typing.Any) -> None:
+        """Assign the value to the key while holding the lock.
+
+        :param mixed key: The key for the item
+        :param mixed value: The value for the item
+        :raises: TypeError
+
+        """
+        with self._lock:
+            super().__setitem__(key, value)
+
+    def __str__(self) -> str:
+        """Return the string value of a snapshot of the instance.
+
+        :rtype: str
+
+        """
+        return FlatDict.__str__(self._snapshot())
+
+    def apply_patch(self, patch: dict[str, dict[str, typing.Any]]) -> None:
+        """Apply the changes returned by :meth:`diff` while holding the lock,
+        so that other threads never see them partly applied.
+
+        :param dict patch: The changes to apply
+        :raises: KeyError
+        :raises: TypeError
+
+        """
+        with self._lock:
+            super().apply_patch(patch)
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        """Return a snapshot of the flat dictionary as a :class:`dict`.
+
+        :rtype: dict
+
+        """
+        return FlatDict.as_dict(self._snapshot())
+
+    def clear(self) -> None:
+        """Remove all items from the flat dictionary while holding the
+        lock.
+
+        """
+        with self._lock:
+            super().clear()
+
+    def copy(self) -> 'ConcurrentFlatDict':
+        """Return a copy of the flat dictionary, with its own lock. See
+        :meth:`FlatDict.copy`.
+
+        :rtype: flatdict.ConcurrentFlatDict
+
+        """
+        with self._lock:
+            return typing.cast(ConcurrentFlatDict, super().copy())
+
+    def count_prefix(self, prefix: str) -> int:
+        """Return the number of items in a snapshot whose flat keys are prefix
+        or start with prefix and the delimiter.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: int
+
+        """
+        return FlatDict.count_prefix(self._snapshot(), prefix)
+
+    def diff(self, other: FlatDict) -> dict[str, dict[str, typing.Any]]:
+        """Return the changes that turn a snapshot of this flat dictionary
+        into other. See :meth:`FlatDict.diff`.
+
+        :param other: The flat dictionary to compare with
+        :type other: flatdict.FlatDict
+        :rtype: dict
+        :raises: TypeError
+
+        """
+        if isinstance(other, ConcurrentFlatDict):
+            other = other._snapshot()
+        return FlatDict.diff(self._snapshot(), other)
+
+    def iter_match(
+        self, pattern: str
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Yield the items of a snapshot whose flat keys match pattern. See
+        :meth:`FlatDict.iter_match`.
+
+        :param str pattern: The pattern to match the flat keys against
+        :rtype: Iterator
+
+        """
+        return FlatDict.iter_match(self._snapshot(), pattern)
+
+    def iter_paths(
+        self,
+    ) -> collections.abc.Iterator[tuple[tuple[typing.Any, ...], typing.Any]]:
+        """Yield the items of a snapshot with the path of each as a tuple.
+        See :meth:`FlatDict.iter_paths`.
+
+        :rtype: Iterator
+
+        """
+        return FlatDict.iter_paths(self._snapshot())
+
+    def iter_prefix(
+        self, prefix: str
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Yield the items of a snapshot under prefix. See
+        :meth:`FlatDict.iter_prefix`.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: Iterator
+
+        """
+        return FlatDict.iter_prefix(self._snapshot(), prefix)
+
+    def iter_range(
+        self, start: str | None = None, stop: str | None = None
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Yield the items of a snapshot from start up to stop, in order of
+        their flat keys. See :meth:`FlatDict.iter_range`.
+
+        :param start: The first flat key to include
+        :type start: str or None
+        :param stop: The flat key to stop before
+        :type stop: str or None
+        :rtype: Iterator
+
+        """
+        return FlatDict.iter_range(self._snapshot(), start, stop)
+
+    def pop(self, key: str, default: typing.Any = NO_DEFAULT) -> typing.Any:
+        """Remove key and return its value, or default, while holding the
+        lock. See :meth:`FlatDict.pop`.
+
+        :param mixed key: The key name
+        :param mixed default: The default value
+        :rtype: mixed
+
+        """
+        with self._lock:
+            return super().pop(key, default)
+
+    def pop_prefix(self, prefix: str) -> dict[str, typing.Any]:
+        """Remove and return the items under prefix while holding the lock.
+        See :meth:`FlatDict.pop_prefix`.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: dict
+
+        """
+        with self._lock:
+            return super().pop_prefix(prefix)
+
+    def popitem(self) -> tuple[str, typing.Any]:
+        """Remove and return an item while holding the lock.
+
+        :rtype: tuple
+        :raises: KeyError
+
+        """
+        with self._lock:
+            return super().popitem()
+
+    def setdefault(self, key: str, default: typing.Any) -> typing.Any:
+        """Return the value of key, first inserting default if key is not in
+        the flat dictionary, while holding the lock.
+
+        :param mixed key: The key name
+        :param mixed default: The default value
+        :rtype: mixed
+
+        """
+        with self._lock:
+            return super().setdefault(key, default)
+
+    def set_delimiter(self, delimiter: str) -> None:
+        """Change the delimiter while holding the lock. See
+        :meth:`FlatDict.set_delimiter`.
+
+        :param str delimiter: The delimiter to use
+        :raises: ValueError
+
+        """
+        with self._lock:
+            super().set_delimiter(delimiter)
+
+    def update(self, other: typing.Any = None, **kwargs: typing.Any) -> None:
+        """Update the flat dictionary with the key/value pairs from other
+        while holding the lock, so the update is applied whole. See
+        :meth:`FlatDict.update`.
+
+        :param iterable other: Iterable of key, value pairs
+        :rtype: None
+
+        """
+        with self._lock:
+            super().update(other, **kwargs)
+
+    @classmethod
+    def view(
+        cls, value: dict[str, typing.Any], delimiter: str = ':'
+    ) -> 'ConcurrentFlatDict':
+        """Return a flat dictionary that reads and writes through to value.
+        See :meth:`FlatDict.view`. Only changes made through the view are
+        made while holding the lock.
+
+        :param dict value: The nested dict to wrap
+        :param str delimiter: The delimiter to use
+        :rtype: flatdict.ConcurrentFlatDict
+
+        """
+        instance = typing.cast(
+            ConcurrentFlatDict, super().view(value, delimiter)
+        )
+        instance._lock = threading.RLock()
+        return instance
+
+    def _child(self, value: dict[str, typing.Any] | None) -> FlatDict:
+        """Return a new nested :class:`~flatdict.FlatDict` holding value,
+        as nested values are only changed through this instance.
+
+        :param value: The nested values
+        :type value: dict or None
+        :rtype: flatdict.FlatDict
+
+        """
+        return FlatDict(value, self._delimiter)
+
+    def _coerce(self, value: typing.Any) -> typing.Any:
+        """Return value wrapped in a nested flat dictionary if it is of a
+        type that is flattened, copying flat dictionaries so that they can
+        not be changed through another reference.
+
+        :param mixed value: The value being assigned
+        :rtype: mixed
+
+        """
+        if isinstance(value, FlatDict) and not value._view:
+            value = value.copy()
+        return super()._coerce(value)
+
+    def _fork(self, parent: FlatDict | None) -> 'ConcurrentFlatDict':
+        """Return a new instance, with its own lock, that shares the nested
+        values of this one. See :meth:`FlatDict._fork`.
+
+        :param parent: The parent of the new instance
+        :type parent: flatdict.FlatDict or None
+        :rtype: flatdict.ConcurrentFlatDict
+
+        """
+        fork = typing.cast(ConcurrentFlatDict, super()._fork(parent))
+        fork._lock = threading.RLock()
+        return fork
+
+    def _iter_items(
+        self,
+        values: collections.abc.Mapping[typing.Any, typing.Any] | None = None,
+        prefix: str | None = None,
+        branch: typing.Callable[[typing.Any], typing.Any] | None = None,
+        path: tuple[typing.Any, ...] | None = None,
+    ) -> collections.abc.Iterator[tuple[typing.Any, typing.Any]]:
+        """Walk the nested values of a snapshot of the flat dictionary
+        unless the values to walk are given. See :meth:`FlatDict._iter_items`.
+
+        :param values: The nested values to walk, defaulting to all of them
+        :type values: collections.abc.Mapping or None
+        :param prefix: The flat key of the nested values
+        :type prefix: str or None
+        :param branch: The function that finds branches
+        :type branch: callable or None
+        :param path: The key segments of the path to values
+        :type path: tuple or None
+        :rtype: Iterator
+
+        """
+        if values is None:
+            snapshot = self._snapshot()
+            return FlatDict._iter_items(snapshot, None, prefix, branch)
+        return super()._iter_items(values, prefix, branch, path)
+
+    @classmethod
+    def _restored(
+        cls,
+        delimiter: str,
+        dict_class: type[dict[str, typing.Any]],
+        original_type: type | None,
+    ) -> 'ConcurrentFlatDict':
+        """Return an empty instance, with its own lock, to be filled in
+        directly when unpickling.
+
+        :param str delimiter: The delimiter to use
+        :param type dict_class: The class to hold the values in
+        :param original_type: Unused, see :meth:`FlatterDict._restored`
+        :rtype: flatdict.ConcurrentFlatDict
+
+        """
+        instance = typing.cast(
+            ConcurrentFlatDict,
+            super()._restored(delimiter, dict_class, original_type),
+        )
+        instance._lock = threading.RLock()
+        return instance
+
+    def _snapshot(self) -> 'ConcurrentFlatDict':
+        """Return a copy of the flat dictionary that no other thread can
+        change, to read from without holding the lock. The copy is made in
+        constant time and shares the nested values until they are changed,
+        except for views, which are copied in full.
+
+        :rtype: flatdict.ConcurrentFlatDict
+
+        """
+        with self._lock:
+            if self._view:
+                return ConcurrentFlatDict(
+                    FlatDict.as_dict(self), self._delimiter
+                )
+            return self._fork(None)
+
+
+class _Frozen:
+    """The behaviour shared by :class:`~flatdict.FrozenFlatDict` and
+    :class:`~flatdict.FrozenFlatterDict`, which list it ahead of the flat
+    dictionary class they freeze.
+
+    """
+
+    __slots__ = ()
+
+    _MUTABLE: type[FlatDict] = FlatDict
+
+    def __init__(
+        self,
+        value: typing.Any = None,
+        delimiter: str = ':',
+        dict_class: type[dict[str, typing.Any]] = dict,
+    ) -> None:
+        if (
+            isinstance(value, FlatDict)
+            and not value._view
+            and value._ARRAYS == self._ARRAYS
+            and value._delimiter == delimiter
+        ):
+            # Share the nested values of the flat dictionary, as a copy
+            # does, so it is only walked once to build the lookup table
+            source = value.copy()
+        else:
+            if isinstance(value, FlatDict):
+                value = value.as_dict()
+            source = self._MUTABLE(value, delimiter, dict_class)
+        self._adopt(source)
+
+    def __contains__(self, key: object) -> bool:
+        """Check to see if the key exists, looking up flat keys in the table
+        before walking the nested values for the keys of branches.
+
+        :param mixed key: The key to check for
+        :rtype: bool
+
+        """
+        return key in self._table or super().__contains__(key)
+
+    def __eq__(self, other: object) -> bool:
+        """Check for equality against the other value. Frozen flat
+        dictionaries whose hashes have been calculated and differ are not
+        compared any further. Mutable flat dictionaries are compared as
+        they compare with this one.
+
+        :param other: The value to compare
+        :type other: dict or FlatDict
+        :rtype: bool
+        :raises: TypeError
+
+        """
+        if isinstance(other, _Frozen):
+            if None not in (self._hash, other._hash) and (
+                self._hash != other._hash
+            ):
+                return False
+        elif isinstance(other, FlatDict):
+            return other.__eq__(self)
+        return super().__eq__(other)
+
+    def __getitem__(self, key: str | int) -> typing.Any:
+        """Get an item for the specified key from the lookup table. The keys
+        of branches are found by walking the nested values, returning the
+        branch frozen.
+
+        :param mixed key: The key to use
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        value = self._table.get(key, NO_DEFAULT)
+        if value is NO_DEFAULT:
+            value = self._lookup(key)
+            if isinstance(value, FlatDict):
+                return self._frozen(value)
+        return value
+
+    def __hash__(self) -> int:
+        """Return the hash of the items, calculated once and kept.
+
+        :rtype: int
+        :raises: TypeError
+
+        """
+        if self._hash is None:
+            self._hash = hash(frozenset(self._table.items()))
+        return self._hash
+
+    def __iter__(self) -> collections.abc.Iterator[str]:
+        """Iterate over the precomputed flat keys.
+
+        :rtype: Iterator
+
+        """
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        """Return the number of precomputed flat keys.
+
+        :rtype: int
+
+        """
+        return len(self._keys)
+
+    def copy(self) -> typing.Any:
+        """Return the frozen flat dictionary, as it can not be changed.
+
+        :rtype: flatdict.FrozenFlatDict or flatdict.FrozenFlatterDict
+
+        """
+        return self
+
+    def iter_paths(
+        self,
+    ) -> collections.abc.Iterator[tuple[tuple[typing.Any, ...], typing.Any]]:
+        """Iterate over the items with the path of each as a tuple, freezing
+        empty branches. See :meth:`FlatDict.iter_paths`.
+
+        :rtype: Iterator
+
+        """
+        for path, value in super().iter_paths():
+            if isinstance(value, FlatDict):
+                value = self._frozen(value)
+            yield path, value
+
+    @classmethod
+    def view(cls, value: typing.Any, delimiter: str = ':') -> typing.NoReturn:
+        """Frozen flat dictionaries can not wrap a value that can be
+        changed, so views are not supported.
+
+        :raises: TypeError
+
+        """
+        raise TypeError(f'{cls.__name__} does not support views')
+
+    def _adopt(self, source: FlatDict) -> None:
+        """Take over the nested values of source, sharing them as
+        :meth:`FlatDict.copy` does, and build the flat keys and the lookup
+        table with a single walk. Empty branches are frozen in the table.
+
+        :param flatdict.FlatDict source: The flat dictionary to freeze
+
+        """
+        self._delimiter = source._delimiter
+        self._order = source._order
+        self._parent = None
+        self._shared = source._shared = True
+        self._size = source._size
+        self._values = source._values
+        self._view = False
+        table: dict[str, typing.Any] = {}
+        for key, value in FlatDict._iter_items(self, self._values):
+            if isinstance(value, FlatDict):
+                value = self._frozen(value)
+            table[key] = value
+        self._hash: int | None = None
+        self._keys = tuple(table)
+        self._table = table
+
+    @classmethod
+    def _frozen(cls, source: FlatDict) -> typing.Any:
+        """Return a frozen flat dictionary of this class that shares the
+        nested values of source.
+
+        :param flatdict.FlatDict source: The flat dictionary to freeze
+        :rtype: flatdict.FrozenFlatDict or flatdict.FrozenFlatterDict
+
+        """
+        instance = cls.__new__(cls)
+        instance._adopt(source)
+        return instance
+
+    def _claim(
+        self, parts: collections.abc.Iterable[typing.Any]
+    ) -> typing.Any:
+        """Return the value at the key segments of parts without copying
+        anything, as the nested values are never changed.
+
+        :param iterable parts: The key segments of the path to the value
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        return FlatDict._lookup(typing.cast(FlatDict, self), tuple(parts))
+
+    def _immutable(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        """Raise :exc:`TypeError`, as frozen flat dictionaries can not be
+        changed.
+
+        :raises: TypeError
+
+        """
+        raise TypeError(f'{self.__class__.__name__} does not support changes')
+
+    def _iter_items(
+        self,
+        values: collections.abc.Mapping[typing.Any, typing.Any] | None = None,
+        prefix: str | None = None,
+        branch: typing.Callable[[typing.Any], typing.Any] | None = None,
+        path: tuple[typing.Any, ...] | None = None,
+    ) -> collections.abc.Iterator[tuple[typing.Any, typing.Any]]:
+        """Iterate over the lookup table unless the values to walk are
+        given. See :meth:`FlatDict._iter_items`.
+
+        :param values: The nested values to walk, defaulting to all of them
+        :type values: collections.abc.Mapping or None
+        :param prefix: The flat key of the nested values
+        :type prefix: str or None
+        :param branch: The function that finds branches
+        :type branch: callable or None
+        :param path: The key segments of the path to values
+        :type path: tuple or None
+        :rtype: Iterator
+
+        """
+        if values is None:
+            return iter(self._table.items())
+        return super()._iter_items(values, prefix, branch, path)
+
+    __delitem__ = __setitem__ = _immutable
+    apply_patch = clear = pop = pop_prefix = popitem = _immutable
+    set_delimiter = setdefault = update = _immutable
+
+
+class FrozenFlatDict(_Frozen, FlatDict):
+    """An immutable, hashable :class:`~flatdict.FlatDict`. The flat keys
+    and a table of the value of each are built once, so looking up a flat
+    key is a single dict lookup and the length and keys are not walked.
+    The hash is calculated the first time it is needed and kept, so values
+    must be hashable for the frozen flat dictionary to be.
+
+    Building one from a :class:`~flatdict.FlatDict` with the same
+    delimiter shares its nested values, as :meth:`FlatDict.copy` does,
+    walking them once. Looking up a branch returns it frozen, and any
+    attempt to change the frozen flat dictionary raises :exc:`TypeError`.
+
+    """
+
+    __slots__ = ('_hash', '_keys', '_table')
+
+
+class FrozenFlatterDict(_Frozen, FlatterDict):
+    """An immutable, hashable :class:`~flatdict.FlatterDict`. See
+    :class:`~flatdict.FrozenFlatDict`.
+
+    """
+
+    __slots__ = ('_hash', '_keys', '_table')
+
+    _MUTABLE = FlatterDict
+
+    def _adopt(self, source: FlatDict) -> None:
+        """Take over the nested values and original type of source. See
+        :meth:`_Frozen._adopt`.
+
+        :param flatdict.FlatDict source: The flat dictionary to freeze
+
+        """
+        self.original_type = getattr(source, 'original_type', dict)
+        super()._adopt(source)
+
+
+class ChangeJournal:
+    """Record of the flat key changes made to a flat dictionary, returned by
+    :meth:`FlatDict.enable_journal`. Each change is an ``(op, key, value)``
+    tuple, where op is one of:
+
+    - ``'set'``: key was assigned value
+    - ``'delete'``: key and any nested keys under it were removed
+    - ``'clear'``: every key was removed, key is ``None``
+    - ``'delimiter'``: the delimiter was changed to value, key is ``None``
+
+    Changes are kept until they are drained. Every change is numbered, and
+    :attr:`cursor` is the number of the latest one, so a checkpoint can be
+    kept and the changes made since read with :meth:`since` instead.
+
+    When coalescing, only the latest change to each key is kept, in the
+    position of that change. A set or delete discards the changes before it
+    to the keys nested under its key, and a clear discards every change
+    before it, so the changes kept can still be replayed in order.
+
+    Values are recorded as they were assigned, with flat dictionaries
+    recorded as their nested :class:`dict` and containers copied, so later
+    changes to them do not show through.
+
+    """
+
+    __slots__ = (
+        '_branches',
+        '_coalesce',
+        '_cursor',
+        '_entries',
+        '_epoch',
+        '_finalizer',
+    )
+
+    def __init__(self, coalesce: bool = False) -> None:
+        self._branches: dict[typing.Any, set[typing.Any]] = {}
+        self._coalesce = coalesce
+        self._cursor = 0
+        self._entries: dict[typing.Any, tuple[typing.Any, ...]] = {}
+        self._epoch = 0
+        self._finalizer: weakref.finalize | None = None
+
+    def __len__(self) -> int:
+        """Return the number of changes waiting to be drained.
+
+        :rtype: int
+
+        """
+        return len(self._entries)
+
+    @property
+    def cursor(self) -> int:
+        """The number of the latest change recorded, or ``0``.
+
+        :rtype: int
+
+        """
+        return self._cursor
+
+    def drain(self) -> list[tuple[str, typing.Any, typing.Any]]:
+        """Remove and return the changes recorded, oldest first.
+
+        :rtype: list
+
+        """
+        changes = [entry[1:] for entry in self._entries.values()]
+        self._branches.clear()
+        self._entries.clear()
+        return changes
+
+    def since(self, cursor: int) -> list[tuple[str, typing.Any, typing.Any]]:
+        """Return the changes recorded after cursor that have not been
+        drained, oldest first, without removing them. Only the changes
+        after cursor are visited.
+
+        :param int cursor: A previous value of :attr:`cursor`
+        :rtype: list
+
+        """
+        changes = []
+        for entry in reversed(self._entries.values()):
+            if entry[0] <= cursor:
+                break
+            changes.append(entry[1:])
+        changes.reverse()
+        return changes
+
+    def _append(
+        self,
+        op: str,
+        key: typing.Any,
+        value: typing.Any,
+        path: tuple[typing.Any, ...] | None = None,
+    ) -> None:
+        """Record a change, replacing the previous change to the same key
+        and discarding the previous changes to the keys nested under it
+        when coalescing.
+
+        :param str op: The kind of change
+        :param key: The flat key that was changed
+        :param mixed value: The value that was assigned
+        :param path: The key segments of key, when coalescing
+        :type path: tuple or None
+
+        """
+        self._cursor += 1
+        token: typing.Any = self._cursor
+        if self._coalesce:
+            if op == 'clear':
+                self._branches.clear()
+                self._entries.clear()
+            elif op == 'delimiter':
+                # Keys recorded before the change are split differently, so
+                # they are never coalesced with the keys recorded after it
+                self._epoch += 1
+            else:
+                token = (self._epoch, path)
+                self._discard(token)
+                for nested in self._branches.pop(token, ()):
+                    self._discard(nested)
+                for depth in range(1, len(path or ())):
+                    self._branches.setdefault(
+                        (self._epoch, path[:depth]), set()
+                    ).add(token)
+        self._entries[token] = (self._cursor, op, key, value)
+
+    def _discard(self, token: tuple[int, tuple[typing.Any, ...]]) -> None:
+        """Remove the change recorded for the key of token when coalescing,
+        along with the references to it from the branches it is nested in.
+
+        :param tuple token: The epoch and key segments of the change
+
+        """
+        if self._entries.pop(token, None) is None:
+            return
+        epoch, path = token
+        for depth in range(1, len(path)):
+            nested = self._branches.get((epoch, path[:depth]))
+            if nested is not None:
+                nested.discard(token)
+                if not nested:
+                    del self._branches[epoch, path[:depth]]
+
+
+class KeyTable:
+    """A table of the key segments and flat keys of flat dictionaries that
+    share a schema, so that each distinct key is stored once however many
+    flat dictionaries hold it. Set it as the ``KEY_TABLE`` of a flat
+    dictionary class to use it for the instances of that class::
+
+        class Record(flatdict.FlatDict):
+            KEY_TABLE = flatdict.KeyTable()
+
+    The key segments stored in the instances are interned in the table, and
+    the flat keys joined while iterating over them are cached in it, so
+    iterating again returns the same strings without joining them. Only
+    :class:`str` keys are kept, and once maxsize segments or flat keys are
+    held new ones are no longer added, which bounds the table when records
+    do not share their keys.
+
+    :param int maxsize: The most segments and the most flat keys to hold
+
+    """
+
+    __slots__ = ('_count', '_delimiters', '_maxsize', '_segments')
+
+    def __init__(self, maxsize: int = KEY_TABLE_SIZE) -> None:
+        self._count = 0
+        self._delimiters: dict[str, _Prefixes] = {}
+        self._maxsize = maxsize
+        self._segments: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        """Return the number of key segments and flat keys held.
+
+        :rtype: int
+
+        """
+        return len(self._segments) + self._count
+
+    def clear(self) -> None:
+        """Remove all of the key segments and flat keys held. Keys already
+        stored in flat dictionaries are unchanged.
+
+        """
+        self._count = 0
+        self._delimiters.clear()
+        self._segments.clear()
+
+    def intern(self, segment: typing.Any) -> typing.Any:
+        """Return the key segment held in the table that is equal to
+        segment, adding segment if there is none.
+
+        :param mixed segment: The key segment
+        :rtype: mixed
+
+        """
+        if type(segment) is not str:
+            return segment
+        interned = self._segments.get(segment)
+        if interned is None:
+            if len(self._segments) >= self._maxsize:
+                return segment
+            interned = self._segments[segment] = segment
+        return interned
+
+    def join(self, prefix: str, key: typing.Any, delimiter: str) -> str:
+        """Return the flat key of key below prefix, joining and caching it
+        the first time it is asked for.
+
+        :param str prefix: The flat key of the parent
+        :param mixed key: The key segment
+        :param str delimiter: The delimiter to join them with
+        :rtype: str
+
+        """
+        return self._prefixes(delimiter)[prefix][key]
+
+    def _prefixes(self, delimiter: str) -> '_Prefixes':
+        """Return the flat keys cached for each prefix joined with
+        delimiter, by prefix.
+
+        :param str delimiter: The delimiter keys are joined with
+        :rtype: dict
+
+        """
+        prefixes = self._delimiters.get(delimiter)
+        if prefixes is None:
+            prefixes = self._delimiters[delimiter] = _Prefixes(self, delimiter)
+        return prefixes
+
+
+class _Prefixes(dict):
+    """The flat keys cached in a :class:`KeyTable` for the children of each
+    prefix joined with a delimiter, adding the prefixes as they are first
+    looked up while the table is not full.
+
+    """
+
+    __slots__ = ('_delimiter', '_table')
+
+    def __init__(self, table: KeyTable, delimiter: str) -> None:
+        super().__init__()
+        self._delimiter = delimiter
+        self._table = table
+
+    def __missing__(self, prefix: str) -> '_Joins':
+        """Return the flat keys of the children of prefix.
+
+        :param str prefix: The flat key of the parent
+        :rtype: dict
+
+        """
+        joins = _Joins(self._table, prefix, self._delimiter)
+        if self._table._count < self._table._maxsize:
+            self[prefix] = joins
+        return joins
+
+
+class _Joins(dict):
+    """The flat keys of the children of a prefix in a :class:`KeyTable`,
+    joining and caching the flat key of each key segment when it is first
+    looked up, so that looking it up again is a single dict lookup.
+
+    """
+
+    __slots__ = ('_delimiter', '_prefix', '_table')
+
+    def __init__(self, table: KeyTable, prefix: str, delimiter: str) -> None:
+        super().__init__()
+        self._delimiter = delimiter
+        self._prefix = prefix
+        self._table = table
+
+    def __missing__(self, key: typing.Any) -> str:
+        """Join the flat key of key, caching it if key is a :class:`str`
+        and the table is not full.
+
+        :param mixed key: The key segment
+        :rtype: str
+
+        """
+        joined = self._delimiter.join([self._prefix, str(key)])
+        if type(key) is str and self._table._count < self._table._maxsize:
+            self[key] = joined
+            self._table._count += 1
+        return joined
+
+
+class MappedFlatDict(collections.abc.Mapping[str, typing.Any]):
+    """A read-only flat dictionary that memory maps an index written by
+    :meth:`FlatDict.dump_index`, so opening it does not parse or build
+    anything and the pages of the index are shared by every process that
+    maps it through the page cache.
+
+    Flat keys are found by binary search of the sorted offset table and
+    their values are unpickled when they are looked up. Looking up the key
+    of a branch returns a :class:`MappedFlatDict` of its items, sharing the
+    same mapping. Keys are iterated in lexicographic order.
+
+    :param path: The path of the index file
+    :type path: str or os.PathLike
+    :raises: ValueError
+
+    """
+
+    __slots__ = (
+        '_delimiter',
+        '_flatter',
+        '_hi',
+        '_lo',
+        '_map',
+        '_prefix',
+        '_table',
+    )
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+            self._map.close()
+            raise ValueError(f'{os.fspath(path)!r} is not a flat dictionary')
+        _magic, count, flatter, length = _INDEX_HEADER.unpack_from(self._map)
+        self._table = _INDEX_HEADER.size + length
+        self._delimiter = self._map[_INDEX_HEADER.size : self._table].decode(
+            'utf-8'
+        )
+        self._flatter = flatter
+        self._lo, self._hi, self._prefix = 0, count, b''
+
+    def __contains__(self, key: object) -> bool:
+        """Check to see if the key is the flat key of an item or of a
+        branch of items.
+
+        :param mixed key: The key to check for
+        :rtype: bool
+
+        """
+        if not isinstance(key, str):
+            return False
+        target = self._prefix + key.encode('utf-8')
+        offset = self._search(target)
+        if offset < self._hi and self._key(offset) == target:
+            return True
+        lo, hi = self._subtree(target + self._separator, offset)
+        return lo < hi
+
+    def __enter__(self) -> 'MappedFlatDict':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __getitem__(self, key: str) -> typing.Any:
+        """Get the value of the flat key, unpickling it from the index, or a
+        :class:`MappedFlatDict` of the items of a branch.
+
+        :param str key: The flat key to look up
+        :rtype: mixed
+        :raises: KeyError
+
+        """
+        if not isinstance(key, str):
+            raise KeyError(key)
+        target = self._prefix + key.encode('utf-8')
+        offset = self._search(target)
+        if offset < self._hi and self._key(offset) == target:
+            return self._value(offset)
+        target += self._separator
+        lo, hi = self._subtree(target, offset)
+        if lo == hi:
+            raise KeyError(key)
+        return self._branch(target, lo, hi)
+
+    def __iter__(self) -> collections.abc.Iterator[str]:
+        """Iterate over the flat keys in lexicographic order.
+
+        :rtype: Iterator
+
+        """
+        strip = len(self._prefix)
+        for offset in range(self._lo, self._hi):
+            yield self._key(offset)[strip:].decode('utf-8')
+
+    def __len__(self) -> int:
+        """Return the number of items.
+
+        :rtype: int
+
+        """
+        return self._hi - self._lo
+
+    def __repr__(self) -> str:
+        """Return the string representation of the instance.
+
+        :rtype: str
+
+        """
+        return f'<{self.__class__.__name__} id={id(self)} {self.as_dict()!r}>'
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        """Return the items as a nested :class:`dict`, rebuilding lists when
+        the index was written by a :class:`FlatterDict`. The index does not
+        keep the types of flattened sequences, so tuples and sets flattened
+        by a :class:`FlatterDict` are rebuilt as lists too.
+
+        :rtype: dict
+
+        """
+        return unflatten(
+            self.iter_prefix(''), self._delimiter, bool(self._flatter)
+        )
+
+    def close(self) -> None:
+        """Unmap the index. The branches looked up from it share the mapping
+        and can no longer be used either.
+
+        """
+        self._map.close()
+
+    def count_prefix(self, prefix: str) -> int:
+        """Return the number of items whose flat keys are prefix or start
+        with prefix and the delimiter, by binary search of the bounds.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: int
+
+        """
+        return len(range(*self._bounds(prefix)))
+
+    def iter_prefix(
+        self, prefix: str
+    ) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Iterate over the items whose flat keys are prefix or start with
+        prefix and the delimiter, in lexicographic order. The bounds are
+        found by binary search, so only the items returned are read. A
+        trailing delimiter on prefix is ignored.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: Iterator
+
+        """
+        strip = len(self._prefix)
+        for offset in range(*self._bounds(prefix)):
+            yield (
+                self._key(offset)[strip:].decode('utf-8'),
+                self._value(offset),
+            )
+
+    def _bounds(self, prefix: str) -> tuple[int, int]:
+        """Return the range of offsets of the items whose flat keys are
+        prefix or start with prefix and the delimiter.
+
+        :param str prefix: The flat key of the subtree
+        :rtype: tuple
+
+        """
+        prefix = prefix.removesuffix(self._delimiter)
+        if not prefix:
+            return self._lo, self._hi
+        target = self._prefix + prefix.encode('utf-8')
+        lo = self._search(target)
+        if lo < self._hi and self._key(lo) == target:
+            return lo, lo + 1
+        return self._subtree(target + self._separator, lo)
+
+    def _branch(self, prefix: bytes, lo: int, hi: int) -> 'MappedFlatDict':
+        """Return a :class:`MappedFlatDict` of the items from lo to hi that
+        shares the mapping, with prefix stripped from their keys.
+
+        :param bytes prefix: The encoded flat key and delimiter of the branch
+        :param int lo: The offset of the first item
+        :param int hi: The offset after the last item
+        :rtype: flatdict.MappedFlatDict
+
+        """
+        branch = self.__class__.__new__(self.__class__)
+        branch._map, branch._table = self._map, self._table
+        branch._delimiter, branch._flatter = self._delimiter, self._flatter
+        branch._lo, branch._hi, branch._prefix = lo, hi, prefix
+        return branch
+
+    def _key(self, offset: int) -> bytes:
+        """Return the encoded flat key of the item at offset.
+
+        :param int offset: The offset of the item
+        :rtype: bytes
+
+        """
+        start, _value = _INDEX_ENTRY.unpack_from(
+            self._map, self._table + offset * _INDEX_ENTRY.size
+        )
+        end, _value = _INDEX_ENTRY.unpack_from(
+            self._map, self._table + (offset + 1) * _INDEX_ENTRY.size
+        )
+        return self._map[start:end]
+
+    def _search(self, target: bytes, lo: int | None = None) -> int:
+        """Return the offset of the first item whose encoded flat key is not
+        less than target. UTF-8 never contains ``0xff``, so appending it to
+        a prefix bounds every key that starts with the prefix.
+
+        :param bytes target: The encoded flat key to search for
+        :param lo: The offset to start from, defaulting to the first item
+        :type lo: int or None
+        :rtype: int
+
+        """
+        lo, hi = self._lo if lo is None else lo, self._hi
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self._key(middle) < target:
+                lo = middle + 1
+            else:
+                hi = middle
+        return lo
+
+    def _subtree(self, prefix: bytes, lo: int) -> tuple[int, int]:
+        """Return the range of offsets of the items whose encoded flat keys
+        start with prefix, searching from lo. Keys of siblings that sort
+        between the key of the branch and prefix, such as ``a-x`` before
+        ``a:b``, are outside of the range.
+
+        :param bytes prefix: The encoded flat key and delimiter of a branch
+        :param int lo: The offset to start the search from
+        :rtype: tuple
+
+        """
+        lo = self._search(prefix, lo)
+        return lo, self._search(prefix + b'\xff', lo)
+
+    @property
+    def _separator(self) -> bytes:
+        """The encoded delimiter.
+
+        :rtype: bytes
+
+        """
+        return self._delimiter.encode('utf-8')
+
+    def _value(self, offset: int) -> typing.Any:
+        """Unpickle the value of the item at offset.
+
+        :param int offset: The offset of the item
+        :rtype: mixed
+
+        """
+        _key, start = _INDEX_ENTRY.unpack_from(
+            self._map, self._table + offset * _INDEX_ENTRY.size
+        )
+        _key, end = _INDEX_ENTRY.unpack_from(
+            self._map, self._table + (offset + 1) * _INDEX_ENTRY.size
+        )
+        return pickle.loads(self._map[start:end])  # noqa: S301
+
+
+def flatten_many(
+    records: collections.abc.Iterable[typing.Any],
+    delimiter: str = ':',
+    flatter: bool = False,
+    workers: int | None = None,
+    chunk_size: int = 256,
+) -> collections.abc.Iterator[dict[typing.Any, typing.Any]]:
+    """Flatten each of the nested records, yielding a :class:`dict` of the
+    flat keys and values of each, in the order of the records, as soon as
+    it is ready.
+
+    The items of each match those of ``FlatDict(record).items()``, or of
+    :class:`FlatterDict` when flatter is set, following the conventions of
+    :func:`iter_flatten` for empty values, but records are walked directly
+    without building a flat dictionary for them. Records with keys that
+    contain the delimiter, or values that are flat dictionaries, are
+    flattened through the flat dictionary class instead, so that they are
+    nested the same way.
+
+    When workers is given, chunks of chunk_size records are flattened by a
+    :class:`~concurrent.futures.ProcessPoolExecutor` with that many worker
+    processes. Records are read as chunks are submitted, with at most two
+    chunks per worker waiting at a time, so records can be streamed. Sets
+    flattened by :class:`FlatterDict` are numbered in the order the worker
+    iterates over them, which can differ from the order in this process.
+
+    :param iterable records: The nested records to flatten
+    :param str delimiter: The delimiter to join keys with
+    :param bool flatter: Flatten lists, tuples and sets as
+        :class:`FlatterDict` does
+    :param int workers: The number of worker processes to use, if any
+    :param int chunk_size: The number of records sent to a worker at once
+    :rtype: Iterator
+
+    """
+    if not workers:
+        for record in records:
+            yield _flatten_record(record, delimiter, flatter)
+        return
+    records = iter(records)
+    pending: collections.deque[concurrent.futures.Future] = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        try:
+            while chunk := list(itertools.islice(records, chunk_size)):
+                pending.append(
+                    executor.submit(_flatten_chunk, chunk, delimiter, flatter)
+                )
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _flatten_chunk(
+    records: list[typing.Any], delimiter: str, flatter: bool
+) -> list[dict[typing.Any, typing.Any]]:
+    """Flatten a chunk of records in a worker process for
+    :func:`flatten_many`.
+
+    :param list records: The nested records to flatten
+    :param str delimiter: The delimiter to join keys with
+    :param bool flatter: Flatten sequences as :class:`FlatterDict` does
+    :rtype: list
+
+    """
+    return [_flatten_record(record, delimiter, flatter) for record in records]
+
+
+def _flatten_record(
+    record: typing.Any, delimiter: str, flatter: bool
+) -> dict[typing.Any, typing.Any]:
+    """Flatten a single record for :func:`flatten_many` with an explicit
+    stack, falling back to the flat dictionary class for records that it
+    would nest differently.
+
+    :param mixed record: The nested record to flatten
+    :param str delimiter: The delimiter to join keys with
+    :param bool flatter: Flatten sequences as :class:`FlatterDict` does
+    :rtype: dict
+
+    """
+    cls = FlatterDict if flatter else FlatDict
+    children = _children(record, cls._ARRAYS)
+    if children is None:
+        return _flattened(cls, record, delimiter)
+    out: dict[typing.Any, typing.Any] = {}
+    stack: list[tuple[str | None, collections.abc.Iterator]] = [
+        (None, children)
+    ]
+    while stack:
+        prefix, children = stack[-1]
+        for key, value in children:
+            if isinstance(key, str) and delimiter in key:
+                return _flattened(cls, record, delimiter)
+            if prefix is not None:
+                key = delimiter.join([prefix, str(key)])
+            if type(value) in _SCALARS:
+                out[key] = value
+                continue
+            nested = _children(value, cls._ARRAYS)
+            if nested is None:
+                if isinstance(value, FlatDict) or isinstance(
+                    value, cls._COERCE
+                ):
+                    # Flat dictionaries and subclasses of the sequence
+                    # types are left to the flat dictionary class
+                    return _flattened(cls, record, delimiter)
+                out[key] = value
+            elif value:
+                stack.append((str(key), nested))
+                break
+            else:
+                out[key] = {} if isinstance(value, dict) else type(value)()
+        else:
+            stack.pop()
+    return out
+
+
+def _children(
+    value: typing.Any, arrays: tuple[type, ...]
+) -> collections.abc.Iterator[tuple[typing.Any, typing.Any]] | None:
+    """Return an iterator over the keys and values of value if it is a dict
+    or one of the sequence types that are flattened, otherwise ``None``.
+
+    :param mixed value: The value to check
+    :param tuple arrays: The sequence types that are flattened
+    :rtype: Iterator or None
+
+    """
+    if isinstance(value, dict):
+        return iter(value.items())
+    elif type(value) in arrays:
+        return ((str(key), item) for key, item in enumerate(value))
+    return None
+
+
+def _flattened(
+    cls: type[FlatDict], record: typing.Any, delimiter: str
+) -> dict[typing.Any, typing.Any]:
+    """Flatten a record by building a flat dictionary of cls for it, with
+    empty branches converted as :func:`iter_flatten` yields them.
+
+    :param type cls: The flat dictionary class
+    :param mixed record: The nested record to flatten
+    :param str delimiter: The delimiter to join keys with
+    :rtype: dict
+
+    """
+    return {k: _leaf(v) for k, v in cls(record, delimiter).items()}
+
+
+def to_columns(
+    records: collections.abc.Iterable[typing.Any],
+    delimiter: str = ':',
+    flatter: bool = False,
+    missing: typing.Any = MISSING,
+    as_numpy: bool = False,
+) -> dict[typing.Any, typing.Any]:
+    """Flatten the nested records into columns, returning a :class:`dict` of
+    each flat key to the sequence of its values, one per record, in the
+    order the keys are first seen.
+
+    Records are flattened by :func:`flatten_many`, so no flat dictionary is
+    built for them. Records that do not have a key hold missing in its
+    column. Columns of only :class:`int` values that fit in 64 bits, or of
+    only :class:`float` values, are returned as :class:`array.array` of
+    ``'q'`` or ``'d'``, every other column is a :class:`list`. When
+    as_numpy is set, the array columns are returned as NumPy arrays that
+    share their memory instead, which requires NumPy to be installed.
+
+    :param iterable records: The nested records to flatten
+    :param str delimiter: The delimiter to join keys with
+    :param bool flatter: Flatten lists, tuples and sets as
+        :class:`FlatterDict` does
+    :param mixed missing: The value for keys a record does not have
+    :param bool as_numpy: Return numeric columns as NumPy arrays
+    :rtype: dict
+    :raises: ImportError
+
+    """
+    numpy = None
+    if as_numpy:
+        import numpy
+    columns: dict[typing.Any, list[typing.Any]] = {}
+    count = 0
+    for count, items in enumerate(flatten_many(records, delimiter, flatter)):
+        for key, value in items.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [missing] * count
+            elif len(column) < count:
+                column.extend([missing] * (count - len(column)))
+            column.append(value)
+    count = count + 1 if columns else 0
+    for key, column in columns.items():
+        column.extend([missing] * (count - len(column)))
+        columns[key] = _column(column, numpy)
+    return columns
+
+
+def from_columns(
+    columns: collections.abc.Mapping[typing.Any, typing.Any],
+    delimiter: str = ':',
+    flatter: bool = False,
+    missing: typing.Any = MISSING,
+) -> list[dict[typing.Any, typing.Any]]:
+    """Rebuild the nested records from columns of flat keys, as returned by
+    :func:`to_columns`, leaving out the keys whose value is missing in a
+    record. Each record is nested by :func:`unflatten`, so lists flattened
+    by :class:`FlatterDict` are rebuilt when flatter is set.
+
+    :param mapping columns: The sequence of values of each flat key
+    :param str delimiter: The delimiter the keys are joined with
+    :param bool flatter: Rebuild lists from offset keyed dicts
+    :param mixed missing: The value for keys a record does not have
+    :rtype: list
+    :raises: TypeError
+    :raises: ValueError
+
+    """
+    keys = list(columns)
+    values = [
+        column.tolist() if hasattr(column, 'tolist') else column
+        for column in columns.values()
+    ]
+    if len({len(column) for column in values}) > 1:
+        raise ValueError('The columns must all have the same length')
+    return [
+        unflatten(
+            [
+                (key, value)
+                for key, value in zip(keys, row, strict=True)
+                if value is not missing
+            ],
+            delimiter,
+            flatter,
+        )
+        for row in zip(*values, strict=True)
+    ]
+
+
+def _column(values: list[typing.Any], numpy: typing.Any) -> typing.Any:
+    """Return the values of a column as an :class:`array.array` when they
+    are all :class:`int` values that fit in 64 bits or all :class:`float`
+    values, converted to a NumPy array when numpy is the module, otherwise
+    the list of values itself.
+
+    :param list values: The values of the column
+    :param module numpy: The NumPy module, or ``None``
+    :rtype: list, array.array or numpy.ndarray
+
+    """
+    kinds = set(map(type, values))
+    if kinds == {int}:
+        try:
+            column = array.array('q', values)
+        except OverflowError:
+            return values
+    elif kinds == {float}:
+        column = array.array('d', values)
+    else:
+        return values
+    if numpy is not None:
+        return numpy.frombuffer(column, dtype=column.typecode)
+    return column
+
+
+def iter_flatten(
+    fp: typing.IO[str] | typing.IO[bytes],
+    delimiter: str = ':',
+    flatter: bool = False,
+    chunk_size: int = 65536,
+) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+    """Read a JSON document from fp incrementally, yielding each
+    ``(delimited_key, value)`` pair as soon as it has been parsed, so large
+    documents can be filtered or indexed without loading them.
+
+    Keys follow the conventions of :meth:`FlatDict.items`: values are
+    scalars, except for empty objects which are yielded as ``{}``. Arrays are
+    yielded whole, as :class:`FlatDict` does not flatten them, unless flatter
+    is set, in which case they are flattened by offset as
+    :class:`FlatterDict` does and empty arrays are yielded as ``[]``.
+
+    :param file fp: A text or binary file object containing the document
+    :param str delimiter: The delimiter to join keys with
+    :param bool flatter: Flatten arrays as :class:`FlatterDict` does
+    :param int chunk_size: The number of characters or bytes to read at once
+    :rtype: Iterator
+    :raises: json.JSONDecodeError
+    :raises: ValueError
+
+    """
+    events = _JSONReader(fp, chunk_size).events()
+    kind, _value = next(events)
+    if kind != 'start_map' and not (flatter and kind == 'start_array'):
+        raise ValueError('The JSON document must contain an object')
+    # Each frame is [prefix, key or offset, is array, has children]
+    frames: list[list[typing.Any]] = [[None, 0, kind == 'start_array', False]]
+    for kind, value in events:
+        frame = frames[-1]
+        if kind == 'key':
+            frame[1] = value
+            continue
+        elif kind in {'end_map', 'end_array'}:
+            frames.pop()
+            if frames and not frame[3]:
+                yield frame[0], [] if frame[2] else {}
+            continue
+        frame[3] = True
+        key = str(frame[1]) if frame[2] else frame[1]
+        if frame[2]:
+            frame[1] += 1
+        if frame[0] is not None:
+            key = delimiter.join([frame[0], key])
+        if kind == 'start_map' or (flatter and kind == 'start_array'):
+            frames.append([key, 0, kind == 'start_array', False])
+        elif kind == 'start_array':
+            yield key, _JSONReader.build(events, [])
+        else:
+            yield key, value
+
+
+def unflatten(
+    pairs: (
+        collections.abc.Mapping[typing.Any, typing.Any]
+        | collections.abc.Iterable[tuple[typing.Any, typing.Any]]
+    ),
+    delimiter: str = ':',
+    flatter: bool = False,
+) -> dict[str, typing.Any]:
+    """Build a nested :class:`dict` directly from ``(delimited_key, value)``
+    pairs in a single pass, without creating :class:`FlatDict` instances.
+
+    The nested dicts along the path of each key are kept, so when keys
+    arrive sorted or grouped a following key only resolves the part of its
+    path that differs. When flatter is set, nested dicts whose keys are all
+    offsets are rebuilt as lists, as :meth:`FlatterDict.as_dict` does.
+
+    :param iterable pairs: A mapping or iterable of key, value pairs
+    :param str delimiter: The delimiter the keys are joined with
+    :param bool flatter: Rebuild lists from offset keyed dicts
+    :rtype: dict
+    :raises: TypeError
+
+    """
+    if isinstance(pairs, collections.abc.Mapping):
+        pairs = pairs.items()
+    out: dict[str, typing.Any] = {}
+    created: list[tuple[dict[str, typing.Any], str, dict[str, typing.Any]]]
+    created = []
+    path: list[str] = []
+    nodes = [out]
+    for key, value in pairs:
+        parts = key.split(delimiter) if isinstance(key, str) else [key]
+        depth, limit = 0, min(len(path), len(parts) - 1)
+        while depth < limit and path[depth] == parts[depth]:
+            depth += 1
+        del path[depth:], nodes[depth + 1 :]
+        node = nodes[-1]
+        for part in parts[depth:-1]:
+            child = node.get(part, NO_DEFAULT)
+            if child is NO_DEFAULT:
+                child = node[part] = {}
+                if flatter:
+                    created.append((node, part, child))
+            elif not isinstance(child, dict):
+                raise TypeError(f'Assignment to invalid type for key {key}')
+            node = child
+            path.append(part)
+            nodes.append(node)
+        node[parts[-1]] = value
+    _rebuild_lists(created)
+    return out
+
+
+def _rebuild_lists(
+    created: list[tuple[dict[str, typing.Any], str, dict[str, typing.Any]]],
+) -> None:
+    """Replace each created dict whose keys are exactly the offsets ``'0'``
+    to ``str(len - 1)`` with a list of its values ordered by offset. Dicts
+    with gaps, padded offsets or other keys are left as they are, so no
+    value is lost. Children are always created after their parents, so
+    walking them in reverse rebuilds the innermost lists first.
+
+    :param list created: The parent, key and dict of each created dict
+
+    """
+    for parent, key, child in reversed(created):
+        if parent.get(key) is not child or not child:
+            continue
+        offsets = [str(offset) for offset in range(len(child))]
+        if all(offset in child for offset in offsets):
+            parent[key] = [child[offset] for offset in offsets]
+
+
+class _JSONReader:
+    """Incremental JSON tokenizer that reads fp in chunks and produces
+    ``(event, value)`` pairs without recursion, so neither the size nor the
+    depth of the document is limited by memory or the recursion limit.
+
+    """
+
+    __slots__ = (
+        '_buffer',
+        '_chunk_size',
+        '_decoder',
+        '_eof',
+        '_fp',
+        '_offset',
+    )
+
+    LITERALS: typing.ClassVar[dict[str, typing.Any]] = {
+        'true': True,
+        'false': False,
+        'null': None,
+        'NaN': float('nan'),
+        'Infinity': float('inf'),
+        '-Infinity': float('-inf'),
+    }
+
+    def __init__(
+        self, fp: typing.IO[str] | typing.IO[bytes], chunk_size: int
+    ) -> None:
+        self._buffer = ''
+        self._chunk_size = chunk_size
+        self._decoder: codecs.IncrementalDecoder | None = None
+        self._eof = False
+        self._fp = fp
+        self._offset = 0
+
+    @staticmethod
+    def build(
+        events: collections.abc.Iterator[tuple[str, typing.Any]],
+        root: dict[str, typing.Any] | list[typing.Any],
+    ) -> typing.Any:
+        """Consume events up to the end of the container that was just
+        started, building it into root.
+
+        :param Iterator events: The remaining events
+        :param mixed root: An empty dict or list for the started container
+        :rtype: mixed
+
+        """
+        stack: list[typing.Any] = [root]
+        key = None
+        for kind, value in events:
+            if kind == 'key':
+                key = value
+                continue
+            elif kind in {'end_map', 'end_array'}:
+                stack.pop()
+                if not stack:
+                    return root
+                continue
+            if kind == 'start_map':
+                value = {}
+            elif kind == 'start_array':
+                value = []
+            if isinstance(stack[-1], list):
+                stack[-1].append(value)
+            else:
+                stack[-1][key] = value
+            if kind in {'start_map', 'start_array'}:
+                stack.append(value)
+        raise json.JSONDecodeError('Unexpected end of document', '', 0)
+
+    def events(self) -> collections.abc.Iterator[tuple[str, typing.Any]]:
+        """Parse the document, yielding ``start_map``, ``key``, ``end_map``,
+        ``start_array``, ``end_array`` and ``value`` events.
+
+        :rtype: Iterator
+        :raises: json.JSONDecodeError
+
+        """
+        stack: list[str] = []
+        expect_value = True
+        while expect_value or stack:
+            if expect_value:
+                events, expect_value = self._open(stack)
+                yield from events
+                continue
+            char = self._peek()
+            if char == ',':
+                self._offset += 1
+                if stack[-1] == '}':
+                    yield 'key', self._key()
+                expect_value = True
+            elif char == stack[-1]:
+                self._offset += 1
+                stack.pop()
+                yield _EVENTS[char], None
+            else:
+                raise self._error(f"Expecting ',' delimiter or {stack[-1]!r}")
+        if self._peek():
+            raise self._error('Extra data')
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buffer, self._offset)
+
+    def _fill(self) -> bool:
+        """Append the next chunk of fp to the buffer, discarding what has
+        already been consumed. Returns ``False`` once fp is exhausted.
+
+        :rtype: bool
+
+        """
+        chunk = ''
+        while not chunk:
+            if self._eof:
+                return False
+            raw = self._fp.read(self._chunk_size)
+            self._eof = not raw
+            if isinstance(raw, bytes):
+                # A read can end part way through a multi-byte character,
+                # which decodes to nothing until the rest of it is read
+                if self._decoder is None:
+                    self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+                raw = self._decoder.decode(raw, final=self._eof)
+            chunk = raw
+        self._buffer = self._buffer[self._offset :] + chunk
+        self._offset = 0
+        return True
+
+    def _key(self) -> str:
+        """Parse an object key and the colon that follows it
+
+        :rtype: str
+        :raises: json.JSONDecodeError
+
+        """
+        if self._peek() != '"':
+            raise self._error('Expecting property name enclosed in quotes')
+        key = self._string()
+        if self._peek() != ':':
+            raise self._error("Expecting ':' delimiter")
+        self._offset += 1
+        return key
+
+    def _open(
+        self, stack: list[str]
+    ) -> tuple[list[tuple[str, typing.Any]], bool]:
+        """Parse the start of the value at the current offset, returning its
+        events and whether a value is expected next. Containers that are not
+        empty are left open by pushing their closing character onto stack.
+
+        :param list stack: The closing characters of the open containers
+        :rtype: tuple
+        :raises: json.JSONDecodeError
+
+        """
+        char = self._peek()
+        if char not in {'{', '['}:
+            return [('value', self._scalar(char))], False
+        close = '}' if char == '{' else ']'
+        self._offset += 1
+        if self._peek() == close:
+            self._offset += 1
+            return [(_EVENTS[char], None), (_EVENTS[close], None)], False
+        stack.append(close)
+        if char == '{':
+            return [('start_map', None), ('key', self._key())], True
+        return [('start_array', None)], True
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character without consuming
+        it, or an empty string at the end of the document.
+
+        :rtype: str
+
+        """
+        while True:
+            buffer, offset = self._buffer, self._offset
+            if offset < len(buffer) and buffer[offset] not in _SPACE:
+                return buffer[offset]
+            self._offset = offset = _WHITESPACE.match(buffer, offset).end()
+            if offset < len(buffer):
+                return buffer[offset]
+            if not self._fill():
+                return ''
+
+    def _scalar(self, char: str) -> typing.Any:
+        """Parse the string, number or literal starting with char
+
+        :param str char: The first character of the value
+        :rtype: mixed
+        :raises: json.JSONDecodeError
+
+        """
+        if char == '"':
+            return self._string()
+        # Numbers and literals are short, so make sure one is not cut off
+        # by the end of the buffer before matching it
+        while not self._eof and (
+            len(self._buffer) - self._offset < 10
+            or not _DELIMITERS.search(self._buffer, self._offset)
+        ):
+            self._fill()
+        match = _NUMBER.match(self._buffer, self._offset)
+        if match:
+            integer, fraction, exponent = match.groups()
+            self._offset = match.end()
+            if fraction or exponent:
+                return float(integer + (fraction or '') + (exponent or ''))
+            return int(integer)
+        for literal, value in self.LITERALS.items():
+            if self._buffer.startswith(literal, self._offset):
+                self._offset += len(literal)
+                return value
+        raise self._error('Expecting value')
+
+    def _string(self) -> str:
+        """Parse the string starting at the current offset, reading more of
+        fp until the closing quote is in the buffer.
+
+        :rtype: str
+        :raises: json.JSONDecodeError
+
+        """
+        while True:
+            try:
+                value, self._offset = json.decoder.scanstring(
+                    self._buffer, self._offset + 1
+                )
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+            else:
+                return value
+
+
+_ANY_SEGMENT = object()
+_ANY_SEGMENTS = object()
+_GLOB = re.compile(r'[*?[]')
+_INDEX_ENTRY = struct.Struct('<QQ')
+_INDEX_HEADER = struct.Struct('<8sQ?H')
+_INDEX_MAGIC = b'FLATDICT'
+_JOURNALS: dict[int, ChangeJournal] = {}
+_EVENTS = {
+    '{': 'start_map',
+    '}': 'end_map',
+    '[': 'start_array',
+    ']': 'end_array',
+}
+_DELIMITERS = re.compile(r'[\s,\]}]')
+_NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+_SCALARS = frozenset({bool, bytes, float, int, str, type(None)})
+_SPACE = frozenset(' \t\n\r')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
@@ -0,0 +1,342 @@
+"""Benchmarks for :class:`~flatdict.FlatDict` and
+:class:`~flatdict.FlatterDict` operations, emitting JSON so that results can
+be compared across releases.
+
+Run with ``python -m flatdict.bench``, passing ``--help`` for the options.
+
+"""
+
+import argparse
+import collections.abc
+import importlib.metadata
+import json
+import pickle
+import platform
+import sys
+import threading
+import time
+import timeit
+import typing
+
+import flatdict
+
+DEFAULT_SIZES = (100, 1000, 10000)
+DEPTH = 16
+SAMPLE = 1000
+WRITES = 10
+
+Document = dict[str, typing.Any]
+
+
+def wide(size: int) -> Document:
+    """Return a document with size leaves spread over two levels.
+
+    :param int size: The number of leaves
+    :rtype: dict
+
+    """
+    width = max(int(size**0.5), 1)
+    document: Document = {}
+    for offset in range(size):
+        document.setdefault(f'group{offset // width}', {})[f'key{offset}'] = (
+            offset
+        )
+    return document
+
+
+def deep(size: int) -> Document:
+    """Return a document with size leaves held in chains that are
+    :data:`DEPTH` levels deep.
+
+    :param int size: The number of leaves
+    :rtype: dict
+
+    """
+    document: Document = {}
+    for chain in range(max(size // DEPTH, 1)):
+        node: Document = {}
+        document[f'chain{chain}'] = node
+        for level in range(DEPTH - 1):
+            node['value'] = level
+            node['next'] = node = {}
+        node['value'] = DEPTH
+    return document
+
+
+def lists(size: int) -> Document:
+    """Return a list-heavy document with roughly size leaves once
+    flattened by :class:`~flatdict.FlatterDict`.
+
+    :param int size: The approximate number of leaves
+    :rtype: dict
+
+    """
+    return {
+        'records': [
+            {'id': offset, 'tags': ['red', 'blue']}
+            for offset in range(max(size // 3, 1))
+        ]
+    }
+
+
+SHAPES: dict[str, tuple[type[flatdict.FlatDict], typing.Callable]] = {
+    'wide': (flatdict.FlatDict, wide),
+    'deep': (flatdict.FlatDict, deep),
+    'lists': (flatdict.FlatterDict, lists),
+}
+
+
+def operations(
+    cls: type[flatdict.FlatDict], document: Document
+) -> dict[str, tuple[typing.Callable[[], typing.Any], int]]:
+    """Return the operations to time for a document, each as a callable
+    and the number of operations a single call performs.
+
+    :param type cls: The flat dictionary class to benchmark
+    :param dict document: The nested document to benchmark with
+    :rtype: dict
+
+    """
+    value = cls(document)
+    flat = dict(value.items())
+    pickled = pickle.dumps(value)
+    changed = value.copy()
+    changed['changed'] = True
+    keys = list(flat)[:: max(len(flat) // SAMPLE, 1)]
+    flatter = issubclass(cls, flatdict.FlatterDict)
+
+    def getitem() -> None:
+        for key in keys:
+            value[key]
+
+    def setitem() -> None:
+        for key in keys:
+            value[key] = 0
+
+    def contains() -> None:
+        for key in keys:
+            key in value  # noqa: B015
+
+    def iterate() -> None:
+        for _item in value.items():
+            pass
+
+    def set_delimiter() -> None:
+        value.set_delimiter('|')
+        value.set_delimiter(':')
+
+    return {
+        'construct': (lambda: cls(document), 1),
+        'getitem': (getitem, len(keys)),
+        'setitem': (setitem, len(keys)),
+        'contains': (contains, len(keys)),
+        'len': (lambda: len(value), 1),
+        'iterate': (iterate, 1),
+        'as_dict': (value.as_dict, 1),
+        'copy': (value.copy, 1),
+        'diff': (lambda: value.diff(changed), 1),
+        'dumps': (lambda: pickle.dumps(value), 1),
+        'flatten_many': (
+            lambda: list(flatdict.flatten_many([document], flatter=flatter)),
+            1,
+        ),
+        'loads': (lambda: pickle.loads(pickled), 1),  # noqa: S301
+        'set_delimiter': (set_delimiter, 1),
+        'update': (lambda: value.update(flat), 1),
+    }
+
+
+def threaded(
+    document: Document, threads: int, repeat: int, number: int | None = None
+) -> tuple[float, int]:
+    """Time threads sharing one :class:`~flatdict.ConcurrentFlatDict`, each
+    looking up number keys with one in every :data:`WRITES` being assigned
+    instead. Returns the best wall clock time per operation across all of
+    the threads, so the throughput is its inverse, and the number of
+    operations each thread performed.
+
+    :param dict document: The nested document to benchmark with
+    :param int threads: The number of threads
+    :param int repeat: How many times to repeat the measurement
+    :param int number: The number of operations per thread
+    :rtype: tuple
+
+    """
+    value = flatdict.ConcurrentFlatDict(document)
+    flat = list(value.keys())
+    keys = flat[:: max(len(flat) // SAMPLE, 1)] or ['missing']
+    number = number or SAMPLE * 10
+
+    def work(barrier: threading.Barrier, offset: int) -> None:
+        barrier.wait()
+        for operation in range(offset, offset + number):
+            key = keys[operation % len(keys)]
+            if operation % WRITES:
+                value.get(key)
+            else:
+                value[key] = operation
+
+    best = float('inf')
+    for _repetition in range(repeat):
+        barrier = threading.Barrier(threads + 1)
+        workers = [
+            threading.Thread(target=work, args=(barrier, thread))
+            for thread in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        best = min(best, time.perf_counter() - started)
+    return best / (threads * number), number
+
+
+def measure(
+    function: typing.Callable[[], typing.Any],
+    repeat: int,
+    number: int | None = None,
+) -> tuple[float, int]:
+    """Time function, returning the best time for a single call and the
+    number of calls made per repetition. When number is not given it is
+    picked with :meth:`timeit.Timer.autorange`.
+
+    :param callable function: The function to time
+    :param int repeat: How many times to repeat the measurement
+    :param int number: The number of calls per repetition
+    :rtype: tuple
+
+    """
+    timer = timeit.Timer(function)
+    if number is None:
+        number, _elapsed = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number, number
+
+
+def run(
+    shapes: collections.abc.Iterable[str] = tuple(SHAPES),
+    sizes: collections.abc.Iterable[int] = DEFAULT_SIZES,
+    repeat: int = 5,
+    number: int | None = None,
+    selected: collections.abc.Container[str] | None = None,
+    threads: collections.abc.Iterable[int] = (),
+) -> list[dict[str, typing.Any]]:
+    """Run the benchmarks, returning one result per shape, size and
+    operation, and per thread count for the ``threaded`` operation, which
+    is only run when thread counts are given.
+
+    :param iterable shapes: The document shapes to benchmark
+    :param iterable sizes: The document sizes, in leaves
+    :param int repeat: How many times to repeat each measurement
+    :param int number: The number of calls per repetition
+    :param container selected: Only run these operations, if given
+    :param iterable threads: The thread counts to run ``threaded`` with
+    :rtype: list
+
+    """
+    results = []
+    for shape in shapes:
+        cls, factory = SHAPES[shape]
+        for size in sizes:
+            document = factory(size)
+            for name, (function, count) in operations(cls, document).items():
+                if selected is not None and name not in selected:
+                    continue
+                seconds, loops = measure(function, repeat, number)
+                results.append(
+                    {
+                        'shape': shape,
+                        'class': cls.__name__,
+                        'size': size,
+                        'operation': name,
+                        'seconds': seconds / count,
+                        'loops': loops,
+                        'operations': count,
+                    }
+                )
+            if selected is not None and 'threaded' not in selected:
+                continue
+            for count in threads:
+                seconds, loops = threaded(document, count, repeat, number)
+                results.append(
+                    {
+                        'shape': shape,
+                        'class': flatdict.ConcurrentFlatDict.__name__,
+                        'size': size,
+                        'operation': 'threaded',
+                        'threads': count,
+                        'seconds': seconds,
+                        'loops': loops,
+                        'operations': count * loops,
+                    }
+                )
+    return results
+
+
+def environment() -> dict[str, typing.Any]:
+    """Return details of the interpreter and package being benchmarked
+
+    :rtype: dict
+
+    """
+    try:
+        version = importlib.metadata.version('flatdict')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    return {
+        'flatdict': version,
+        'implementation': platform.python_implementation(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def write(document: dict[str, typing.Any], handle: typing.TextIO) -> None:
+    """Write the benchmark results document to handle as JSON
+
+    :param dict document: The environment and results to write
+    :param file handle: The text file to write to
+
+    """
+    json.dump(document, handle, indent=2)
+    handle.write('\n')
+
+
+def main(argv: collections.abc.Sequence[str] | None = None) -> None:
+    """Command line entry point for ``python -m flatdict.bench``
+
+    :param list argv: The command line arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m flatdict.bench', description=__doc__.split('\n\n')[0]
+    )
+    parser.add_argument(
+        '--shape', action='append', choices=list(SHAPES), dest='shapes'
+    )
+    parser.add_argument('--size', action='append', type=int, dest='sizes')
+    parser.add_argument('--operation', action='append', dest='operations')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int)
+    parser.add_argument('--threads', action='append', type=int, default=[])
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+    results = run(
+        args.shapes or tuple(SHAPES),
+        args.sizes or DEFAULT_SIZES,
+        args.repeat,
+        args.number,
+        args.operations,
+        args.threads,
+    )
+    document = {'environment': environment(), 'results': results}
+    if args.output is None or args.output == '-':
+        write(document, sys.stdout)
+        return
+    with open(args.output, 'w', encoding='utf-8') as handle:
+        write(document, handle)
+
+
+if __name__ == '__main__':
+    main()
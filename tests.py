@@ -3,17 +3,57 @@ Unittests for flatdict.FlatDict
 
 """
 
+import collections
+import contextlib
+import copy
+import functools
+import gc
+import importlib.util
+import io
+import json
 import pickle
+import platform
 import random
+import tempfile
+import threading
 import typing
 import unittest
+import unittest.mock
 import uuid
 
 import flatdict
+from flatdict import bench
+
+
+class Tagged(flatdict.FlatDict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag = 'tagged'
+
+
+class TaggedFlatter(flatdict.FlatterDict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag = 'tagged'
+
+
+class TaggedConcurrent(flatdict.ConcurrentFlatDict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag = 'tagged'
+
+
+class Keyed(flatdict.FlatDict):
+    KEY_TABLE = flatdict.KeyTable()
+
+
+class KeyedFlatter(flatdict.FlatterDict):
+    KEY_TABLE = Keyed.KEY_TABLE
 
 
 class FlatDictTests(unittest.TestCase):
     TEST_CLASS = flatdict.FlatDict
+    TAGGED_CLASS = Tagged
 
     FLAT_EXPECTATION: typing.ClassVar[dict] = {
         'foo:bar:baz': 0,
@@ -131,6 +171,15 @@ class FlatDictTests(unittest.TestCase):
     def test_as_dict(self):
         self.assertDictEqual(self.value.as_dict(), self.AS_DICT)
 
+    def test_as_dict_deep_nesting(self):
+        value = self.TEST_CLASS({'leaf': 1})
+        for _offset in range(10000):
+            value = self.TEST_CLASS({'child': value})
+        out = value.as_dict()
+        for _offset in range(10000):
+            out = out['child']
+        self.assertDictEqual(out, {'leaf': 1})
+
     def test_cast_to_dict(self):
         self.assertDictEqual(dict(self.value), self.FLAT_EXPECTATION)
 
@@ -190,6 +239,93 @@ class FlatDictTests(unittest.TestCase):
         self.assertNotEqual(id(self.value), id(copied))
         self.assertDictEqual(self.value.as_dict(), copied.as_dict())
 
+    def test_copy_is_independent(self):
+        expectation, size = self.value.as_dict(), len(self.value)
+        copied = self.value.copy()
+        copied['foo:bar:baz'] = 10
+        del copied['garply:qux']
+        copied['new:key'] = 1
+        self.assertDictEqual(self.value.as_dict(), expectation)
+        self.value['foo:grault:qux'] = 20
+        self.value.clear()
+        self.assertEqual(copied['foo:bar:baz'], 10)
+        self.assertEqual(copied['foo:grault:qux'], 4)
+        self.assertEqual(len(copied), size)
+        self.assertEqual(len(self.value), 0)
+
+    def test_copy_child_is_independent(self):
+        child = self.value['foo']
+        copied = self.value.copy()
+        copied['foo']['bar']['baz'] = 10
+        child['bar:qux'] = 11
+        self.assertEqual(self.value['foo:bar:baz'], 0)
+        self.assertEqual(self.value['foo:bar:qux'], 11)
+        self.assertEqual(copied['foo:bar:baz'], 10)
+        self.assertEqual(copied['foo:bar:qux'], 1)
+        self.assertEqual(len(copied), len(self.value))
+
+    def test_copy_held_child_is_independent(self):
+        child = self.value['foo']
+        size = len(self.value)
+        copied = self.value.copy()
+        child['bar:qux'] = 11
+        child['new'] = 1
+        self.assertEqual(copied['foo:bar:qux'], 1)
+        self.assertNotIn('foo:new', copied)
+        self.assertEqual(len(copied), size)
+        self.assertEqual(len(copied), len(list(copied)))
+        self.assertEqual(len(self.value), len(list(self.value)))
+
+    def test_copy_handed_out_empty_branch_is_independent(self):
+        handouts = {
+            'items': lambda value: dict(value.items())['foo:e'],
+            'iter_paths': lambda value: dict(value.iter_paths())[('foo', 'e')],
+            'iter_prefix': lambda value: dict(value.iter_prefix('foo'))[
+                'foo:e'
+            ],
+            'iter_match': lambda value: dict(value.iter_match('foo:*'))[
+                'foo:e'
+            ],
+            'iter_range': lambda value: dict(value.iter_range())['foo:e'],
+        }
+        for name, handout in handouts.items():
+            for side in ('original', 'copy'):
+                with self.subTest(handout=name, side=side):
+                    value = self.TEST_CLASS({'foo': {'bar': 1, 'e': {}}})
+                    copied = value.copy()
+                    changed, other = (
+                        (value, copied)
+                        if side == 'original'
+                        else (copied, value)
+                    )
+                    handout(changed)['x'] = 1
+                    self.assertNotIn('foo:e:x', other)
+                    self.assertEqual(len(other), 2)
+                    self.assertEqual(len(changed), len(list(changed)))
+
+    def test_copy_of_copy(self):
+        first = self.value.copy()
+        second = first.copy()
+        first['garply:foo'] = 1
+        second['garply:foo'] = 2
+        self.assertEqual(self.value['garply:foo'], 0)
+        self.assertEqual(first['garply:foo'], 1)
+        self.assertEqual(second['garply:foo'], 2)
+
+    def test_copy_set_delimiter(self):
+        copied = self.value.copy()
+        copied.set_delimiter('|')
+        self.assertIn('foo|bar|baz', copied)
+        self.assertIn('foo:bar:baz', self.value)
+        self.assertNotIn('foo|bar|baz', self.value)
+
+    def test_copy_subclass_runs_init(self):
+        value = self.TAGGED_CLASS(self.VALUES)
+        copied = value.copy()
+        self.assertIsInstance(copied, self.TAGGED_CLASS)
+        self.assertEqual(copied.tag, 'tagged')
+        self.assertEqual(copied, value)
+
     def test_eq(self):
         self.assertEqual(self.value, self.value.copy())
 
@@ -204,13 +340,53 @@ class FlatDictTests(unittest.TestCase):
         value = self.TEST_CLASS({'foo': ['bar']})
         self.assertTrue(self.value != value)
 
+    def test_eq_does_not_convert(self):
+        document = {'foo': {'bar': 1, 'baz': [1, {'qux': 2}]}, 'fred': 3}
+        value = self.TEST_CLASS(document)
+        with unittest.mock.patch.object(
+            self.TEST_CLASS, 'as_dict', side_effect=AssertionError
+        ):
+            self.assertEqual(value, document)
+            self.assertEqual(value, self.TEST_CLASS(document))
+            self.assertNotEqual(value, {'foo': {'bar': 1}, 'fred': 3})
+            self.assertNotEqual(
+                value, {'foo': {'bar': 1, 'baz': 2}, 'fred': 4}
+            )
+            self.assertNotEqual(value, {**document, 'thud': 4})
+
+    def test_eq_nested_differences(self):
+        value = self.TEST_CLASS({'foo': {'bar': {'baz': 1}}})
+        self.assertNotEqual(value, {'foo': {'bar': {'baz': 2}}})
+        self.assertNotEqual(value, {'foo': {'bar': {'qux': 1}}})
+        self.assertNotEqual(value, {'foo': {'bar': 1}})
+        self.assertNotEqual(value, self.TEST_CLASS({'foo': {'bar': 1}}))
+        self.assertNotEqual(self.TEST_CLASS({'foo': {'bar': 1}}), value)
+        self.assertEqual(
+            value, self.TEST_CLASS({'foo': {'bar': {'baz': 1.0}}})
+        )
+
+    def test_eq_after_copy_changes(self):
+        copied = self.value.copy()
+        self.assertEqual(copied, self.value)
+        copied['foo:bar:baz'] = 10
+        self.assertNotEqual(copied, self.value)
+        self.assertNotEqual(self.value, copied)
+
+    def test_eq_deep_nesting(self):
+        values = [self.TEST_CLASS({'leaf': leaf}) for leaf in (1, 1, 2)]
+        for _offset in range(10000):
+            values = [self.TEST_CLASS({'child': value}) for value in values]
+        self.assertEqual(values[0], values[1])
+        self.assertEqual(values[0], values[1].as_dict())
+        self.assertNotEqual(values[0], values[2])
+
     def test_eq_value_error(self):
         with self.assertRaises(TypeError):
             self.assertTrue(self.value == 123)
 
     def test_iter_items(self):
         items = [(k, v) for k, v in self.value.iteritems()]
-        self.assertListEqual(self.value.items(), items)
+        self.assertListEqual(list(self.value.items()), items)
 
     def test_iterkeys(self):
         keys = sorted(self.value.iterkeys())
@@ -218,7 +394,36 @@ class FlatDictTests(unittest.TestCase):
 
     def test_itervalues(self):
         values = list(self.value.itervalues())
-        self.assertListEqual(values, self.value.values())
+        self.assertListEqual(values, list(self.value.values()))
+
+    def test_views_are_live(self):
+        keys, items, values = (
+            self.value.keys(),
+            self.value.items(),
+            self.value.values(),
+        )
+        self.value['corge:grault'] = 'quux'
+        self.assertIn('corge:grault', keys)
+        self.assertIn(('corge:grault', 'quux'), items)
+        self.assertIn('quux', values)
+        self.assertEqual(len(keys), len(self.KEYS) + 1)
+        self.assertEqual(len(items), len(self.KEYS) + 1)
+        self.assertEqual(len(values), len(self.KEYS) + 1)
+
+    def test_keys_set_operations(self):
+        keys = self.value.keys()
+        self.assertEqual(keys & {'fred', 'missing'}, {'fred'})
+        self.assertEqual(keys - set(self.KEYS), set())
+        self.assertEqual(keys | {'missing'}, {*self.KEYS, 'missing'})
+        self.assertTrue(keys.isdisjoint({'missing'}))
+        self.assertEqual(keys, set(self.KEYS))
+
+    def test_items_first_item(self):
+        key = self.KEYS[0]
+        self.assertEqual(
+            next(iter(self.value.items())),
+            (key, self.FLAT_EXPECTATION[key]),
+        )
 
     def test_pop(self):
         self.assertEqual(1, self.value.pop('foo:bar:qux'))
@@ -278,15 +483,611 @@ class FlatDictTests(unittest.TestCase):
         )
         self.assertEqual(self.value, expectation)
 
+    def test_update_shared_prefix(self):
+        value = self.TEST_CLASS()
+        value.update(
+            [
+                ('service:db:host', 'localhost'),
+                ('service:db:port', 5432),
+                ('service:db:pool:size', 10),
+                ('service:db', {'host': 'remote'}),
+                ('service:db:port', 6432),
+                ('service:name', 'api'),
+                ('debug', True),
+            ]
+        )
+        self.assertDictEqual(
+            value.as_dict(),
+            {
+                'service': {
+                    'db': {'host': 'remote', 'port': 6432},
+                    'name': 'api',
+                },
+                'debug': True,
+            },
+        )
+        self.assertEqual(len(value), 4)
+
+    def test_update_with_keywords(self):
+        value = self.TEST_CLASS()
+        value.update({'foo:bar': 1}, baz=2)
+        self.assertDictEqual(dict(value), {'foo:bar': 1, 'baz': 2})
+
+    def test_update_from_flat_dict(self):
+        value = self.TEST_CLASS()
+        value.update(self.value)
+        self.assertDictEqual(dict(value), self.FLAT_EXPECTATION)
+
+    def test_update_through_leaf_raises(self):
+        with self.assertRaises(TypeError):
+            self.value.update({'garply:foo:bar': 1})
+
     def test_set_delimiter_collision(self):
         value = self.TEST_CLASS({'foo_bar': {'qux': 1}})
         with self.assertRaises(ValueError):
             value.set_delimiter('_')
 
+    def test_tuple_keys(self):
+        for key in self.KEYS:
+            path = tuple(key.split(':'))
+            with self.subTest(key=key):
+                self.assertIn(path, self.value)
+                self.assertEqual(self.value[path], self.value[key])
+        self.assertEqual(self.value[('foo', 'bar')], self.value['foo:bar'])
+        self.assertIn(('foo',), self.value)
+        self.assertNotIn(('foo', 'missing'), self.value)
+        self.assertNotIn(('fred', 'missing'), self.value)
+        with self.assertRaises(KeyError):
+            self.value[('foo', 'missing')]
+
+    def test_tuple_keys_change(self):
+        value = self.TEST_CLASS()
+        value[('foo', 'bar')] = 1
+        value[('foo', 'baz', 'qux')] = {'corge': 2}
+        value.update([(('foo', 'baz', 'grault'), 3), (('fred',), 4)])
+        self.assertDictEqual(
+            value.as_dict(),
+            {
+                'foo': {'bar': 1, 'baz': {'qux': {'corge': 2}, 'grault': 3}},
+                'fred': 4,
+            },
+        )
+        del value[('foo', 'baz', 'qux', 'corge')]
+        del value[('fred',)]
+        self.assertDictEqual(
+            value.as_dict(), {'foo': {'bar': 1, 'baz': {'grault': 3}}}
+        )
+        self.assertEqual(len(value), 2)
+        with self.assertRaises(TypeError):
+            value[('foo', 'bar', 'baz')] = 1
+
+    def test_tuple_key_errors(self):
+        with self.assertRaises(ValueError):
+            self.value[('foo', 'bar:baz')] = 1
+        with self.assertRaises(ValueError):
+            self.value.update({('foo', 'bar:baz'): 1})
+        self.assertNotIn((), self.value)
+        with self.assertRaises(KeyError):
+            self.value[()]
+        with self.assertRaises(KeyError):
+            self.value[()] = 1
+        with self.assertRaises(KeyError):
+            del self.value[('foo', 'missing')]
+
+    def test_iter_paths(self):
+        paths = list(self.value.iter_paths())
+        self.assertListEqual(
+            [':'.join(path) for path, _value in paths], list(self.value)
+        )
+        self.assertListEqual(
+            [value for _path, value in paths], list(self.value.values())
+        )
+        value = self.TEST_CLASS({'foo': {1: {'bar': 2}}})
+        self.assertListEqual(
+            list(value.iter_paths()), [(('foo', 1, 'bar'), 2)]
+        )
+        self.assertEqual(value[('foo', 1, 'bar')], 2)
+
     def test_pickling(self):
         pickled = pickle.dumps(self.value)
         self.assertEqual(pickle.loads(pickled), self.value)
 
+    def test_pickling_restores_structure(self):
+        value = self.TEST_CLASS(
+            {'foo': {'bar': 1, 'empty': {}}}, '|', collections.OrderedDict
+        )
+        restored = pickle.loads(pickle.dumps(value))
+        self.assertIsInstance(restored, self.TEST_CLASS)
+        self.assertIsInstance(restored._values, collections.OrderedDict)
+        self.assertEqual(restored._delimiter, '|')
+        self.assertEqual(len(restored), 2)
+        self.assertDictEqual(restored.as_dict(), value.as_dict())
+        restored['foo|baz'] = 2
+        del restored['foo|empty']
+        self.assertEqual(len(restored), 2)
+        self.assertEqual(len(value), 2)
+
+    def test_pickling_subclass_runs_init(self):
+        value = self.TAGGED_CLASS(self.VALUES)
+        restored = pickle.loads(pickle.dumps(value))
+        self.assertIsInstance(restored, self.TAGGED_CLASS)
+        self.assertEqual(restored.tag, 'tagged')
+        self.assertDictEqual(restored.as_dict(), value.as_dict())
+
+    def test_pickling_view(self):
+        view = self.TEST_CLASS.view(self._view_values())
+        restored = pickle.loads(pickle.dumps(view))
+        self.assertDictEqual(restored.as_dict(), view.as_dict())
+
+    def test_len(self):
+        self.assertEqual(len(self.value), len(self.KEYS))
+
+    def test_iter_prefix(self):
+        expectation = [
+            (key, self.value[key])
+            for key in self.value.keys()
+            if key.startswith('foo:bar:')
+        ]
+        self.assertListEqual(
+            list(self.value.iter_prefix('foo:bar')), expectation
+        )
+        self.assertListEqual(
+            list(self.value.iter_prefix('foo:bar:')), expectation
+        )
+        self.assertListEqual(
+            list(self.value.iter_prefix('fred')), [('fred', 4)]
+        )
+        self.assertListEqual(list(self.value.iter_prefix('foo:ba')), [])
+        self.assertListEqual(list(self.value.iter_prefix('fred:x')), [])
+        self.assertListEqual(
+            list(self.value.iter_prefix('')), list(self.value.items())
+        )
+
+    def test_count_prefix(self):
+        for prefix in ('foo', 'foo:bar', 'garply:qux', 'fred', 'foo:ba', ''):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    self.value.count_prefix(prefix),
+                    len(list(self.value.iter_prefix(prefix))),
+                )
+        self.assertEqual(self.value.count_prefix('garply:qux'), 1)
+
+    def test_pop_prefix(self):
+        size = len(self.value)
+        expectation = dict(self.value.iter_prefix('foo'))
+        self.assertDictEqual(self.value.pop_prefix('foo:'), expectation)
+        self.assertNotIn('foo', self.value)
+        self.assertEqual(len(self.value), size - len(expectation))
+        self.assertDictEqual(self.value.pop_prefix('foo'), {})
+        self.assertDictEqual(
+            self.value.pop_prefix('garply:qux'), {'garply:qux:corge': 3}
+        )
+        self.assertNotIn('garply:qux', self.value)
+
+    def test_prefix_on_view(self):
+        view = self.TEST_CLASS.view(self._view_values())
+        self.assertListEqual(
+            list(view.iter_prefix('foo:bar')),
+            list(self.value.iter_prefix('foo:bar')),
+        )
+        self.assertEqual(view.count_prefix('garply'), 4)
+
+    def test_iter_match(self):
+        for pattern, expectation in (
+            ('foo:*:baz', ['foo:bar:baz', 'foo:grault:baz']),
+            (
+                '**:corge',
+                ['foo:bar:corge', 'foo:grault:corge', 'garply:qux:corge'],
+            ),
+            ('garply:ba?', ['garply:bar', 'garply:baz']),
+            ('*:qux:*', ['garply:qux:corge']),
+            ('fred', ['fred']),
+            ('foo:bar', []),
+            ('missing:**', []),
+        ):
+            with self.subTest(pattern=pattern):
+                self.assertListEqual(
+                    list(self.value.iter_match(pattern)),
+                    [(key, self.value[key]) for key in expectation],
+                )
+        self.assertListEqual(
+            list(self.value.iter_match('**')), list(self.value.items())
+        )
+        self.assertListEqual(
+            list(self.value.iter_match('**:*:**')), list(self.value.items())
+        )
+
+    def test_iter_match_delimiter(self):
+        self.value.set_delimiter('.')
+        self.assertListEqual(
+            [key for key, _value in self.value.iter_match('foo.*.qux')],
+            ['foo.bar.qux', 'foo.grault.qux'],
+        )
+        self.assertListEqual(list(self.value.iter_match('foo:*:qux')), [])
+
+    def test_iter_match_view(self):
+        view = self.TEST_CLASS.view(self._view_values())
+        self.assertListEqual(
+            list(view.iter_match('**:baz')),
+            list(self.value.iter_match('**:baz')),
+        )
+
+    def test_pattern_cache_is_bounded(self):
+        flatdict._compile_pattern.cache_clear()
+        for offset in range(flatdict.PATTERN_CACHE_SIZE + 10):
+            list(self.value.iter_match(f'foo:{offset}'))
+        list(self.value.iter_match('foo:0'))
+        info = flatdict._compile_pattern.cache_info()
+        self.assertEqual(info.currsize, flatdict.PATTERN_CACHE_SIZE)
+        self.assertEqual(info.misses, flatdict.PATTERN_CACHE_SIZE + 11)
+        list(self.value.iter_match('foo:0'))
+        self.assertEqual(flatdict._compile_pattern.cache_info().hits, 1)
+
+    def test_diff(self):
+        other = self.value.copy()
+        other['foo:bar:baz'] = 10
+        other['foo:bar:new'] = 11
+        del other['garply:foo']
+        other['fred'] = {'nested': 1}
+        del other['waldo']
+        patch = self.value.diff(other)
+        self.assertDictEqual(patch['added'], {'foo:bar:new': 11})
+        self.assertDictEqual(
+            patch['removed'],
+            {'garply:foo': 0, 'waldo': self.value['waldo']},
+        )
+        self.assertListEqual(sorted(patch['changed']), ['foo:bar:baz', 'fred'])
+        self.assertEqual(patch['changed']['foo:bar:baz'], (0, 10))
+        self.assertEqual(patch['changed']['fred'], (4, other['fred']))
+        self.value.apply_patch(patch)
+        self.assertEqual(self.value, other)
+        self.assertEqual(len(self.value), len(other))
+
+    def test_diff_equal(self):
+        expectation = {'added': {}, 'removed': {}, 'changed': {}}
+        self.assertDictEqual(self.value.diff(self.value.copy()), expectation)
+        self.assertDictEqual(
+            self.value.diff(self.TEST_CLASS(self.VALUES)), expectation
+        )
+        with self.assertRaises(TypeError):
+            self.value.diff(self.VALUES)
+
+    def test_diff_skips_shared_branches(self):
+        value = self.TEST_CLASS(bench.wide(10000))
+        other = value.copy()
+        other['group3:key300'] = -1
+        with unittest.mock.patch.object(
+            self.TEST_CLASS,
+            '_diff_level',
+            autospec=True,
+            side_effect=self.TEST_CLASS._diff_level,
+        ) as diff_level:
+            patch = value.diff(other)
+        self.assertEqual(diff_level.call_count, 2)
+        self.assertDictEqual(patch['changed'], {'group3:key300': (300, -1)})
+
+    @staticmethod
+    def _replay(mirror, changes):
+        for op, key, value in changes:
+            if op == 'set':
+                mirror[key] = value
+            elif op == 'delete':
+                mirror.pop(key, None)
+            elif op == 'clear':
+                mirror.clear()
+            else:
+                mirror.set_delimiter(value)
+
+    def _mutate(self):
+        self.value['foo:bar:baz'] = 10
+        self.value['fred'] = {'nested': 1}
+        self.value['foo:bar:baz'] = 11
+        del self.value['garply:foo']
+        self.value.pop('thud')
+        self.value.setdefault('new', 12)
+        self.value.update({'waldo:fred': 13, 'plain': 14, 'fred:nested': 15})
+        self.value.pop_prefix('garply:qux')
+
+    def test_journal(self):
+        mirror = self.value.copy()
+        journal = self.value.enable_journal()
+        self.assertIs(self.value.enable_journal(), journal)
+        self._mutate()
+        self.assertEqual(len(journal), 10)
+        self.assertEqual(journal.cursor, 10)
+        changes = journal.drain()
+        self.assertEqual(changes[0], ('set', 'foo:bar:baz', 10))
+        self.assertEqual(changes[3], ('delete', 'garply:foo', None))
+        self.assertEqual(len(journal), 0)
+        self._replay(mirror, changes)
+        self.assertEqual(mirror, self.value)
+        self.value.clear()
+        self.assertListEqual(journal.drain(), [('clear', None, None)])
+
+    def test_journal_coalesce(self):
+        mirror = self.value.copy()
+        journal = self.value.enable_journal(coalesce=True)
+        self._mutate()
+        self.assertEqual(len(journal), 9)
+        self.assertEqual(journal.cursor, 10)
+        changes = journal.drain()
+        self.assertEqual(changes[-1], ('delete', 'garply:qux', None))
+        self.assertEqual(
+            [change for change in changes if change[1] == 'foo:bar:baz'],
+            [('set', 'foo:bar:baz', 11)],
+        )
+        self._replay(mirror, changes)
+        self.assertEqual(mirror, self.value)
+        self.value['fred'] = 1
+        self.value.clear()
+        self.value['fred'] = 2
+        self.assertListEqual(
+            journal.drain(), [('clear', None, None), ('set', 'fred', 2)]
+        )
+
+    def test_journal_coalesce_nested_keys(self):
+        for steps in (
+            [('delete', 'fred'), ('set', 'fred:a', 1), ('delete', 'fred')],
+            [
+                ('set', 'garply:qux:corge', 5),
+                ('set', 'garply', {'new': 1}),
+                ('set', 'garply:qux:corge', 6),
+            ],
+            [
+                ('delete', 'foo:bar'),
+                ('set', 'foo:bar:baz', 1),
+                ('set', 'foo:bar', 2),
+                ('delete', 'foo'),
+            ],
+            [
+                ('set', 'a:b', 1),
+                ('set', 'a:c', 2),
+                ('delete', 'a:b'),
+                ('set', ('a',), {'b': 3}),
+                ('set', 'a:b', 4),
+            ],
+        ):
+            with self.subTest(steps=steps):
+                value = self.TEST_CLASS(self.VALUES)
+                mirror = value.copy()
+                journal = value.enable_journal(coalesce=True)
+                for op, key, *args in steps:
+                    if op == 'set':
+                        value[key] = args[0]
+                    else:
+                        del value[key]
+                changes = journal.drain()
+                self._replay(mirror, changes)
+                self.assertEqual(mirror, value)
+        value = self.TEST_CLASS(self.VALUES)
+        journal = value.enable_journal(coalesce=True)
+        del value['fred']
+        value['fred:a'] = 1
+        del value['fred']
+        self.assertListEqual(journal.drain(), [('delete', 'fred', None)])
+
+    def test_journal_records_values_as_assigned(self):
+        value = self.TEST_CLASS()
+        journal = value.enable_journal()
+        nested = self.TEST_CLASS({'y': 1})
+        plain = {'l': [1]}
+        value['x'] = nested
+        value['x:z'] = 2
+        value['p'] = plain
+        plain['l'].append(2)
+        nested['w'] = 3
+        self.assertListEqual(
+            journal.drain(),
+            [
+                ('set', 'x', {'y': 1}),
+                ('set', 'x:z', 2),
+                ('set', 'p', {'l': [1]}),
+            ],
+        )
+
+    def test_journal_coalesce_across_delimiter(self):
+        journal = self.value.enable_journal(coalesce=True)
+        self.value['a:b'] = 1
+        self.value.set_delimiter('.')
+        self.value['a:b'] = 2
+        self.assertListEqual(
+            journal.drain(),
+            [('set', 'a:b', 1), ('delimiter', None, '.'), ('set', 'a:b', 2)],
+        )
+
+    def test_journal_since(self):
+        journal = self.value.enable_journal()
+        self.value['fred'] = 1
+        cursor = journal.cursor
+        self.value['thud'] = 2
+        del self.value['xyzzy']
+        expectation = [('set', 'thud', 2), ('delete', 'xyzzy', None)]
+        self.assertListEqual(journal.since(cursor), expectation)
+        self.assertListEqual(journal.since(cursor), expectation)
+        self.assertListEqual(journal.since(journal.cursor), [])
+        self.assertEqual(len(journal.since(0)), 3)
+
+    def test_journal_disable(self):
+        journal = self.value.enable_journal()
+        self.value['fred'] = 1
+        self.value.disable_journal()
+        self.value['fred'] = 2
+        self.value.disable_journal()
+        self.assertListEqual(journal.drain(), [('set', 'fred', 1)])
+        self.assertIsNot(self.value.enable_journal(), journal)
+
+    def test_journal_not_copied(self):
+        journal = self.value.enable_journal()
+        value = self.value.copy()
+        value['fred'] = 1
+        pickle.loads(pickle.dumps(self.value))['fred'] = 2
+        self.assertEqual(len(journal), 0)
+
+    def test_journal_released(self):
+        value = self.TEST_CLASS(self.VALUES)
+        value.enable_journal()
+        self.assertIn(id(value), flatdict._JOURNALS)
+        key = id(value)
+        del value
+        gc.collect()
+        self.assertNotIn(key, flatdict._JOURNALS)
+
+    def test_journal_view(self):
+        document = copy.deepcopy(self.AS_DICT)
+        value = self.TEST_CLASS.view(document)
+        journal = value.enable_journal()
+        value.update({'foo:bar:baz': 1, 'fred': 2})
+        del value['waldo']
+        self.assertListEqual(
+            journal.drain(),
+            [
+                ('set', 'foo:bar:baz', 1),
+                ('set', 'fred', 2),
+                ('delete', 'waldo', None),
+            ],
+        )
+
+    def test_iter_range(self):
+        keys = sorted(self.value.keys())
+        for start, stop in (
+            (None, None),
+            ('foo:bar:', 'foo:grault:qux'),
+            ('foo:bar:c', 'garply'),
+            ('foo', 'foo:'),
+            ('g', None),
+            (None, 'foo:bar:qux'),
+            ('z', 'a'),
+        ):
+            with self.subTest(start=start, stop=stop):
+                self.assertListEqual(
+                    list(self.value.iter_range(start, stop)),
+                    [
+                        (key, self.value[key])
+                        for key in keys
+                        if (start is None or key >= start)
+                        and (stop is None or key < stop)
+                    ],
+                )
+
+    def test_iter_range_orders_flat_keys(self):
+        value = self.TEST_CLASS({'a': {'b': 1}, 'a0': 2, 'a_': {}, 'ab': 3})
+        self.assertListEqual(
+            [key for key, _value in value.iter_range()],
+            ['a0', 'a:b', 'a_', 'ab'],
+        )
+        value['a_:c'] = 4
+        value['a0'] = {'z': 5}
+        del value['a:b']
+        value['a'] = 6
+        self.assertListEqual(
+            [key for key, _value in value.iter_range()],
+            sorted(value.keys()),
+        )
+        value.set_delimiter('.')
+        self.assertListEqual(
+            [key for key, _value in value.iter_range('a.')],
+            ['a0.z', 'a_.c', 'ab'],
+        )
+
+    def test_len_tracks_mutations(self):
+        value = self.TEST_CLASS()
+        value['foo:bar:baz'] = 1
+        value['foo:bar:qux'] = 2
+        value.update({'foo:grault': 3, 'corge': 4})
+        self.assertEqual(len(value), 4)
+        value['foo']['bar']['waldo'] = 5
+        self.assertEqual(len(value), 5)
+        del value['foo:bar:baz']
+        self.assertEqual(len(value), 4)
+        value.pop('foo:bar')
+        self.assertEqual(len(value), 2)
+        value['corge'] = {'fred': 1, 'plugh': 2}
+        self.assertEqual(len(value), 3)
+        value.clear()
+        self.assertEqual(len(value), 0)
+        self.assertListEqual(list(value), [])
+
+    def test_len_counts_empty_child(self):
+        value = self.TEST_CLASS({'foo': {'bar': {}}})
+        self.assertEqual(len(value), 1)
+        value['foo:baz'] = 1
+        self.assertEqual(len(value), 2)
+
+    def test_assign_attached_child(self):
+        self.value['corge'] = self.value['garply']
+        self.assertIsNot(self.value['corge'], self.value['garply'])
+        self.value['garply:quux'] = 1
+        self.assertEqual(len(self.value), len(self.KEYS) + 5)
+        self.assertNotIn('corge:quux', self.value)
+
+    def test_contains_through_leaf(self):
+        self.assertNotIn('xyzzy:plugh', self.value)
+        self.assertNotIn('fred:4', self.value)
+
+    def _view_values(self) -> dict:
+        # Views do not nest keys that already contain the delimiter
+        return copy.deepcopy(
+            {k: v for k, v in self.VALUES.items() if ':' not in k}
+            | {'waldo': {'fred': 6, 'wanda': 7}}
+        )
+
+    def test_view_reads_through(self):
+        values = self._view_values()
+        view = self.TEST_CLASS.view(values)
+        self.assertDictEqual(dict(view.items()), self.FLAT_EXPECTATION)
+        self.assertEqual(len(view), len(self.KEYS))
+        self.assertIn('garply:qux:corge', view)
+        self.assertNotIn('garply:qux:grault', view)
+        self.assertEqual(view['garply:qux:corge'], 3)
+        self.assertEqual(view.as_dict(), values)
+
+    def test_view_writes_through(self):
+        values = self._view_values()
+        view = self.TEST_CLASS.view(values)
+        view['foo:bar:baz'] = 10
+        view['corge:grault'] = self.TEST_CLASS({'fred': 1})
+        del view['garply:qux:corge']
+        self.assertEqual(values['foo']['bar']['baz'], 10)
+        self.assertDictEqual(values['corge'], {'grault': {'fred': 1}})
+        self.assertNotIn('qux', values['garply'])
+        with self.assertRaises(TypeError):
+            view['fred:plugh'] = 1
+        view.clear()
+        self.assertDictEqual(values, {})
+
+    def test_view_tuple_keys(self):
+        values = self._view_values()
+        view = self.TEST_CLASS.view(values)
+        view[('foo', 'bar', 'baz')] = 10
+        self.assertEqual(values['foo']['bar']['baz'], 10)
+        self.assertEqual(view[('garply', 'qux', 'corge')], 3)
+        self.assertIn(('garply', 'qux'), view)
+        del view[('garply', 'qux', 'corge')]
+        self.assertNotIn('qux', values['garply'])
+        with self.assertRaises(ValueError):
+            view[('foo', 'bar:baz')] = 1
+
+    def test_view_wraps_children_on_access(self):
+        values = self._view_values()
+        view = self.TEST_CLASS.view(values)
+        child = view['foo']
+        self.assertIsInstance(child, self.TEST_CLASS)
+        child['bar:baz'] = 5
+        self.assertEqual(values['foo']['bar']['baz'], 5)
+        self.assertEqual(view['foo:bar:baz'], 5)
+
+    def test_view_assigned_into_flat_dict(self):
+        values = {'a': {'b': 1, 'c': 2}, 'e': 3}
+        value = self.TEST_CLASS({'foo': 1})
+        value['x'] = self.TEST_CLASS.view(values)
+        value.update({'y': self.TEST_CLASS.view(values)})
+        self.assertEqual(len(value), 7)
+        self.assertIn(('x:a:b', 1), list(value.items()))
+        value['x:q'] = 4
+        del value['y:a']
+        self.assertEqual(len(value), 6)
+        self.assertDictEqual(values, {'a': {'b': 1, 'c': 2}, 'e': 3})
+
     def test_empty_dict_as_value(self):
         expectation = {'foo': {'bar': {}}}
         flat = self.TEST_CLASS(expectation)
@@ -296,6 +1097,7 @@ class FlatDictTests(unittest.TestCase):
 
 class FlatterDictTests(FlatDictTests):
     TEST_CLASS = flatdict.FlatterDict
+    TAGGED_CLASS = TaggedFlatter
 
     FLAT_EXPECTATION: typing.ClassVar[dict] = {
         'foo:bar:baz': 0,
@@ -455,6 +1257,25 @@ class FlatterDictTests(FlatDictTests):
         d['double_nest:0:0'] = -1
         self.assertEqual(d.as_dict(), new_vals)
 
+    def test_set_sequence_item(self):
+        d = self.TEST_CLASS({'list': ['a', 'b'], 'nested': [{'tags': [1]}]})
+        d['list:1'] = 'c'
+        d['nested:0:tags:0'] = 2
+        self.assertDictEqual(
+            d.as_dict(), {'list': ['a', 'c'], 'nested': [{'tags': [2]}]}
+        )
+
+    def test_update_sequence_offsets(self):
+        d = self.TEST_CLASS({'list': [{'a': 1}, {'a': 2}]})
+        d.update({'list:0:a': 3, 'list:1:b': 4})
+        self.assertDictEqual(
+            d.as_dict(), {'list': [{'a': 3}, {'a': 2, 'b': 4}]}
+        )
+        with self.assertRaises(TypeError):
+            d.update({'list:first:a': 5})
+        with self.assertRaises(KeyError):
+            d.update({'list:5:a': 5})
+
     def test_update_nest(self):
         vals = {'double_nest': [[1, 2], [3, 4]]}
         d = self.TEST_CLASS(vals)
@@ -469,9 +1290,1038 @@ class FlatterDictTests(FlatDictTests):
         d['dicts:0:a'] = -1
         self.assertEqual(d.as_dict(), vals)
 
+    def test_view_sequences(self):
+        values = {'list': [1, 2], 'tuple': (3, 4)}
+        view = self.TEST_CLASS.view(values)
+        self.assertEqual(view['list:1'], 2)
+        self.assertNotIn('list:2', view)
+        view['list:2'] = 3
+        view['list:0'] = 0
+        self.assertListEqual(values['list'], [0, 2, 3])
+        self.assertEqual(view['tuple'].as_dict(), {'0': 3, '1': 4})
+        with self.assertRaises(TypeError):
+            view['tuple:0'] = 1
+        self.assertDictEqual(
+            view.as_dict(), {'list': [0, 2, 3], 'tuple': (3, 4)}
+        )
+
+    def test_as_dict_deep_sequences(self):
+        value = self.TEST_CLASS([1])
+        for _offset in range(10000):
+            value = self.TEST_CLASS([value])
+        out = self.TEST_CLASS({'list': value}).as_dict()['list']
+        for _offset in range(10000):
+            self.assertIsInstance(out, list)
+            out = out[0]
+        self.assertListEqual(out, [1])
+
+    def test_eq_sequences(self):
+        value = self.TEST_CLASS({'list': [1, 2], 'tuple': (3,), 'set': {4, 5}})
+        self.assertEqual(value, {'list': [1, 2], 'tuple': (3,), 'set': {5, 4}})
+        self.assertNotEqual(
+            value, {'list': (1, 2), 'tuple': (3,), 'set': {4, 5}}
+        )
+        self.assertNotEqual(
+            value, {'list': [2, 1], 'tuple': (3,), 'set': {4, 5}}
+        )
+        self.assertNotEqual(value, {'list': [1, 2], 'tuple': (3,), 'set': {4}})
+        self.assertEqual(
+            value,
+            self.TEST_CLASS({'list': [1, 2], 'tuple': (3,), 'set': {5, 4}}),
+        )
+        self.assertNotEqual(
+            value,
+            self.TEST_CLASS({'list': [1, 2], 'tuple': [3], 'set': {4, 5}}),
+        )
+
+    def test_iter_match_offsets(self):
+        value = self.TEST_CLASS({'list': [{'a': 1}, {'a': 2}, {'b': 3}]})
+        self.assertListEqual(
+            list(value.iter_match('list:*:a')),
+            [('list:0:a', 1), ('list:1:a', 2)],
+        )
+        self.assertListEqual(
+            list(value.iter_match('list:[12]:*')),
+            [('list:1:a', 2), ('list:2:b', 3)],
+        )
+
+    def test_diff_sequences(self):
+        value = self.TEST_CLASS({'list': [1, {'a': 2}], 'tuple': (1,)})
+        other = self.TEST_CLASS(
+            {'list': [{'b': 3}, {'a': 2}, 4], 'tuple': [1]}
+        )
+        patch = value.diff(other)
+        self.assertDictEqual(patch['added'], {'list:2': 4})
+        self.assertListEqual(sorted(patch['changed']), ['list:0', 'tuple'])
+        value.apply_patch(patch)
+        self.assertDictEqual(value.as_dict(), other.as_dict())
+
+    def test_as_dict_coerced_flatdict(self):
+        value = self.TEST_CLASS({'foo': flatdict.FlatDict({'bar': 1})})
+        self.assertDictEqual(value.as_dict(), {'foo': {'bar': 1}})
+
+    def test_pickling_keeps_original_types(self):
+        value = self.TEST_CLASS([{'tuple': (1, 2), 'set': {3}, 'empty': ()}])
+        restored = pickle.loads(pickle.dumps(value))
+        self.assertIs(restored.original_type, list)
+        self.assertIs(restored['0:tuple'].original_type, tuple)
+        self.assertIs(restored['0:set'].original_type, set)
+        self.assertIs(restored['0:empty'].original_type, tuple)
+        self.assertDictEqual(restored.as_dict(), value.as_dict())
+
+    def test_sequence_nodes_held_in_list(self):
+        value = self.TEST_CLASS({'list': [1, {'a': 2}]})
+        self.assertIsInstance(value['list']._values, flatdict._Sequence)
+        value['list:2'] = 3
+        value['list:0'] = 0
+        del value['list:2']
+        self.assertIsInstance(value['list']._values, flatdict._Sequence)
+        self.assertListEqual(list(value), ['list:0', 'list:1:a'])
+        self.assertEqual(len(value), 2)
+        self.assertDictEqual(value.as_dict(), {'list': [0, {'a': 2}]})
+        self.assertEqual(value, self.TEST_CLASS({'list': [0, {'a': 2}]}))
+        self.assertEqual(value, {'list': [0, {'a': 2}]})
+
+    def test_sequence_nodes_keep_offsets(self):
+        value = self.TEST_CLASS({'list': [1, 2, 3]})
+        value['list:5'] = 6
+        value['list:01'] = 7
+        self.assertListEqual(
+            list(value), ['list:0', 'list:1', 'list:2', 'list:5', 'list:01']
+        )
+        self.assertDictEqual(value.as_dict(), {'list': [1, 2, 3, 6, 7]})
+        del value['list:0']
+        self.assertListEqual(
+            list(value), ['list:1', 'list:2', 'list:5', 'list:01']
+        )
+        self.assertEqual(value['list:1'], 2)
+        self.assertEqual(value.count_prefix('list'), 4)
+
+    def test_sequence_nodes_copy_and_pickle(self):
+        value = self.TEST_CLASS({'list': [1, {'a': [2]}]})
+        clone = value.copy()
+        clone['list:2'] = 3
+        clone['list:1:a:0'] = 4
+        self.assertDictEqual(value.as_dict(), {'list': [1, {'a': [2]}]})
+        self.assertDictEqual(clone.as_dict(), {'list': [1, {'a': [4]}, 3]})
+        restored = pickle.loads(pickle.dumps(clone))
+        self.assertEqual(restored, clone)
+        self.assertIsInstance(restored['list']._values, flatdict._Sequence)
+        restored['list:3'] = 5
+        self.assertEqual(restored['list:3'], 5)
+
     def test_update_nest_dict(self):
         vals = {'dicts': [{'a': 1, 'b': 2}, {'c': 3, 'd': 4}]}
         d = self.TEST_CLASS(vals)
         vals['dicts'][0]['a'] = -1
         d.update(vals)
         self.assertEqual(d.as_dict(), vals)
+
+
+class FrozenFlatDictTests(unittest.TestCase):
+    TEST_CLASS = flatdict.FrozenFlatDict
+    MUTABLE_CLASS = flatdict.FlatDict
+    VALUES = FlatDictTests.VALUES
+    HASHABLE: typing.ClassVar[dict] = {
+        'foo': {'bar': 0, 'baz': (1, 2)},
+        'qux': 'quux',
+        'empty': {},
+    }
+
+    def setUp(self):
+        self.mutable = self.MUTABLE_CLASS(self.VALUES)
+        self.value = self.TEST_CLASS(self.VALUES)
+
+    def test_held_child_of_source_is_independent(self):
+        child = self.mutable['foo']
+        expectation = self.mutable.as_dict()
+        frozen = self.TEST_CLASS(self.mutable)
+        child['bar:baz'] = 10
+        child['new'] = 1
+        self.assertEqual(frozen['foo:bar:baz'], 0)
+        self.assertNotIn('foo:new', frozen)
+        self.assertDictEqual(frozen.as_dict(), expectation)
+
+    def test_reads_match_mutable(self):
+        self.assertListEqual(list(self.value), list(self.mutable))
+        self.assertListEqual(
+            list(self.value.items()), list(self.mutable.items())
+        )
+        self.assertEqual(len(self.value), len(self.mutable))
+        self.assertDictEqual(self.value.as_dict(), self.mutable.as_dict())
+        for key in self.mutable:
+            with self.subTest(key=key):
+                self.assertIn(key, self.value)
+                self.assertEqual(self.value[key], self.mutable[key])
+        self.assertIn('foo:bar', self.value)
+        self.assertNotIn('foo:missing', self.value)
+        with self.assertRaises(KeyError):
+            self.value['foo:missing']
+
+    def test_tuple_keys(self):
+        self.assertEqual(self.value[('foo', 'bar', 'baz')], 0)
+        self.assertIsInstance(self.value[('foo', 'bar')], self.TEST_CLASS)
+        self.assertIn(('foo', 'bar'), self.value)
+        with self.assertRaises(TypeError):
+            self.value[('foo', 'bar', 'baz')] = 1
+        for path, value in self.value.iter_paths():
+            with self.subTest(path=path):
+                self.assertEqual(value, self.mutable[path])
+                if isinstance(value, flatdict.FlatDict):
+                    self.assertIsInstance(value, self.TEST_CLASS)
+
+    def test_branches_are_frozen(self):
+        branch = self.value['foo:bar']
+        self.assertIsInstance(branch, self.TEST_CLASS)
+        self.assertEqual(branch, self.mutable['foo:bar'])
+        with self.assertRaises(TypeError):
+            branch['baz'] = 1
+
+    def test_changes_raise(self):
+        for change in (
+            lambda: self.value.__setitem__('fred', 1),
+            lambda: self.value.__delitem__('fred'),
+            lambda: self.value.update({'fred': 1}),
+            lambda: self.value.setdefault('new', 1),
+            lambda: self.value.pop('fred'),
+            lambda: self.value.pop_prefix('foo'),
+            self.value.popitem,
+            self.value.clear,
+            lambda: self.value.set_delimiter('|'),
+            lambda: self.value.apply_patch({}),
+            lambda: self.TEST_CLASS.view({}),
+        ):
+            with self.assertRaises(TypeError):
+                change()
+        self.assertEqual(self.value, self.mutable)
+
+    def test_hash(self):
+        value = self.TEST_CLASS(self.HASHABLE)
+        other = self.TEST_CLASS(self.HASHABLE)
+        self.assertEqual(hash(value), hash(other))
+        self.assertEqual(value, other)
+        self.assertIs(value.copy(), value)
+        cached = functools.lru_cache(maxsize=None)(len)
+        cached(value)
+        cached(other)
+        self.assertEqual(cached.cache_info().hits, 1)
+        changed = self.TEST_CLASS(self.HASHABLE | {'fred': 5})
+        hash(changed)
+        with unittest.mock.patch.object(
+            self.TEST_CLASS, '_equals', side_effect=AssertionError
+        ):
+            self.assertNotEqual(value, changed)
+
+    def test_hash_unhashable_value(self):
+        with self.assertRaises(TypeError):
+            hash(self.TEST_CLASS({'foo': {'bar': bytearray()}}))
+
+    def test_from_mutable_shares_values(self):
+        value = self.TEST_CLASS(self.mutable)
+        self.assertIs(value._values, self.mutable._values)
+        self.mutable['foo:bar:baz'] = 10
+        del self.mutable['garply']
+        self.assertEqual(value, self.value)
+        self.assertEqual(value['foo:bar:baz'], 0)
+
+    def test_from_mutable_with_delimiter(self):
+        value = self.TEST_CLASS(self.mutable, '|')
+        self.assertEqual(value['foo|bar|baz'], 0)
+        self.assertDictEqual(value.as_dict(), self.mutable.as_dict())
+
+    def test_assigned_into_mutable(self):
+        self.mutable['frozen'] = self.value
+        self.mutable['frozen:foo:bar:baz'] = 10
+        self.assertEqual(self.value['foo:bar:baz'], 0)
+        self.assertIsInstance(
+            self.mutable._values['frozen'], self.MUTABLE_CLASS
+        )
+
+    def test_pickle(self):
+        unpickled = pickle.loads(pickle.dumps(self.value))
+        self.assertIsInstance(unpickled, self.TEST_CLASS)
+        self.assertEqual(unpickled, self.value)
+        value = self.TEST_CLASS(self.HASHABLE)
+        self.assertEqual(hash(pickle.loads(pickle.dumps(value))), hash(value))
+
+
+class FrozenFlatterDictTests(FrozenFlatDictTests):
+    TEST_CLASS = flatdict.FrozenFlatterDict
+    MUTABLE_CLASS = flatdict.FlatterDict
+    VALUES = FlatterDictTests.VALUES
+
+    def test_sequences(self):
+        value = self.TEST_CLASS({'a': [1, (2, 3)], 'b': []})
+        self.assertDictEqual(value.as_dict(), {'a': [1, (2, 3)], 'b': []})
+        self.assertEqual(value['a:1:0'], 2)
+        self.assertIs(value['a'].original_type, list)
+        self.assertNotEqual(
+            hash(value), hash(self.TEST_CLASS({'a': [1, (2, 4)]}))
+        )
+
+
+class KeyedFlatDictTests(FlatDictTests):
+    TEST_CLASS = Keyed
+
+
+class KeyedFlatterDictTests(FlatterDictTests):
+    TEST_CLASS = KeyedFlatter
+
+
+class ConcurrentFlatDictTests(FlatDictTests):
+    TEST_CLASS = flatdict.ConcurrentFlatDict
+    TAGGED_CLASS = TaggedConcurrent
+
+    @staticmethod
+    def _run(*targets):
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as error:  # noqa: BLE001
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_copy_child_is_independent(self):
+        child = self.value['foo']
+        child['bar:qux'] = 11
+        self.assertIsInstance(child, flatdict.FlatDict)
+        self.assertNotIsInstance(child, flatdict.ConcurrentFlatDict)
+        self.assertEqual(child['bar:qux'], 11)
+        self.assertEqual(self.value['foo:bar:qux'], 1)
+
+    def test_len_tracks_mutations(self):
+        value = self.TEST_CLASS()
+        value['foo:bar:baz'] = 1
+        value.update({'foo:grault': 3, 'corge': 4})
+        self.assertEqual(len(value), 3)
+        value['foo:bar']['waldo'] = 5
+        self.assertEqual(len(value), 3)
+        value['foo:bar:waldo'] = 5
+        self.assertEqual(len(value), 4)
+
+    def test_assigned_flat_dict_is_copied(self):
+        nested = flatdict.FlatDict({'bar': 1})
+        self.value['new'] = nested
+        nested['bar'] = 2
+        self.assertEqual(self.value['new:bar'], 1)
+
+    def test_iteration_is_a_snapshot(self):
+        items = self.value.items()
+        iterator = iter(items)
+        first = next(iterator)
+        self.value['foo:bar:baz'] = 10
+        self.value['zzz'] = 1
+        del self.value['garply']
+        self.assertListEqual(
+            [first, *iterator], list(self.FLAT_EXPECTATION.items())
+        )
+        self.assertEqual(self.value['foo:bar:baz'], 10)
+
+    def test_threads(self):
+        value = self.TEST_CLASS()
+
+        def write(writer):
+            def target():
+                for offset in range(500):
+                    value[f'writer{writer}:key{offset}'] = offset
+                    value.update({'pair:a': offset, 'pair:b': offset})
+                    if offset % 5 == 0:
+                        del value[f'writer{writer}:key{offset}']
+
+            return target
+
+        def read():
+            for _offset in range(100):
+                items = dict(value.items())
+                self.assertEqual(items.get('pair:a'), items.get('pair:b'))
+                self.assertIn(len(value.as_dict().get('pair', {})), (0, 2))
+                value.get('writer0:key1')
+                'pair:a' in value  # noqa: B015
+
+        errors = self._run(read, read, *(write(writer) for writer in range(4)))
+        self.assertListEqual(errors, [])
+        self.assertEqual(len(value), 4 * 400 + 2)
+        self.assertEqual(len(value), len(list(value)))
+        self.assertEqual(value['writer3:key499'], 499)
+
+    def test_threads_setdefault(self):
+        value = self.TEST_CLASS()
+        results = []
+
+        def target():
+            for offset in range(200):
+                results.append(value.setdefault(f'key{offset}', object()))
+
+        self.assertListEqual(self._run(target, target, target), [])
+        by_key = collections.defaultdict(set)
+        for offset, result in enumerate(results):
+            by_key[offset % 200].add(id(result))
+        self.assertTrue(all(len(ids) == 1 for ids in by_key.values()))
+
+
+class IterFlattenTests(unittest.TestCase):
+    DOCUMENT: typing.ClassVar[dict] = {
+        'foo': {
+            'bar': {'baz': 0, 'qux': 1.5e3, 'corge': 'gr\u00e4ult "x"'},
+            'list': [1, {'a': [2, 3]}, []],
+            'empty_dict': {},
+            'empty_list': [],
+        },
+        'fred': None,
+        'xyzzy': True,
+        'thud': -12,
+        'double_nest': [[1, 2], [3]],
+    }
+
+    @staticmethod
+    def _expectation(cls: type[flatdict.FlatDict], value: dict) -> list:
+        return [
+            (k, getattr(v, 'original_type', dict)())
+            if isinstance(v, flatdict.FlatDict)
+            else (k, v)
+            for k, v in cls(value).items()
+        ]
+
+    def test_matches_flatdict_items(self):
+        document = json.dumps(self.DOCUMENT, indent=2)
+        self.assertListEqual(
+            list(flatdict.iter_flatten(io.StringIO(document))),
+            self._expectation(flatdict.FlatDict, self.DOCUMENT),
+        )
+
+    def test_matches_flatterdict_items(self):
+        document = json.dumps(self.DOCUMENT)
+        self.assertListEqual(
+            list(flatdict.iter_flatten(io.StringIO(document), flatter=True)),
+            self._expectation(flatdict.FlatterDict, self.DOCUMENT),
+        )
+
+    def test_chunk_boundaries(self):
+        document = json.dumps(self.DOCUMENT, ensure_ascii=False).encode()
+        expectation = self._expectation(flatdict.FlatterDict, self.DOCUMENT)
+        for chunk_size in range(1, 8):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertListEqual(
+                    list(
+                        flatdict.iter_flatten(
+                            io.BytesIO(document),
+                            delimiter=':',
+                            flatter=True,
+                            chunk_size=chunk_size,
+                        )
+                    ),
+                    expectation,
+                )
+
+    def test_delimiter(self):
+        document = io.StringIO('{"foo": {"bar": 1}}')
+        self.assertListEqual(
+            list(flatdict.iter_flatten(document, delimiter='.')),
+            [('foo.bar', 1)],
+        )
+
+    def test_deep_nesting(self):
+        document = io.StringIO('{"a": ' * 10000 + '[1]' + '}' * 10000)
+        (key, value), *_others = flatdict.iter_flatten(document)
+        self.assertEqual(key, ':'.join(['a'] * 10000))
+        self.assertListEqual(value, [1])
+
+    def test_root_must_be_object(self):
+        with self.assertRaises(ValueError):
+            list(flatdict.iter_flatten(io.StringIO('[1, 2]')))
+        self.assertListEqual(
+            list(flatdict.iter_flatten(io.StringIO('[1, 2]'), flatter=True)),
+            [('0', 1), ('1', 2)],
+        )
+
+    def test_malformed_document(self):
+        for document in ('{"a": 1,}', '{"a" 1}', '{"a": 1} x', '{"a": [1}'):
+            with self.subTest(document=document):
+                with self.assertRaises(json.JSONDecodeError):
+                    list(flatdict.iter_flatten(io.StringIO(document)))
+
+
+class FlattenManyTests(unittest.TestCase):
+    RECORDS: typing.ClassVar[list] = [
+        FlatDictTests.VALUES,
+        FlatterDictTests.VALUES,
+        IterFlattenTests.DOCUMENT,
+        {1: {2: 'int keys'}, 'set': {1}, 'tuple': (1, [2]), 'empty': ()},
+        {'a:b': 1, 'a': {'c': 2}},
+        {'a': {'b': 1}, 'a:b': 2},
+        {'nested': flatdict.FlatDict({'x': {'y': 1}})},
+        [('pairs', {'a': 1})],
+        {},
+    ]
+
+    @staticmethod
+    def _expectation(cls, records):
+        return [
+            IterFlattenTests._expectation(cls, record) for record in records
+        ]
+
+    def test_matches_flatdict_items(self):
+        for cls, flatter in (
+            (flatdict.FlatDict, False),
+            (flatdict.FlatterDict, True),
+        ):
+            with self.subTest(cls=cls.__name__):
+                self.assertListEqual(
+                    [
+                        list(items.items())
+                        for items in flatdict.flatten_many(
+                            self.RECORDS, flatter=flatter
+                        )
+                    ],
+                    self._expectation(cls, self.RECORDS),
+                )
+
+    def test_delimiter(self):
+        self.assertListEqual(
+            list(flatdict.flatten_many([{'a': {'b': 1, 'c:d': 2}}], '.')),
+            [{'a.b': 1, 'a.c:d': 2}],
+        )
+
+    def test_does_not_build_flat_dictionaries(self):
+        with unittest.mock.patch.object(
+            flatdict.FlatDict, '__init__', side_effect=AssertionError
+        ):
+            self.assertListEqual(
+                list(flatdict.flatten_many([{'a': {'b': [1]}}])),
+                [{'a:b': [1]}],
+            )
+
+    def test_workers(self):
+        records = [
+            {'id': i, 'nested': {'list': [i, {'i': i}]}} for i in range(50)
+        ]
+        for flatter, cls in (
+            (False, flatdict.FlatDict),
+            (True, flatdict.FlatterDict),
+        ):
+            with self.subTest(flatter=flatter):
+                self.assertListEqual(
+                    list(
+                        flatdict.flatten_many(
+                            records, flatter=flatter, workers=2, chunk_size=7
+                        )
+                    ),
+                    [dict(cls(record).items()) for record in records],
+                )
+
+    def test_workers_stream_records(self):
+        consumed = []
+
+        def records():
+            for offset in range(1000):
+                consumed.append(offset)
+                yield {'offset': offset}
+
+        results = flatdict.flatten_many(records(), workers=1, chunk_size=10)
+        self.assertDictEqual(next(results), {'offset': 0})
+        self.assertLess(len(consumed), 1000)
+        results.close()
+        self.assertListEqual(list(flatdict.flatten_many([], workers=2)), [])
+
+
+class ColumnsTests(unittest.TestCase):
+    RECORDS: typing.ClassVar[list] = [
+        {'id': 1, 'point': {'x': 1.5, 'y': 2.0}, 'tags': ['a'], 'empty': {}},
+        {'id': 2, 'point': {'x': 0.5, 'y': -1.0}, 'name': 'two'},
+        {'id': 3, 'point': {'x': 3.0, 'y': 1}, 'tags': []},
+        {},
+    ]
+
+    def test_columns(self):
+        columns = flatdict.to_columns(self.RECORDS[:3])
+        self.assertListEqual(
+            list(columns),
+            ['id', 'point:x', 'point:y', 'tags', 'empty', 'name'],
+        )
+        self.assertEqual(columns['id'].typecode, 'q')
+        self.assertListEqual(columns['id'].tolist(), [1, 2, 3])
+        self.assertEqual(columns['point:x'].typecode, 'd')
+        self.assertListEqual(columns['point:y'], [2.0, -1.0, 1])
+        self.assertListEqual(
+            columns['name'], [flatdict.MISSING, 'two', flatdict.MISSING]
+        )
+
+    def test_missing_marker(self):
+        columns = flatdict.to_columns(self.RECORDS, missing=None)
+        self.assertListEqual(columns['id'], [1, 2, 3, None])
+        self.assertListEqual(columns['tags'], [['a'], None, [], None])
+
+    def test_large_integers_are_lists(self):
+        columns = flatdict.to_columns([{'n': 2**63}, {'n': 1}])
+        self.assertIsInstance(columns['n'], list)
+
+    def test_round_trip(self):
+        for flatter in (False, True):
+            with self.subTest(flatter=flatter):
+                columns = flatdict.to_columns(self.RECORDS, flatter=flatter)
+                self.assertListEqual(
+                    flatdict.from_columns(columns, flatter=flatter),
+                    self.RECORDS,
+                )
+
+    def test_round_trip_delimiter_and_missing(self):
+        columns = flatdict.to_columns(self.RECORDS, '.', missing=None)
+        self.assertIn('point.x', columns)
+        self.assertListEqual(
+            flatdict.from_columns(columns, '.', missing=None), self.RECORDS
+        )
+
+    def test_flatter_columns(self):
+        columns = flatdict.to_columns(self.RECORDS, flatter=True)
+        self.assertListEqual(
+            columns['tags:0'],
+            ['a', flatdict.MISSING, flatdict.MISSING, flatdict.MISSING],
+        )
+        self.assertListEqual(
+            columns['tags'],
+            [flatdict.MISSING, flatdict.MISSING, [], flatdict.MISSING],
+        )
+
+    def test_no_records(self):
+        self.assertDictEqual(flatdict.to_columns([]), {})
+        self.assertListEqual(flatdict.from_columns({}), [])
+
+    def test_uneven_columns(self):
+        with self.assertRaises(ValueError):
+            flatdict.from_columns({'a': [1, 2], 'b': [1]})
+
+    @unittest.skipUnless(
+        importlib.util.find_spec('numpy'), 'NumPy is not installed'
+    )
+    def test_numpy(self):
+        columns = flatdict.to_columns(self.RECORDS[:3], as_numpy=True)
+        self.assertEqual(columns['id'].dtype.kind, 'i')
+        self.assertEqual(columns['point:x'].sum(), 5.0)
+        self.assertIsInstance(columns['tags'], list)
+        self.assertListEqual(flatdict.from_columns(columns), self.RECORDS[:3])
+
+    @unittest.skipIf(importlib.util.find_spec('numpy'), 'NumPy is installed')
+    def test_numpy_not_installed(self):
+        with self.assertRaises(ImportError):
+            flatdict.to_columns(self.RECORDS, as_numpy=True)
+
+
+class KeyTableTests(unittest.TestCase):
+    DOCUMENT = (
+        '{"user": {"name": "x", "address": {"city": "c"}}, "n": {"1": 1}}'
+    )
+
+    def setUp(self):
+        self.table = Keyed.KEY_TABLE
+        self.table.clear()
+        self.record_class, self.flatter_class = Keyed, KeyedFlatter
+
+    def test_items_unchanged(self):
+        document = json.loads(self.DOCUMENT)
+        for cls, keyed in (
+            (flatdict.FlatDict, self.record_class),
+            (flatdict.FlatterDict, self.flatter_class),
+        ):
+            with self.subTest(cls=cls.__name__):
+                value = cls(FlatterDictTests.VALUES)
+                shared = keyed(FlatterDictTests.VALUES)
+                self.assertListEqual(list(shared.items()), list(value.items()))
+                self.assertListEqual(list(shared.items()), list(value.items()))
+                self.assertDictEqual(shared.as_dict(), value.as_dict())
+                self.assertListEqual(
+                    list(keyed(document)), list(cls(document))
+                )
+
+    def test_segments_are_shared(self):
+        first = self.record_class(json.loads(self.DOCUMENT))
+        second = self.record_class(json.loads(self.DOCUMENT))
+        second['user:email'] = 'e'
+        for one, other in zip(
+            first['user']._values, second['user']._values, strict=False
+        ):
+            self.assertIs(one, other)
+        self.assertIs(
+            next(iter(first._values)),
+            next(iter(pickle.loads(pickle.dumps(second))._values)),
+        )
+
+    def test_flat_keys_are_cached(self):
+        first = self.record_class(json.loads(self.DOCUMENT))
+        second = self.record_class(json.loads(self.DOCUMENT))
+        keys = list(first)
+        self.assertListEqual(keys, ['user:name', 'user:address:city', 'n:1'])
+        for one, other in zip(keys, second.keys(), strict=True):
+            self.assertIs(one, other)
+        self.assertIs(self.table.join('user', 'name', ':'), keys[0])
+
+    def test_keys_that_are_not_strings(self):
+        value = self.record_class({'a': {1.0: 'float', '1': 's'}})
+        self.assertListEqual(list(value), ['a:1.0', 'a:1'])
+        self.assertListEqual(list(value), ['a:1.0', 'a:1'])
+
+    def test_delimiters(self):
+        document = json.loads(self.DOCUMENT)
+        self.assertIn('user:name', self.record_class(document))
+        self.assertIn('user.name', list(self.record_class(document, '.')))
+
+    def test_maxsize(self):
+        table = flatdict.KeyTable(maxsize=4)
+
+        class Bounded(flatdict.FlatDict):
+            KEY_TABLE = table
+
+        document = {f'k{i}': {f'v{j}': j for j in range(3)} for i in range(5)}
+        value = Bounded(document)
+        self.assertListEqual(list(value), list(flatdict.FlatDict(document)))
+        self.assertEqual(len(table), 8)
+        table.clear()
+        self.assertEqual(len(table), 0)
+        self.assertEqual(value['k4:v2'], 2)
+
+
+class MappedFlatDictTests(unittest.TestCase):
+    DOCUMENT: typing.ClassVar[dict] = {
+        'a': {'b': 1, 'c': [1, 2], 'e': {}},
+        'ab': 'x',
+        'z': {'y': {'x': (3,)}},
+        'ü': None,
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/index'
+
+    def _mapped(self, value):
+        value.dump_index(self.path)
+        mapped = flatdict.MappedFlatDict(self.path)
+        self.addCleanup(mapped.close)
+        return mapped
+
+    def test_items(self):
+        for cls in (
+            flatdict.FlatDict,
+            flatdict.FlatterDict,
+            flatdict.ConcurrentFlatDict,
+            flatdict.FrozenFlatDict,
+        ):
+            with self.subTest(cls=cls.__name__):
+                value = cls(self.DOCUMENT)
+                mapped = self._mapped(value)
+                expectation = {k: flatdict._leaf(v) for k, v in value.items()}
+                self.assertListEqual(list(mapped), sorted(expectation))
+                self.assertEqual(len(mapped), len(value))
+                self.assertDictEqual(dict(mapped.items()), expectation)
+                self.assertDictEqual(
+                    mapped.as_dict(),
+                    flatdict.unflatten(
+                        expectation,
+                        flatter=isinstance(value, flatdict.FlatterDict),
+                    ),
+                )
+
+    def test_as_dict_rebuilds_lists(self):
+        value = flatdict.FlatterDict({'l': [1, {'k': [2]}], 'e': []})
+        self.assertDictEqual(self._mapped(value).as_dict(), value.as_dict())
+        mapped = self._mapped(flatdict.FlatterDict(self.DOCUMENT))
+        self.assertListEqual(mapped.as_dict()['z']['y']['x'], [3])
+
+    def test_branches(self):
+        mapped = self._mapped(flatdict.FlatDict(self.DOCUMENT))
+        branch = mapped['a']
+        self.assertIsInstance(branch, flatdict.MappedFlatDict)
+        self.assertListEqual(list(branch), ['b', 'c', 'e'])
+        self.assertDictEqual(branch['e'], {})
+        self.assertTupleEqual(mapped['z']['y:x'], (3,))
+        self.assertTupleEqual(mapped['z']['y']['x'], (3,))
+        self.assertIn('y:x', mapped['z'])
+        self.assertNotIn('ab', branch)
+
+    def test_contains(self):
+        mapped = self._mapped(flatdict.FlatDict(self.DOCUMENT))
+        for key in ('a', 'a:b', 'ab', 'z:y', 'ü'):
+            self.assertIn(key, mapped)
+        for key in ('', 'a:x', 'b', 'z:y:x:w', 1):
+            self.assertNotIn(key, mapped)
+
+    def test_siblings_sorted_before_branch(self):
+        document = {'a-x': 1, 'a0': 2, 'a': {'b': 3}}
+        for cls in (flatdict.FlatDict, flatdict.FlatterDict):
+            with self.subTest(cls=cls.__name__):
+                mapped = self._mapped(cls(document))
+                self.assertIn('a', mapped)
+                self.assertListEqual(list(mapped['a']), ['b'])
+                self.assertListEqual(list(mapped['a'].items()), [('b', 3)])
+                self.assertEqual(mapped.count_prefix('a'), 1)
+                self.assertListEqual(
+                    list(mapped.iter_prefix('a')), [('a:b', 3)]
+                )
+                self.assertEqual(mapped['a-x'], 1)
+                self.assertEqual(mapped.count_prefix('a0'), 1)
+                self.assertNotIn('a-', mapped)
+
+    def test_missing_key(self):
+        mapped = self._mapped(flatdict.FlatDict(self.DOCUMENT))
+        for key in ('a:x', 'q', 'zz', 1):
+            with self.assertRaises(KeyError):
+                mapped[key]
+        self.assertIsNone(mapped.get('q'))
+
+    def test_prefix(self):
+        value = flatdict.FlatDict(self.DOCUMENT)
+        mapped = self._mapped(value)
+        for prefix in ('a', 'a:', 'ab', 'z:y', 'q', ''):
+            with self.subTest(prefix=prefix):
+                expectation = sorted(
+                    (k, flatdict._leaf(v))
+                    for k, v in value.iter_prefix(prefix)
+                )
+                self.assertListEqual(
+                    list(mapped.iter_prefix(prefix)), expectation
+                )
+                self.assertEqual(
+                    mapped.count_prefix(prefix), value.count_prefix(prefix)
+                )
+
+    def test_delimiter(self):
+        mapped = self._mapped(flatdict.FlatDict(self.DOCUMENT, '::'))
+        self.assertEqual(mapped['a::b'], 1)
+        self.assertListEqual(list(mapped['z']), ['y::x'])
+        self.assertEqual(mapped.count_prefix('a::'), 3)
+
+    def test_empty(self):
+        mapped = self._mapped(flatdict.FlatDict())
+        self.assertEqual(len(mapped), 0)
+        self.assertDictEqual(mapped.as_dict(), {})
+        self.assertNotIn('a', mapped)
+
+    def test_replaced_while_mapped(self):
+        mapped = self._mapped(flatdict.FlatDict(self.DOCUMENT))
+        flatdict.FlatDict({'new': 1}).dump_index(self.path)
+        self.assertEqual(mapped['a:b'], 1)
+        with flatdict.MappedFlatDict(self.path) as replaced:
+            self.assertListEqual(list(replaced), ['new'])
+        self.assertTrue(replaced._map.closed)
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            flatdict.FlatDict({1: 'a'}).dump_index(self.path)
+        with open(self.path, 'wb') as handle:
+            handle.write(b'{"a": 1}')
+        with self.assertRaises(ValueError):
+            flatdict.MappedFlatDict(self.path)
+
+
+class UnflattenTests(unittest.TestCase):
+    def test_matches_as_dict(self):
+        value = flatdict.FlatDict(FlatDictTests.VALUES)
+        self.assertDictEqual(
+            flatdict.unflatten(value.items()), FlatDictTests.AS_DICT
+        )
+
+    def test_flatter_rebuilds_lists(self):
+        value = flatdict.FlatterDict(
+            {
+                'neighbors': [{'left': 'john'}, {'left': 'steven'}],
+                'double_nest': [[1, 2], [3, 4]],
+                'ten': list(range(11)),
+                'digits': {'1a': 1},
+            }
+        )
+        self.assertDictEqual(
+            flatdict.unflatten(value.items(), flatter=True),
+            {
+                'neighbors': [{'left': 'john'}, {'left': 'steven'}],
+                'double_nest': [[1, 2], [3, 4]],
+                'ten': list(range(11)),
+                'digits': {'1a': 1},
+            },
+        )
+
+    def test_flatter_keeps_sparse_and_padded_offsets(self):
+        self.assertDictEqual(
+            flatdict.unflatten(
+                [
+                    ('a:1', 'x'),
+                    ('b:0', 1),
+                    ('b:2', 3),
+                    ('c:0', 1),
+                    ('c:01', 2),
+                    ('d:1', 2),
+                    ('d:0', 1),
+                ],
+                flatter=True,
+            ),
+            {
+                'a': {'1': 'x'},
+                'b': {'0': 1, '2': 3},
+                'c': {'0': 1, '01': 2},
+                'd': [1, 2],
+            },
+        )
+
+    def test_round_trip_with_iter_flatten(self):
+        document = json.dumps(IterFlattenTests.DOCUMENT)
+        for flatter in (False, True):
+            with self.subTest(flatter=flatter):
+                pairs = flatdict.iter_flatten(
+                    io.StringIO(document), delimiter='.', flatter=flatter
+                )
+                self.assertDictEqual(
+                    flatdict.unflatten(pairs, '.', flatter),
+                    IterFlattenTests.DOCUMENT,
+                )
+
+    def test_unsorted_and_replaced_keys(self):
+        self.assertDictEqual(
+            flatdict.unflatten(
+                {
+                    'a:b:c': 1,
+                    'x:y': 2,
+                    'a:b:d': 3,
+                    'x': {'z': 4},
+                    'x:w': 5,
+                    'list:1': 'b',
+                    'list:0': 'a',
+                    'list:2:0': 'c',
+                    'list:2': 'd',
+                },
+                flatter=True,
+            ),
+            {
+                'a': {'b': {'c': 1, 'd': 3}},
+                'x': {'z': 4, 'w': 5},
+                'list': ['a', 'b', 'd'],
+            },
+        )
+
+    def test_assignment_through_leaf_raises(self):
+        with self.assertRaises(TypeError):
+            flatdict.unflatten([('a', 1), ('a:b', 2)])
+
+
+class BenchmarkTests(unittest.TestCase):
+    """Properties of the algorithms that guard against performance
+    regressions without depending on timings or allocator details. The
+    timings themselves are measured by :mod:`flatdict.bench`.
+
+    """
+
+    @staticmethod
+    def _deep_document(depth: int, width: int) -> dict:
+        document: dict = {f'leaf{i}': i for i in range(width)}
+        for level in range(depth):
+            document = {f'level{level}': document, f'value{level}': level}
+        return document
+
+    @classmethod
+    def _count_values(cls, document: dict) -> int:
+        return sum(
+            1 + (cls._count_values(v) if isinstance(v, dict) else 0)
+            for v in document.values()
+        )
+
+    def test_items_single_pass_on_deep_document(self):
+        document = self._deep_document(64, 256)
+        value = flatdict.FlatDict(document)
+        with (
+            unittest.mock.patch.object(
+                flatdict.FlatDict,
+                '_branch',
+                autospec=True,
+                side_effect=flatdict.FlatDict._branch,
+            ) as branch,
+            unittest.mock.patch.object(
+                flatdict.FlatDict,
+                '__getitem__',
+                autospec=True,
+                side_effect=flatdict.FlatDict.__getitem__,
+            ) as getitem,
+        ):
+            items = list(value.items())
+        self.assertEqual(branch.call_count, self._count_values(document))
+        getitem.assert_not_called()
+        self.assertListEqual(items, [(k, value[k]) for k in list(value)])
+
+    def test_nodes_have_no_instance_dict(self):
+        for cls in (
+            flatdict.FlatDict,
+            flatdict.FlatterDict,
+            flatdict.ConcurrentFlatDict,
+        ):
+            with self.subTest(cls=cls.__name__):
+                value = cls({'k': {'v': {'w': 1}}, 'l': [1]})
+                for node in (value, value['k'], value['k:v']):
+                    self.assertFalse(hasattr(node, '__dict__'))
+
+
+class BenchModuleTests(unittest.TestCase):
+    def test_run_covers_shapes_and_operations(self):
+        results = bench.run(sizes=[10], repeat=1, number=1)
+        self.assertSetEqual(
+            {(r['shape'], r['class']) for r in results},
+            {
+                ('wide', 'FlatDict'),
+                ('deep', 'FlatDict'),
+                ('lists', 'FlatterDict'),
+            },
+        )
+        self.assertEqual(
+            len(results), 3 * len(bench.operations(flatdict.FlatDict, {}))
+        )
+        self.assertTrue(all(r['seconds'] >= 0 for r in results))
+
+    def test_run_threaded(self):
+        results = bench.run(
+            ['wide'], [100], 1, 10, selected={'threaded'}, threads=[1, 2]
+        )
+        self.assertListEqual(
+            [(r['class'], r['threads'], r['operations']) for r in results],
+            [('ConcurrentFlatDict', 1, 10), ('ConcurrentFlatDict', 2, 20)],
+        )
+        self.assertTrue(all(r['seconds'] > 0 for r in results))
+
+    def test_main_writes_output_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/results.json'
+        bench.main(
+            [
+                *('--shape', 'wide', '--size', '10', '--output', path),
+                *('--operation', 'len', '--repeat', '1', '--number', '1'),
+            ]
+        )
+        with open(path, encoding='utf-8') as handle:
+            document = json.load(handle)
+        self.assertListEqual(
+            [r['operation'] for r in document['results']], ['len']
+        )
+
+    def test_main_emits_json(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            bench.main(
+                [
+                    *('--shape', 'deep', '--size', '32'),
+                    *('--operation', 'len', '--repeat', '1', '--number', '1'),
+                ]
+            )
+        document = json.loads(output.getvalue())
+        self.assertEqual(
+            document['environment']['python'], platform.python_version()
+        )
+        self.assertListEqual(
+            [
+                (r['shape'], r['size'], r['operation'])
+                for r in document['results']
+            ],
+            [('deep', 32, 'len')],
+        )